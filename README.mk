@@ -4,12 +4,21 @@ Beijing https://www.microsoft.com/en-us/research/publication/t-drive-trajectory-
 Porto https://www.kaggle.com/c/pkdd-15-predict-taxi-service-trajectory-i/data
 # indexing
 The indexing includes the R-tree for pre-checjing.
+indexing/incremental_scan.py maintains the SCAN communities of a pair graph under edge insertions and deletions, updating only the similarities, cores and communities around the changed edges. Run python main.py -experiments vary_churn to stream the LCS_SCAN pairs through a sliding time window and compare its update time with re-clustering every batch.
 # baselines
 The baseline includes the ES-ECMC for single threading, and ES-ECMC-multi for multiple-threading setting.
 In addition, our method LCS_SCAN is included.
+sharded.py runs the pair computation of ES-ECMC or LCS_SCAN in time shards (time_span of set_region_args) with parallel workers; each worker reads only the trajectories in the time window of its shard from the h5 file, joins them and verifies the pairs its shard owns, and the parent merges only the valid pair lists, which give the same groups as the unsharded run.
+tiled.py is a map/reduce driver over spatial tiles of the city range: candidate generation and pair verification run per tile as independent tasks that exchange only files in a work directory, executed by a pluggable runner (LocalRunner uses a local process pool), and the reduce steps merge them into global groups.
+ES_ECMC_stream.py is a streaming ES-ECMC: trajectories arrive in start-time order and the groups inside a sliding time window are maintained incrementally, with form/grow/break events. Run python main.py -experiments vary_windows to compare the streamed groups of several windows with the batch ES-ECMC.
 # utils
 Trjaectory is the base util for data store and processing.
 # loader
 Data_loader is used to load trajectory data from files.
+# benchmark
+benchmark.py times every stage (load, tokenize, index, candidates, LCS verification, ECMC grouping, SCAN clustering) on a seeded synthetic dataset from preprocess/synthetic.py with planted groups, and writes the results as JSON.
+Run python benchmark.py --nums 2000 4000 --out bench.json; without --h5 it generates the synthetic file itself.
+python -m preprocess.synthetic --out /data/Like/beijing_synthetic.h5 --num 10000 writes a synthetic file with planted groups (the "groups" dataset); python main.py -data /data/Like/beijing_synthetic.h5 -experiments vary_planted scores ES-ECMC and LCS_SCAN against the planted groups, and any other experiment also runs on the file given by -data.
 
-For usage, open the settings.py for parameter settings and run mainpy for implementation.
\ No newline at end of file
+For usage, open the settings.py for parameter settings and run mainpy for implementation.
+main.py runs the Evaluator experiments named by -experiments in order (default: vary_min_life_times vary_min_group_trj_nums vary_eps vary_nums), e.g. python main.py -experiments vary_shards vary_tiles vary_windows.
\ No newline at end of file
@@ -1,5 +1,10 @@
 import numpy as np
 from tqdm import tqdm
+from utils.pair_cache import PairCache
+from indexing.clique import max_clique
+from utils.pair_scores import PairScores, mirror_upper
+from utils.trajectory import batch_LCS, time_pruned
+from utils.profiler import NULL_PROFILER, get_profiler
 
 
 class ECMC:
@@ -9,78 +14,184 @@ class ECMC:
         self.min_lifetime = min_lifetime
         self.dist_error = dist_error
         self.time_error = time_error
+        # get_groups(profile=True) 期间为 Profiler, 其余时间为空操作
+        self.profiler = NULL_PROFILER
 
-    def get_pairs(self, trjs):
+    def get_pairs(self, trjs, scores=None):
         """
         得到每条轨迹可以和哪些轨迹形成有效的轨迹对
         :param seqs: a batch of trajectories token sequences
+        :param scores: get_scores 得到的 PairScores, 给出时直接按当前阈值回放, 不再计算 LCS
         :return: all of the co-movement pairs [[i,j, common_points]]
         """
+        if scores is not None:
+            return self.replay_pairs(trjs, scores)
         # t1 = time.time()
         all_pairs = []
+        pair_cache = PairCache(len(trjs))
         for trj in tqdm(trjs, desc='get pairs'):
-            pairs = [trj]
-            count = 0
-            if trj.intersect_count < self.min_group_trj_nums:
-                continue
-            for ii, intersect in enumerate(trj.intersect_trjs):
-                if intersect == trj.id:
-                    continue
-                intersect_trj = trjs[intersect]
-                if intersect_trj.intersect_count < self.min_group_trj_nums:
-                    continue
-                # if intersect_trj in trj.candiate_match:
-                #     pairs.append(intersect_trj)
-                #     count += 1
-                #     continue
-                lcs = trj.LCS_to(intersect_trj, self.min_lifetime, self.dist_error, self.time_error)
-                if lcs >= self.min_lifetime:
-                    pairs.append(intersect_trj)
-                    count += 1
-                if count + trj.intersect_count - ii < self.min_group_trj_nums:
-                    break
-            if count >= self.min_group_trj_nums:
+            pairs = self.match(trj, trjs, pair_cache)
+            if pairs is not None:
                 trj.candiate_match = pairs
                 all_pairs.append(pairs)
-        print("There are totally {} valid candidate groups".format(len(all_pairs)))
+        # 记录性能时计数放入 report, 不打印
+        self.profiler.count("candidate_groups", len(all_pairs))
+        if not self.profiler.enabled:
+            print("There are totally {} valid candidate groups".format(len(all_pairs)))
         return all_pairs
 
-    def get_groups(self, trjs):
+    def get_scores(self, trjs, batch_size=2048):
+        """
+        计算两端 intersect_count 都不小于 min_group_trj_nums 的全部候选轨迹对的完整 LCS 长度 (不做时间预判),
+        每个无序对只计算一次; 之后任意 min_lifetime 与不小于当前值的 min_group_trj_nums 都可由 get_pairs 回放
+        :param trjs: TrajectoryStore
+        :return: PairScores
+        """
+        indptr, indices = trjs.intersections()
+        src = np.repeat(np.arange(len(trjs)), np.diff(indptr))
+        active = trjs.intersect_count >= self.min_group_trj_nums
+        upper = np.flatnonzero((src < indices) & active[src] & active[indices])
+        lcs = np.zeros(len(indices), dtype=np.int64)
+        for start in tqdm(range(0, len(upper), batch_size), desc='get scores'):
+            batch = upper[start:start + batch_size]
+            lcs[batch] = batch_LCS([trjs[a] for a in src[batch]], [trjs[b] for b in indices[batch]], 1,
+                                   self.dist_error, self.time_error, time_prune=False)
+        lower = np.flatnonzero((src > indices) & active[src] & active[indices])
+        mirror_upper(src, indices, lcs, upper, lower, len(trjs))
+        return PairScores(indptr, indices, lcs, self.min_group_trj_nums, trjs.intersect_key)
+
+    def replay_pairs(self, trjs, scores):
+        """
+        由 PairScores 按当前 min_lifetime / min_group_trj_nums 得到与 get_pairs 相同的结果:
+        LCS 与时间预判按当前 min_lifetime 判定, 提前终止只在最终有效轨迹对不足时发生, 不影响结果
+        """
+        scores.check(trjs, self.min_group_trj_nums)
+        starts = trjs.offsets[:-1]
+        tails = trjs.offsets[:-1] + np.maximum(trjs.sizes - self.min_lifetime, 0)
+        src, dst = scores.src, scores.indices
+        pruned = time_pruned(trjs.time[starts[src]], trjs.time[tails[src]], trjs.time[starts[dst]], trjs.time[tails[dst]])
+        self.profiler.count("pairs_replayed", len(scores.indices))
+        return self.collect_pairs(trjs, scores, ~pruned & (scores.values >= self.min_lifetime))
+
+    def collect_pairs(self, trjs, scores, passed):
+        """
+        由已判定的轨迹对按原有的逐条轨迹规则得到 get_pairs 的结果
+        :param scores: PairScores, 只用到其相交序列
+        :param passed: 与 scores.indices 对齐的 bool, 该轨迹对是否为有效轨迹对
+        """
+        src, dst = scores.replay(trjs.intersect_count >= self.min_group_trj_nums, passed, self.min_group_trj_nums)
+        return self.build_pairs(trjs, src, dst)
+
+    def build_pairs(self, trjs, src, dst):
+        """
+        由保留的有向轨迹对得到 get_pairs 的结果, 并记录每条原点轨迹的 candiate_match
+        :param src, dst: 按原点轨迹 id 和相交序列的顺序排列, 见 PairScores.replay
+        """
+        self.profiler.count("valid_pairs", len(dst))
+        trjs.set_matches(src, dst)
+        all_pairs = []
+        origins, first = np.unique(src, return_index=True)
+        for trj_id, members in zip(origins.tolist(), np.split(dst, first[1:])):
+            all_pairs.append([trjs[trj_id]] + [trjs[member] for member in members.tolist()])
+        self.profiler.count("candidate_groups", len(all_pairs))
+        if not self.profiler.enabled:
+            print("There are totally {} valid candidate groups".format(len(all_pairs)))
+        return all_pairs
+
+    def match(self, trj, trjs, pair_cache):
+        """
+        以 trj 为扩张原点, 找出可以和它形成有效轨迹对的轨迹
+        :param pair_cache: PairCache, 已验证过的无序轨迹对的判定结果
+        :return: [trj, trj1, trj2, ...], 有效轨迹对不足 min_group_trj_nums 时返回 None
+        """
+        pairs = [trj]
+        count = 0
+        profiler = self.profiler
+        if trj.intersect_count < self.min_group_trj_nums:
+            profiler.count("origins_pruned")
+            return None
+        # 一次性批量验证尚未验证过的候选轨迹 (每个无序对只验证一次), 再按原顺序回放提前终止逻辑
+        intersect_trjs = np.asarray(trj.intersect_trjs).tolist()
+        kept = [intersect for intersect in intersect_trjs if intersect != trj.id
+                and trjs[intersect].intersect_count >= self.min_group_trj_nums]
+        candidates = pair_cache.missing(trj.id, kept)
+        stats = {} if profiler.enabled else None
+        reach_list = trj.LCS_to_batch([trjs[candidate] for candidate in candidates], self.min_lifetime,
+                                      self.dist_error, self.time_error, decide=True, stats=stats)
+        pair_cache.update(trj.id, candidates, reach_list)
+        if profiler.enabled:
+            profiler.count("index_candidates", trj.intersect_count - 1)
+            profiler.count("candidates_pruned", trj.intersect_count - 1 - len(kept))
+            profiler.count("pairs_verified", len(candidates))
+            profiler.count("pairs_cached", len(kept) - len(candidates))
+            profiler.merge(stats)
+        for ii, intersect in enumerate(intersect_trjs):
+            if intersect == trj.id:
+                continue
+            intersect_trj = trjs[intersect]
+            if intersect_trj.intersect_count < self.min_group_trj_nums:
+                continue
+            # if intersect_trj in trj.candiate_match:
+            #     pairs.append(intersect_trj)
+            #     count += 1
+            #     continue
+            if pair_cache.get(trj.id, intersect):
+                pairs.append(intersect_trj)
+                count += 1
+            if count + trj.intersect_count - ii < self.min_group_trj_nums:
+                profiler.count("early_breaks")
+                break
+        if count >= self.min_group_trj_nums:
+            profiler.count("valid_pairs", count)
+            return pairs
+        return None
+
+    def get_groups(self, trjs, scores=None, profile=False):
         """
         get this batch trajectories' companion pairs, companion groups, companion trj2group
         :param seqs:
-        :return:
+        :param scores: PairScores, 见 get_pairs
+        :param profile: 记录各阶段耗时与计数, 作为第四个返回值
+        :return: all_pairs, all_groups, trj_map_group (, report)
+        """
+        self.profiler = profiler = get_profiler(profile)
+        try:
+            with profiler.stage("ecmc.get_pairs"):
+                all_pairs = self.get_pairs(trjs, scores)
+            with profiler.stage("ecmc.group"):
+                all_groups, trj_map_group = self.group(trjs, all_pairs)
+            profiler.count("groups", len(all_groups))
+            profiler.count("grouped_trajectories", sum(len(group) for group in all_groups))
+        finally:
+            self.profiler = NULL_PROFILER
+        if profile:
+            return all_pairs, all_groups, trj_map_group, profiler.report()
+        return all_pairs, all_groups, trj_map_group
+
+    def group(self, trjs, all_pairs):
+        """
+        由每条轨迹的有效轨迹对依次扩张出轨迹群组: 按 all_pairs 的顺序, 在原点轨迹尚未归组的有效轨迹对中求最大团,
+        成员数不少于 min_group_trj_nums 时记为一个群组并标记其成员已归组
+        :return: all_groups, trj_map_group
         """
-        all_pairs = self.get_pairs(trjs)
         all_groups = []
+        # 以 id 集合保存轨迹对关系, 成员判断为 O(1); 任一方的 candiate_match 包含另一方即视为相邻
+        adjacency = {}
+        for pairs in all_pairs:
+            ids = {trj.id for trj in pairs[1:]}
+            adjacency.setdefault(pairs[0].id, set()).update(ids)
+            for trj_id in ids:
+                adjacency.setdefault(trj_id, set()).add(pairs[0].id)
         # 记录已经归组的轨迹
         grouped_id = [-1]*len(trjs)
         for pairs in all_pairs:
             # pairs [trj, trj1,trj2,...]
-            valid_range = max(len(pairs) - self.min_group_trj_nums, 1)
-            # 记录最大长度，用于选取最合适的聚类组合
-            max_len = 0
-            best_group = []
-            for ii in range(1, valid_range):
-                if grouped_id[pairs[0].id] == 1:
-                    break
-                if grouped_id[pairs[ii].id] == 1:
-                    continue
-                group = [pairs[0], pairs[ii]]
-                for jj in range(ii + 1, len(pairs)):
-                    check_trj = pairs[jj]
-                    if grouped_id[check_trj.id] == 1:
-                        continue
-                    flag = True
-                    for trj in group:
-                        if check_trj not in trj.candiate_match:
-                            flag = False
-                            break
-                    if flag: group.append(check_trj)
-                size = len(group)
-                if size >= max_len:
-                    max_len = size
-                    best_group = group
+            if grouped_id[pairs[0].id] == 1:
+                continue
+            # 在原点轨迹尚未归组的邻居中求最大团, 加上原点轨迹即为以其为原点的最大群组
+            members = [trj for trj in pairs[1:] if grouped_id[trj.id] != 1]
+            clique = set(max_clique([trj.id for trj in members], adjacency))
+            best_group = [pairs[0]] + [trj for trj in members if trj.id in clique]
             # 只记录成员数最多的聚类组合, 并标记该组合内成员已经标记
             if len(best_group) >= self.min_group_trj_nums:
                 all_groups.append(best_group)
@@ -99,6 +210,6 @@ class ECMC:
         # print("\n")
         # for group in all_groups:
         #     print([trj.id for trj in group])
-        return all_pairs, all_groups, trj_map_group
+        return all_groups, trj_map_group
 
 
@@ -1,113 +1,80 @@
 import numpy as np
 import multiprocessing
+from multiprocessing import shared_memory
 import time
 import settings
+from baselines.ES_ECMC import ECMC as SingleECMC
+from utils.pair_scores import PairScores, mirror_upper
+from utils.trajectory import TrajectoryStore, batch_LCS
 
 
-class ECMC:
+# 工作进程内的全局状态, 由 _init_worker 在进程启动时设置一次
+_worker = {}
 
-    def __init__(self, min_group_trj_nums, min_lifetime, dist_error, time_error):
-        self.min_group_trj_nums = min_group_trj_nums
-        self.min_lifetime = min_lifetime
-        self.dist_error = dist_error
-        self.time_error = time_error
 
-    def get_pairs(self, trjs, start, end, i, ):
+class ECMC(SingleECMC):
+    """
+    多进程 ES-ECMC: 轨迹数组放入共享内存, 工作进程直接挂接而不复制;
+    以两端 intersect_count 都不小于 min_group_trj_nums 的无序轨迹对 (相交序列 CSR 中 src < dst 的位置) 为任务单位,
+    按两条轨迹长度之积切成代价相近的小块由进程池动态调度, 每个无序对只验证一次;
+    判定结果对称填充后在主进程按原有的逐条轨迹规则回放 (collect_pairs), 结果与单进程 ES_ECMC 一致
+    """
+
+    def get_pairs(self, trjs, scores=None, chunks_per_process=16, batch_size=2048):
         """
         得到每条轨迹可以和哪些轨迹形成有效的轨迹对
-        :param seqs: a batch of trajectories token sequences
-        :return: all of the co-movement pairs [[i,j, common_points]]
+        :param trjs: TrajectoryStore
+        :param scores: get_scores 得到的 PairScores, 给出时直接回放, 不启动进程池
+        :return: all of the co-movement pairs [[trj, trj1, trj2, ...]], 按原点轨迹 id 升序
         """
-        # t1 = time.time()
-        all_pairs = []
-        for trj in np.array(trjs)[start:end]:
-            pairs = [trj.id]
-            count = 0
-            if trj.intersect_count < self.min_group_trj_nums:
-                continue
-            for ii, intersect in enumerate(trj.intersect_trjs):
-                if intersect == trj.id:
-                    continue
-                intersect_trj = trjs[intersect]
-                if intersect_trj.intersect_count < self.min_group_trj_nums:
-                    continue
-                lcs = trj.LCS_to(intersect_trj, self.min_lifetime, self.dist_error, self.time_error)
-                if lcs >= self.min_lifetime:
-                    pairs.append(intersect_trj.id)
-                    count += 1
-                if count + trj.intersect_count - ii < self.min_group_trj_nums:
-                    break
-            if count >= self.min_group_trj_nums:
-                # trj.candiate_match = pairs_objects
-                all_pairs.append(pairs)
-        np.save("{}".format(i), np.array(all_pairs))
+        if scores is not None:
+            return self.replay_pairs(trjs, scores)
+        if not isinstance(trjs, TrajectoryStore):
+            trjs = TrajectoryStore.from_trajectories(trjs)
+        indptr, indices = trjs.intersections()
+        src = np.repeat(np.arange(len(trjs)), np.diff(indptr))
+        active = trjs.intersect_count >= self.min_group_trj_nums
+        both = active[src] & active[indices]
+        upper = np.flatnonzero((src < indices) & both)
+        reach = np.zeros(len(indices), dtype=bool)
+        arrays = {"lon_lat": trjs.lon_lat, "time": trjs.time, "offsets": trjs.offsets}
+        blocks = {name: shared_array(array) for name, array in arrays.items()}
+        try:
+            specs = {name: (block.name, array.shape, array.dtype.str)
+                     for (name, array), block in zip(arrays.items(), blocks.values())}
+            chunks = weighted_chunks(upper, trjs.sizes[src[upper]] * trjs.sizes[indices[upper]],
+                                     settings.process_num * chunks_per_process)
+            tasks = ((chunk, src[chunk], indices[chunk], batch_size) for chunk in chunks)
+            with multiprocessing.Pool(settings.process_num, initializer=_init_worker, initargs=(self, specs)) as pool:
+                for positions, chunk_reach, counters in pool.imap_unordered(_verify_chunk, tasks):
+                    reach[positions] = chunk_reach
+                    self.profiler.merge(counters)
+        finally:
+            for block in blocks.values():
+                block.close()
+                block.unlink()
+        mirror_upper(src, indices, reach, upper, np.flatnonzero((src > indices) & both), len(trjs))
+        if self.profiler.enabled:
+            self.profiler.count("index_candidates", np.count_nonzero((src != indices) & active[src]))
+            self.profiler.count("candidates_pruned", np.count_nonzero((src != indices) & active[src] & ~both))
+            self.profiler.count("pairs_verified", len(upper))
+        scores = PairScores(indptr, indices, reach, self.min_group_trj_nums, trjs.intersect_key)
+        return self.collect_pairs(trjs, scores, reach)
 
-    def get_groups(self, trjs):
+    def get_groups(self, trjs, scores=None, profile=False):
         """
         get this batch trajectories' companion pairs, companion groups, companion trj2group
         :param seqs:
-        :return:
+        :param scores: PairScores, 见 get_pairs
+        :param profile: 记录各阶段耗时与计数 (含工作进程中的计数), 作为第四个返回值, 不再打印
+        :return: all_pairs, all_groups, labels (, report)
         """
+        if profile:
+            return SingleECMC.get_groups(self, trjs, scores, profile)
         t1 = time.time()
-        pools = []
-        for ii in range(settings.process_num):
-            start = ii*len(trjs)//settings.process_num
-            end = (ii+1)*len(trjs)//settings.process_num
-            pools.append(multiprocessing.Process(target = self.get_pairs, args = (trjs, start, end, ii, )))
-        for p in pools:
-            p.start()
-        for p in pools:
-            p.join()
+        all_pairs = self.get_pairs(trjs, scores)
         print(time.time()-t1)
-        # 读出所有轨迹对
-        all_pairs = []
-        for ii in range(settings.process_num):
-            pairs = np.load("%d.npy"%ii, allow_pickle=True)
-            for pair in pairs:
-                all_pairs.append([trjs[item] for item in pair])
-                trjs[pair[0]].candiate_match = [trjs[item] for item in pair]
-        print("There are totally {} valid candidate groups".format(len(all_pairs)))
-        all_groups = []
-        # 记录已经归组的轨迹
-        grouped_id = [-1]*len(trjs)
-        for pairs in all_pairs:
-            # pairs [trj, trj1,trj2,...]
-            valid_range = max(len(pairs) - self.min_group_trj_nums, 1)
-            # 记录最大长度，用于选取最合适的聚类组合
-            max_len = 0
-            best_group = []
-            for ii in range(1, valid_range):
-                if grouped_id[pairs[0].id] == 1:
-                    break
-                if grouped_id[pairs[ii].id] == 1:
-                    continue
-                group = [pairs[0], pairs[ii]]
-                for jj in range(ii + 1, len(pairs)):
-                    check_trj = pairs[jj]
-                    if grouped_id[check_trj.id] == 1:
-                        continue
-                    flag = True
-                    for trj in group:
-                        if check_trj not in trj.candiate_match:
-                            flag = False
-                            break
-                    if flag: group.append(check_trj)
-                size = len(group)
-                if size >= max_len:
-                    max_len = size
-                    best_group = group
-            # 只记录成员数最多的聚类组合, 并标记该组合内成员已经标记
-            if len(best_group) >= self.min_group_trj_nums:
-                all_groups.append(best_group)
-                for trj in best_group:
-                    grouped_id[trj.id] = 1
-
-        labels = [-1] * len(trjs)
-        for ii, group in enumerate(all_groups):
-            for trj in group:
-                trj.cluster_id = ii
-                labels[trj.id] = ii
-
+        all_groups, labels = self.group(trjs, all_pairs)
         print('Number of trajectory not in the group：{} group number：{}'.format(sum(np.array(labels) == -1),len(all_groups)))
         # for pairs in all_pairs:
         #     print([trj.id for trj in pairs])
@@ -117,3 +84,43 @@ class ECMC:
         return all_pairs, all_groups, labels
 
 
+def shared_array(array):
+    """将数组复制到一块新的共享内存中"""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block
+
+
+def weighted_chunks(positions, cost, num_chunks):
+    """
+    按代价 (两条轨迹的长度之积) 将轨迹对位置切成约 num_chunks 个代价相近的连续小块
+    """
+    total = cost.sum()
+    target = max(total / max(num_chunks, 1), 1.0)
+    # 按位置顺序累加, 每累计约 target 的代价切一块
+    bounds = np.searchsorted(np.cumsum(cost), np.arange(target, total, target))
+    return [chunk for chunk in np.split(positions, np.unique(bounds + 1)) if len(chunk)]
+
+
+def _init_worker(ecmc, specs):
+    blocks = {name: shared_memory.SharedMemory(name=spec[0]) for name, spec in specs.items()}
+    arrays = {name: np.ndarray(spec[1], dtype=np.dtype(spec[2]), buffer=blocks[name].buf)
+              for name, spec in specs.items()}
+    store = TrajectoryStore(arrays["lon_lat"], arrays["time"], arrays["offsets"])
+    _worker.update(ecmc=ecmc, store=store, blocks=blocks)
+
+
+def _verify_chunk(task):
+    """
+    :param task: (positions, src, dst, batch_size), 一块轨迹对的 CSR 位置及两端轨迹 id
+    :return: positions, 每个轨迹对的判定结果, 工作进程中的计数 (不记录性能时为空)
+    """
+    positions, src, dst, batch_size = task
+    ecmc, store = _worker["ecmc"], _worker["store"]
+    stats = {} if ecmc.profiler.enabled else None
+    reach = np.zeros(len(positions), dtype=bool)
+    for start in range(0, len(positions), batch_size):
+        batch = slice(start, start + batch_size)
+        reach[batch] = batch_LCS([store[a] for a in src[batch].tolist()], [store[b] for b in dst[batch].tolist()],
+                                 ecmc.min_lifetime, ecmc.dist_error, ecmc.time_error, decide=True, stats=stats)
+    return positions, reach, stats or {}
@@ -0,0 +1,117 @@
+import heapq
+import numpy as np
+from rtree import index
+from indexing.myRtree import rtree_property
+from indexing.clique import max_clique
+
+
+class ECMC:
+    """
+    流式 ES-ECMC: 轨迹按起始时间依次到达, 增量维护窗口内的 R-tree 与有效轨迹对, 并在群组形成、扩大或解散时给出事件
+    1. 到达: 删除结束时间早于 (当前时间 - window) 的轨迹, 在 R-tree 中查询与新轨迹 MBR 相交的窗口内轨迹,
+       只对这些候选批量验证 LCS, 得到新轨迹的有效轨迹对
+    2. 若存在成员都与新轨迹形成有效轨迹对的群组, 新轨迹加入其中最大的一个 (grow);
+       否则在新轨迹尚未归组的有效轨迹对中求最大团, 加上新轨迹后成员数不少于 min_group_trj_nums 即形成新群组 (form)
+    3. 过期轨迹从所在群组中移除, 群组成员数不足 min_group_trj_nums 时解散 (break)
+    每次到达的开销只与新轨迹的候选轨迹及其相邻群组有关, 与窗口内的轨迹总数无关
+    事件为 (kind, group_id, members), kind 为 "form" / "grow" / "break", members 为当时的成员 id 列表
+    """
+
+    def __init__(self, min_group_trj_nums, min_lifetime, dist_error, time_error, window):
+        self.min_group_trj_nums = min_group_trj_nums
+        self.min_lifetime = min_lifetime
+        self.dist_error = dist_error
+        self.time_error = time_error
+        # 轨迹在结束时间之后还保留 window 秒
+        self.window = window
+        self.idx = index.Index(properties=rtree_property(), interleaved=False)
+        self.trjs = {}
+        # 窗口内的有效轨迹对, id -> 相邻轨迹 id 的集合
+        self.adjacency = {}
+        # (结束时间, id) 的最小堆, 按结束时间过期
+        self.expiry = []
+        self.groups = {}
+        self.trj_map_group = {}
+        self.next_group_id = 0
+        self.now = -np.inf
+
+    def __len__(self):
+        return len(self.trjs)
+
+    def add(self, trj):
+        """
+        加入一条新到达的轨迹, 起始时间不得早于之前到达的轨迹
+        :param trj: Trajectory 或 TrajectoryView, id 在流中唯一
+        :return: 本次到达产生的事件列表
+        """
+        start = trj.time_range[0]
+        if start < self.now:
+            raise ValueError("trajectory %d arrives out of time order" % trj.id)
+        self.now = start
+        events = self.expire(start)
+        candidates = [self.trjs[i] for i in self.idx.intersection(tuple(trj.mbr))]
+        reach_list = trj.LCS_to_batch(candidates, self.min_lifetime, self.dist_error, self.time_error, decide=True)
+        neighbors = {candidate.id for candidate, reach in zip(candidates, reach_list) if reach}
+        self.trjs[trj.id] = trj
+        self.idx.insert(trj.id, tuple(trj.mbr))
+        heapq.heappush(self.expiry, (trj.time_range[1], trj.id))
+        self.adjacency[trj.id] = neighbors
+        for neighbor in neighbors:
+            self.adjacency[neighbor].add(trj.id)
+        events.extend(self.assign(trj.id))
+        return events
+
+    def assign(self, trj_id):
+        """为新轨迹加入已有群组或以其为原点形成新群组"""
+        neighbors = self.adjacency[trj_id]
+        joinable = [group_id for group_id in {self.trj_map_group[i] for i in neighbors if i in self.trj_map_group}
+                    if self.groups[group_id] <= neighbors]
+        if joinable:
+            group_id = max(joinable, key=lambda k: (len(self.groups[k]), -k))
+            self.groups[group_id].add(trj_id)
+            self.trj_map_group[trj_id] = group_id
+            return [("grow", group_id, sorted(self.groups[group_id]))]
+        ungrouped = sorted(i for i in neighbors if i not in self.trj_map_group)
+        clique = max_clique(ungrouped, self.adjacency)
+        if len(clique) + 1 < self.min_group_trj_nums:
+            return []
+        group_id = self.next_group_id
+        self.next_group_id += 1
+        self.groups[group_id] = set(clique) | {trj_id}
+        for member in self.groups[group_id]:
+            self.trj_map_group[member] = group_id
+        return [("form", group_id, sorted(self.groups[group_id]))]
+
+    def expire(self, now):
+        """删除结束时间早于 now - window 的轨迹, 返回由此解散的群组事件"""
+        events = []
+        while self.expiry and self.expiry[0][0] < now - self.window:
+            end, trj_id = heapq.heappop(self.expiry)
+            trj = self.trjs.pop(trj_id)
+            self.idx.delete(trj_id, tuple(trj.mbr))
+            for neighbor in self.adjacency.pop(trj_id):
+                self.adjacency[neighbor].discard(trj_id)
+            group_id = self.trj_map_group.pop(trj_id, None)
+            if group_id is None:
+                continue
+            group = self.groups[group_id]
+            group.discard(trj_id)
+            if len(group) < self.min_group_trj_nums:
+                events.append(("break", group_id, sorted(group | {trj_id})))
+                for member in group:
+                    del self.trj_map_group[member]
+                del self.groups[group_id]
+        return events
+
+    def run(self, trjs):
+        """
+        按起始时间依次处理一批轨迹
+        :param trjs: TrajectoryStore 或轨迹列表
+        :return: generator of (trj_id, events), 每条轨迹到达后产生一次
+        """
+        for trj in sorted(trjs, key=lambda trj: (trj.time_range[0], trj.id)):
+            yield trj.id, self.add(trj)
+
+    def current_groups(self):
+        """当前窗口内的全部群组, group_id -> 成员 id 列表"""
+        return {group_id: sorted(group) for group_id, group in self.groups.items()}
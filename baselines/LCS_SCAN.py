@@ -2,14 +2,20 @@ import time
 import numpy as np
 from tqdm import tqdm
 from indexing.scan import  get_communities
+from indexing import gs_index
 from funcy import merge
-from collections import Counter
+from indexing.token_index import token_overlaps
+from utils.trajectory import TrajectoryStore
+from utils.pair_scores import PairScores
+from utils.profiler import NULL_PROFILER, get_profiler
 
 class SCAN:
 
     def __init__(self, min_group_trj_nums, min_lifetime):
         self.min_group_trj_nums = min_group_trj_nums
         self.min_lifetime = min_lifetime
+        # get_groups(profile=True) 期间为 Profiler, 其余时间为空操作
+        self.profiler = NULL_PROFILER
 
     ''' 
         计算得到全部的group
@@ -18,54 +24,90 @@ class SCAN:
         2. 连线这些轨迹并进行SCAN聚类
     '''
 
-    def get_pairs(self, trjs):
+    def get_pairs(self, trjs, scores=None):
         """
         得到每条轨迹可以和哪些轨迹形成有效的轨迹对
+        全部候选轨迹对的 token 重合数由倒排索引一次性算出, 再按轨迹顺序回放原有的筛选规则
         :param seqs: a batch of trajectories token sequences
+        :param scores: get_scores 得到的 PairScores, 给出时直接按当前阈值回放
         :return: all of the co-movement pairs [[i,j, common_points]]
         """
-        # t1 = time.time()
-        all_pairs = []
-        for trj in tqdm(trjs):
-            pairs = []
-            count = 0
-            if trj.intersect_count < self.min_group_trj_nums or trj.size < self.min_lifetime:
-                continue
-            for ii, intersect in enumerate(trj.intersect_trjs):
-                if intersect == trj.id:
-                    continue
-                intersect_trj = trjs[intersect]
-                if intersect_trj.intersect_count < self.min_group_trj_nums or intersect_trj.size < self.min_lifetime:
-                    continue
-                # if trj.token_seq[0] >= intersect_trj.token_seq[-self.min_lifetime] or intersect_trj.token_seq[0] >= trj.token_seq[-self.min_lifetime]:
-                #     continue
-                # cvals = list(set(trj.token_seq).intersection(set(intersect_trj.token_seq)))
-                cvals = list((Counter(trj.token_seq) & Counter(intersect_trj.token_seq)).elements())
-                if len(cvals) >= self.min_lifetime:
-                    pairs.append([trj.id, intersect_trj.id])
-                    count += 1
-                if count + trj.intersect_count - ii < self.min_group_trj_nums:
-                    break
-            if count >= self.min_group_trj_nums:
-                trj.candiate_match = pairs
-                all_pairs.extend(pairs)
-        print("There are totally {} valid candidate groups".format(len(all_pairs)))
+        if not isinstance(trjs, TrajectoryStore):
+            trjs = TrajectoryStore.from_trajectories(trjs)
+        profiler = self.profiler
+        if scores is None:
+            with profiler.stage("scan.scores"):
+                scores = self.get_scores(trjs)
+        scores.check(trjs, self.min_group_trj_nums)
+        with profiler.stage("scan.replay"):
+            # intersect_count 或轨迹长度不足的轨迹既不作为原点, 也不作为被匹配的轨迹
+            active = (trjs.intersect_count >= self.min_group_trj_nums) & (trjs.sizes >= self.min_lifetime)
+            src, dst = scores.replay(active, scores.values >= self.min_lifetime, self.min_group_trj_nums)
+        if profiler.enabled:
+            profiler.count("index_candidates", len(scores.indices) - len(trjs))
+            profiler.count("origins_pruned", (~active).sum())
+            profiler.count("candidates_pruned", (active[scores.src] & ~active[scores.indices]).sum())
+            profiler.count("valid_pairs", len(dst))
+        all_pairs = np.column_stack([src, dst]).tolist()
+        trjs.set_matches(src, dst)
+        self.profiler.count("candidate_groups", len(all_pairs))
+        if not self.profiler.enabled:
+            print("There are totally {} valid candidate groups".format(len(all_pairs)))
         return all_pairs
 
-    def get_groups(self, trjs, ep):
-        # step 1
-        pairs = self.get_pairs(trjs)
-        # step 2
-        communities, hubs, outliers = get_communities(pairs, self.min_group_trj_nums, ep)
-        labels = [-1] * len(trjs)
-        for ii in range(len(communities)):
-            for trj_id in communities[ii]:
-                labels[trj_id] = ii
-        print(
-            '归组人数:{0}\t组数：{1}'.format(sum(np.array(labels) != -1), len(communities)))
-        return pairs, communities, labels
-
+    def get_scores(self, trjs):
+        """
+        计算两端 intersect_count 都不小于 min_group_trj_nums 的全部候选轨迹对的 token 重合数,
+        之后任意 min_lifetime 与不小于当前值的 min_group_trj_nums 都可由 get_pairs 回放
+        :param trjs: TrajectoryStore
+        :return: PairScores
+        """
+        indptr, indices = trjs.intersections()
+        active = trjs.intersect_count >= self.min_group_trj_nums
+        overlaps = token_overlaps(trjs.token, trjs.offsets, indptr, indices, active)
+        return PairScores(indptr, indices, overlaps, self.min_group_trj_nums, trjs.intersect_key)
 
+    def get_groups(self, trjs, ep, scores=None, profile=False):
+        """
+        :param profile: 记录各阶段耗时与计数, 作为第四个返回值
+        :return: pairs, communities, labels (, report)
+        """
+        self.profiler = profiler = get_profiler(profile)
+        try:
+            # step 1
+            pairs = self.get_pairs(trjs, scores)
+            # step 2
+            communities, hubs, outliers = get_communities(pairs, self.min_group_trj_nums, ep, profiler)
+            labels = self.label(trjs, communities)
+        finally:
+            self.profiler = NULL_PROFILER
+        if profile:
+            return pairs, communities, labels, profiler.report()
+        return pairs, communities, labels
 
+    def get_index(self, trjs, pairs=None):
+        """
+        计算轨迹对并建立 GS*-Index, 同一轨迹对图上不同 ep 的聚类可由 get_groups_from_index 直接得到
+        :param pairs: 已有的轨迹对, 为 None 时调用 get_pairs
+        :return: pairs, index
+        """
+        if pairs is None:
+            pairs = self.get_pairs(trjs)
+        return pairs, gs_index.get_index(pairs)
 
+    def get_groups_from_index(self, trjs, pairs, index, ep):
+        """与 get_groups 的返回相同, 聚类由 get_index 建立的索引得到"""
+        communities, hubs, outliers = gs_index.get_communities(index, self.min_group_trj_nums, ep)
+        return pairs, communities, self.label(trjs, communities)
 
+    def label(self, trjs, communities):
+        labels = [-1] * len(trjs)
+        for ii in range(len(communities)):
+            for trj_id in communities[ii]:
+                labels[trj_id] = ii
+        grouped = sum(np.array(labels) != -1)
+        self.profiler.count("communities", len(communities))
+        self.profiler.count("grouped_trajectories", grouped)
+        if not self.profiler.enabled:
+            print('归组人数:{0}\t组数：{1}'.format(grouped, len(communities)))
+        return labels
@@ -0,0 +1,192 @@
+"""
+按时间分片执行 ES-ECMC / LCS_SCAN 的轨迹对计算, 结果与不分片时一致
+1. 主进程只读取每条轨迹的起止时间 (Loader.time_bounds), 按起始时间所在的时间段 (set_region_args 的 time_span)
+   将轨迹划入分片, 每 shard_buckets 个时间段为一片
+2. 与本片轨迹 MBR 相交的轨迹, 时间范围必定与本片的时间窗 [最早起始时间, 最晚结束时间] 相交;
+   每个工作进程只从文件中读取本片时间窗内的轨迹, 在窗内批量自连接得到本片轨迹完整的相交序列与 intersect_count,
+   因此每个工作进程的内存与时间窗大小成正比
+3. 无序轨迹对 (a, b), a < b 只由 a 所在的分片验证, 跨越分片边界的轨迹对不会重复计算;
+   工作进程只返回本片轨迹的 intersect_count 与通过验证的轨迹对
+4. 主进程按两端的 intersect_count 筛选并合并这些轨迹对, 按原有规则得到有效轨迹对与分组, 结果与不分片时相同;
+   主进程不持有轨迹点、全局相交序列与得分数组
+"""
+import os
+from collections import deque
+import numpy as np
+from multiprocessing import Pool
+from tqdm import tqdm
+from baselines.LCS_SCAN import SCAN
+from indexing.myRtree import bulk_rtree, self_join
+from indexing.scan import get_communities
+from indexing.token_index import token_overlaps
+from utils.trajectory import TrajectoryStore, batch_LCS
+
+
+def time_shards(starts, time_span, shard_buckets=1):
+    """
+    :param starts: (n,) 每条轨迹的起始时间
+    :return: 每个分片的轨迹 id 数组, 按时间先后排列
+    """
+    buckets = (starts // time_span).astype(np.int64) // shard_buckets
+    order = np.argsort(buckets, kind="stable")
+    _, first = np.unique(buckets[order], return_index=True)
+    return [np.sort(shard) for shard in np.split(order, first[1:]) if len(shard)]
+
+
+def time_window(bounds, shard):
+    """
+    :param bounds: (n, 2) 每条轨迹的 [起始时间, 结束时间]
+    :return: 时间范围与本片时间窗相交的轨迹 id, 升序, 包含本片的全部轨迹
+    """
+    lo, hi = bounds[shard, 0].min(), bounds[shard, 1].max()
+    return np.flatnonzero((bounds[:, 0] <= hi) & (bounds[:, 1] >= lo))
+
+
+def gather_points(trjs, members):
+    """
+    切出一组轨迹的点数组, 局部 id 为其在 members 中的位置
+    :return: lon_lat, time, token, offsets
+    """
+    starts, sizes = trjs.offsets[members], trjs.sizes[members]
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    points = np.repeat(starts - offsets[:-1], sizes) + np.arange(offsets[-1])
+    return trjs.lon_lat[points], trjs.time[points], trjs.token[points], offsets
+
+
+def score_params(model):
+    """计算轨迹对得分所需的参数, 可传给其他进程"""
+    return ("scan",) if isinstance(model, SCAN) else ("ecmc", model.dist_error, model.time_error)
+
+
+def score_pairs(lon_lat, time, token, offsets, src, dst, params, batch_size=2048):
+    """
+    计算局部轨迹对 (src[k], dst[k]) 的得分, 与 model.get_scores 中的对应值相同
+    :param src, dst: 局部 id, 按 (src, dst) 升序且 src < dst
+    :param params: score_params(model)
+    """
+    store = TrajectoryStore(lon_lat, time, offsets, token)
+    if params[0] == "scan":
+        # 轨迹对按 (src, dst) 升序排列, 即 CSR 形式
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(src, minlength=len(store)))])
+        return token_overlaps(store.token, store.offsets, indptr, dst)
+    _, dist_error, time_error = params
+    values = np.zeros(len(src), dtype=np.int64)
+    for start in range(0, len(src), batch_size):
+        batch = slice(start, start + batch_size)
+        values[batch] = batch_LCS([store[a] for a in src[batch].tolist()], [store[b] for b in dst[batch].tolist()],
+                                  1, dist_error, time_error, time_prune=False)
+    return values
+
+
+def verify_pairs(store, src, dst, params, min_lifetime, batch_size=2048):
+    """
+    按 model.get_pairs 的规则判定局部轨迹对 (src[k], dst[k]) 是否为有效轨迹对, 两端 intersect_count 的条件除外
+    ECMC: 时间预判与 LCS 长度, 只需判定是否达到 min_lifetime; SCAN: token 重合数与两端的轨迹长度
+    :param src, dst: 局部 id, 按 (src, dst) 升序
+    :param params: score_params(model)
+    :return: (len(src),) bool
+    """
+    if params[0] == "scan":
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(src, minlength=len(store)))])
+        overlaps = token_overlaps(store.token, store.offsets, indptr, dst)
+        return (overlaps >= min_lifetime) & (store.sizes[src] >= min_lifetime) & (store.sizes[dst] >= min_lifetime)
+    _, dist_error, time_error = params
+    passed = np.zeros(len(src), dtype=bool)
+    for start in range(0, len(src), batch_size):
+        batch = slice(start, start + batch_size)
+        passed[batch] = batch_LCS([store[a] for a in src[batch].tolist()], [store[b] for b in dst[batch].tolist()],
+                                  min_lifetime, dist_error, time_error, decide=True)
+    return passed
+
+
+def shard_pairs(loader, shard, window, params, min_group_trj_nums, min_lifetime):
+    """
+    工作进程: 读取时间窗内的轨迹, 自连接得到本片轨迹的相交序列, 验证本片负责的轨迹对
+    :param loader: Loader, 轨迹从 loader.h5path 中按 id 读取
+    :return: 本片轨迹的 intersect_count, 以及通过验证的轨迹对 a, b (全局 id, a 在本片中且 a < b)
+    """
+    store = loader.load(len(window), ids=window, tokenize=params[0] == "scan")
+    local = np.searchsorted(window, shard)
+    indptr, indices = self_join(bulk_rtree(store.mbrs), store.mbrs[local])
+    counts = np.diff(indptr)
+    src = np.repeat(local, counts)
+    # 原点轨迹的 intersect_count 不足时不会用到, 另一端的 intersect_count 由主进程筛选
+    upper = (src < indices) & (np.repeat(counts, counts) >= min_group_trj_nums)
+    src, dst = src[upper], indices[upper]
+    passed = verify_pairs(store, src, dst, params, min_lifetime)
+    return counts, window[src[passed]], window[dst[passed]]
+
+
+def _shard_pairs(task):
+    return (task[1],) + shard_pairs(*task)
+
+
+def get_pairs(model, loader, num, time_span, shard_buckets=1, processes=None):
+    """
+    分片并行得到 model.get_pairs 保留的有向轨迹对, 候选为 R-tree 自连接的相交序列 (load_index 的默认候选)
+    :param model: ES_ECMC / ES_ECMC_multi 的 ECMC 或 LCS_SCAN 的 SCAN
+    :param loader: Loader, 读取其文件中的前 num 条轨迹
+    :param time_span: set_region_args(scale, time_size).time_span
+    :return: src, dst, 按原点轨迹 id 和相交序列的顺序排列 (与 PairScores.replay 相同); intersect_count
+    """
+    bounds = loader.time_bounds(num)
+    n = len(bounds)
+    params = score_params(model)
+    intersect_count = np.zeros(n, dtype=np.int64)
+    pair_a, pair_b = [], []
+    processes = processes or os.cpu_count()
+
+    def collect(result):
+        shard, counts, a, b = result
+        intersect_count[shard] = counts
+        pair_a.append(a)
+        pair_b.append(b)
+        bar.update()
+
+    with Pool(processes) as pool, tqdm(desc='shard pairs') as bar:
+        # 同时在途的分片不超过 2 * processes, 主进程中的时间窗 id 数组也随之有界
+        pending = deque()
+        for shard in time_shards(bounds[:, 0], time_span, shard_buckets):
+            task = (loader, shard, time_window(bounds, shard), params, model.min_group_trj_nums, model.min_lifetime)
+            pending.append(pool.apply_async(_shard_pairs, (task,)))
+            while len(pending) >= 2 * processes or (pending and pending[0].ready()):
+                collect(pending.popleft().get())
+        while pending:
+            collect(pending.popleft().get())
+    a = np.concatenate(pair_a) if pair_a else np.zeros(0, dtype=np.int64)
+    b = np.concatenate(pair_b) if pair_b else np.zeros(0, dtype=np.int64)
+    active = intersect_count >= model.min_group_trj_nums
+    keep = active[a] & active[b]
+    # 无序对展开为两个方向, 相交序列按 id 升序, 因此按 (src, dst) 排序即回放的顺序
+    codes = np.sort(np.concatenate([a[keep] * n + b[keep], b[keep] * n + a[keep]]))
+    src, dst = codes // n, codes % n
+    keep = np.bincount(src, minlength=n)[src] >= model.min_group_trj_nums
+    return src[keep], dst[keep], intersect_count
+
+
+def pair_store(n, src, dst):
+    """
+    只含轨迹 id 的 TrajectoryStore (每条轨迹一个占位点), 相交序列为保留的有向轨迹对, 用于在主进程中分组
+    """
+    store = TrajectoryStore(np.zeros((n, 2)), np.zeros(n), np.arange(n + 1))
+    store.set_intersections(np.concatenate([[0], np.cumsum(np.bincount(src, minlength=n))]), dst)
+    store.intersect_key = ("shards", n)
+    return store
+
+
+def get_groups(model, loader, num, time_span, *args, shard_buckets=1, processes=None):
+    """
+    分片计算有效轨迹对后按原有规则分组, 返回与 model.get_groups(trjs, *args) 相同的结果 (trjs 为 load_index 加载的前
+    num 条轨迹); 返回的轨迹对象只带有 id, 不含轨迹点
+    :param args: SCAN 为 ep
+    """
+    src, dst, intersect_count = get_pairs(model, loader, num, time_span, shard_buckets, processes)
+    trjs = pair_store(len(intersect_count), src, dst)
+    if isinstance(model, SCAN):
+        trjs.set_matches(src, dst)
+        pairs = np.column_stack([src, dst]).tolist()
+        communities, hubs, outliers = get_communities(pairs, model.min_group_trj_nums, *args)
+        return pairs, communities, model.label(trjs, communities)
+    all_pairs = model.build_pairs(trjs, src, dst)
+    all_groups, trj_map_group = model.group(trjs, all_pairs)
+    return all_pairs, all_groups, trj_map_group
@@ -0,0 +1,196 @@
+"""
+按空间分块的 map/reduce 驱动: 城市范围 (lons_range_* / lats_range_*) 切成 tiles[0] x tiles[1] 个块,
+每个块的候选生成与 LCS / token 验证都是独立任务, 任务之间只通过 work_dir 中的文件交换数据,
+任务由 runner.map(func, tasks) 执行: LocalRunner 为本机进程池, 集群上提供同样接口的 runner 即可替换
+1. partition: MBR 在经纬度方向各扩张 halo (默认 dist_error) 米的一半, 相距 dist_error 内的两条轨迹的 MBR 必定相交;
+   轨迹复制到其扩张后的 MBR 覆盖的每个块, 即每个块带有 dist_error 的 halo, 每块写一个 tile_k.npz
+2. map_candidates: 块内 MBR 批量自连接; 相交的两个 MBR 的交集左下角只落在一个块中, 只由该块输出这一轨迹对,
+   因此跨块的轨迹对在一个块内找到且不会重复, 合并后的候选与扩张后 MBR 的全局自连接相同
+3. reduce_candidates: 合并为每条轨迹的相交序列, 得到全局的 intersect_count
+4. map_scores: 每块只验证本块输出且两端 intersect_count 都不小于 min_group_trj_nums 的轨迹对
+5. reduce_scores: 合并为 PairScores, 分组按原有规则在全部轨迹上回放, 结果与不分块 (tiles=(1, 1)) 时相同
+"""
+import os
+import numpy as np
+from multiprocessing import Pool
+import settings
+from baselines.sharded import gather_points, score_params, score_pairs
+from indexing.dist import degree_errors
+from indexing.myRtree import bulk_rtree, self_join
+from utils.pair_scores import PairScores, mirror_upper
+
+
+class LocalRunner:
+    """以本机进程池代替集群执行任务, 任务与结果都是文件路径"""
+
+    def __init__(self, processes=None):
+        self.processes = processes
+
+    def map(self, func, tasks):
+        with Pool(self.processes) as pool:
+            return pool.map(func, tasks, chunksize=1)
+
+
+class SerialRunner:
+    """在当前进程中依次执行任务, 用于调试"""
+
+    def map(self, func, tasks):
+        return [func(task) for task in tasks]
+
+
+def locate(grid, lon, lat):
+    """
+    :param grid: [min_lon, min_lat, tile_width, tile_height, nx, ny]
+    :return: 所在块的列号与行号, 范围外的点归入边缘的块
+    """
+    min_lon, min_lat, width, height, nx, ny = grid
+    col = np.clip(np.floor((np.asarray(lon) - min_lon) / width), 0, nx - 1).astype(np.int64)
+    row = np.clip(np.floor((np.asarray(lat) - min_lat) / height), 0, ny - 1).astype(np.int64)
+    return col, row
+
+
+def map_candidates(tile_path):
+    """
+    :return: 本块输出的候选轨迹对文件, (P, 2) 全局 id, 每行 a < b
+    """
+    with np.load(tile_path) as tile:
+        ids, mbrs, grid, (col, row) = tile["ids"], tile["mbrs"], tile["grid"], tile["tile"]
+    indptr, indices = self_join(bulk_rtree(mbrs), mbrs)
+    src = np.repeat(np.arange(len(ids)), np.diff(indptr))
+    # ids 升序, 局部 id 的大小关系与全局 id 相同
+    upper = src < indices
+    a, b = src[upper], indices[upper]
+    ref_col, ref_row = locate(grid, np.maximum(mbrs[a, 0], mbrs[b, 0]), np.maximum(mbrs[a, 2], mbrs[b, 2]))
+    own = (ref_col == col) & (ref_row == row)
+    pairs_path = tile_path[:-len(".npz")] + "_pairs.npy"
+    np.save(pairs_path, np.column_stack([ids[a[own]], ids[b[own]]]))
+    return pairs_path
+
+
+def map_scores(task):
+    """
+    :param task: (tile_path, verify_path, params), verify_path 为需要验证的轨迹对 (P, 2) 全局 id
+    :return: 与轨迹对对齐的得分文件
+    """
+    tile_path, verify_path, params = task
+    with np.load(tile_path) as tile:
+        ids, lon_lat, time, token, offsets = tile["ids"], tile["lon_lat"], tile["time"], tile["token"], tile["offsets"]
+    pairs = np.load(verify_path)
+    values = score_pairs(lon_lat, time, token, offsets, np.searchsorted(ids, pairs[:, 0]),
+                         np.searchsorted(ids, pairs[:, 1]), params)
+    scores_path = verify_path[:-len("_verify.npy")] + "_scores.npy"
+    np.save(scores_path, values)
+    return scores_path
+
+
+class TileDriver:
+
+    def __init__(self, model, work_dir, tiles=(4, 4), halo=None, runner=None, city=settings.city):
+        """
+        :param model: ES_ECMC / ES_ECMC_multi 的 ECMC 或 LCS_SCAN 的 SCAN
+        :param work_dir: 任务之间交换的文件所在目录, 集群上应为共享目录
+        :param halo: 米, 候选 MBR 的扩张量, None 时取 model.dist_error (SCAN 取 settings.dist_error);
+                     设为 0 时不扩张, 候选与 R-tree 的 intersect_trjs 相同, 分组与 load_index 的默认候选一致
+        """
+        self.model = model
+        self.work_dir = work_dir
+        self.tiles = tiles
+        if halo is None:
+            halo = getattr(model, "dist_error", settings.dist_error)
+        self.halo = halo
+        self.runner = runner if runner is not None else LocalRunner(settings.process_num)
+        if city == "beijing":
+            self.lons_range, self.lats_range = settings.lons_range_bj, settings.lats_range_bj
+        else:
+            self.lons_range, self.lats_range = settings.lons_range_pt, settings.lats_range_pt
+        os.makedirs(work_dir, exist_ok=True)
+
+    @property
+    def grid(self):
+        nx, ny = self.tiles
+        return np.array([self.lons_range[0], self.lats_range[0], (self.lons_range[1] - self.lons_range[0]) / nx,
+                         (self.lats_range[1] - self.lats_range[0]) / ny, nx, ny])
+
+    def partition(self, trjs):
+        """
+        :return: 每个非空块的文件路径
+        """
+        mbrs = trjs.mbrs.copy()
+        if self.halo > 0:
+            lon_error, lat_error = degree_errors(self.halo, np.abs(trjs.lon_lat[:, 1]).max())
+            margin = np.array([lon_error, lat_error]) * (1 + 1e-6) / 2
+            mbrs[:, [0, 2]] -= margin
+            mbrs[:, [1, 3]] += margin
+        grid = self.grid
+        col_lo, row_lo = locate(grid, mbrs[:, 0], mbrs[:, 2])
+        col_hi, row_hi = locate(grid, mbrs[:, 1], mbrs[:, 3])
+        tile_paths = []
+        for row in range(self.tiles[1]):
+            for col in range(self.tiles[0]):
+                members = np.flatnonzero((col_lo <= col) & (col <= col_hi) & (row_lo <= row) & (row <= row_hi))
+                if len(members) == 0:
+                    continue
+                lon_lat, time, token, offsets = gather_points(trjs, members)
+                path = os.path.join(self.work_dir, "tile_%d_%d.npz" % (row, col))
+                np.savez(path, ids=members, lon_lat=lon_lat, time=time, token=token, offsets=offsets,
+                         mbrs=mbrs[members], grid=grid, tile=np.array([col, row]))
+                tile_paths.append(path)
+        return tile_paths
+
+    def reduce_candidates(self, trjs, pairs_paths):
+        """
+        合并各块的候选轨迹对, 设置为 trjs 的相交序列 (含自身, 按 id 升序)
+        :return: indptr, indices
+        """
+        n = len(trjs)
+        pairs = np.concatenate([np.load(path).reshape(-1, 2) for path in pairs_paths])
+        a, b = pairs[:, 0], pairs[:, 1]
+        codes = np.unique(np.concatenate([a * n + b, b * n + a, np.arange(n, dtype=np.int64) * (n + 1)]))
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(codes // n, minlength=n))]).astype(np.int64)
+        indices = codes % n
+        trjs.set_intersections(indptr, indices)
+        trjs.intersect_key = ("tiles",) + tuple(self.tiles) + (self.halo,)
+        return indptr, indices
+
+    def reduce_scores(self, trjs, indptr, indices, verify_paths, scores_paths):
+        n = len(trjs)
+        src = np.repeat(np.arange(n), np.diff(indptr))
+        codes = src * n + indices
+        values = np.zeros(len(indices), dtype=np.int64)
+        upper = []
+        for verify_path, scores_path in zip(verify_paths, scores_paths):
+            pairs = np.load(verify_path).reshape(-1, 2)
+            positions = np.searchsorted(codes, pairs[:, 0] * n + pairs[:, 1])
+            values[positions] = np.load(scores_path)
+            upper.append(positions)
+        upper = np.sort(np.concatenate(upper)) if upper else np.zeros(0, dtype=np.int64)
+        active = trjs.intersect_count >= self.model.min_group_trj_nums
+        lower = np.flatnonzero((src > indices) & active[src] & active[indices])
+        mirror_upper(src, indices, values, upper, lower, n)
+        return PairScores(indptr, indices, values, self.model.min_group_trj_nums, trjs.intersect_key)
+
+    def get_scores(self, trjs):
+        """
+        两轮 map/reduce 得到候选轨迹对及其得分, 同时将 trjs 的相交序列设置为分块得到的候选
+        :return: PairScores
+        """
+        tile_paths = self.partition(trjs)
+        pairs_paths = self.runner.map(map_candidates, tile_paths)
+        indptr, indices = self.reduce_candidates(trjs, pairs_paths)
+        active = trjs.intersect_count >= self.model.min_group_trj_nums
+        tasks = []
+        for tile_path, pairs_path in zip(tile_paths, pairs_paths):
+            pairs = np.load(pairs_path).reshape(-1, 2)
+            verify_path = pairs_path[:-len("_pairs.npy")] + "_verify.npy"
+            np.save(verify_path, pairs[active[pairs[:, 0]] & active[pairs[:, 1]]])
+            tasks.append((tile_path, verify_path, score_params(self.model)))
+        scores_paths = self.runner.map(map_scores, tasks)
+        return self.reduce_scores(trjs, indptr, indices, [task[1] for task in tasks], scores_paths)
+
+    def get_groups(self, trjs, *args, **kwargs):
+        """
+        与 model.get_groups(trjs, *args) 的返回相同, 候选与得分由分块任务得到
+        :param args: SCAN 为 ep
+        """
+        scores = self.get_scores(trjs)
+        return self.model.get_groups(trjs, *args, scores=scores, **kwargs)
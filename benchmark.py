@@ -0,0 +1,144 @@
+"""
+Benchmark every stage of the pipeline on a seeded synthetic dataset (preprocess/synthetic.py) and write JSON
+
+python benchmark.py --nums 2000 4000 --out bench.json
+
+stages (seconds, the minimum over --repeat runs):
+    load, tokenize, index, candidates, lcs_verify (ECMC get_pairs), ecmc_group, scan_pairs, scan_cluster,
+    lcs_exact / lcs_decide (batch_LCS on every candidate pair a < b, full LCS length / decide mode at min_lifetime)
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import h5py
+import numpy as np
+import settings as ss
+from loader.data_loader import Loader
+from indexing.myRtree import bulk_rtree, self_join
+from indexing.grid_join import grid_candidates
+from indexing.segments import segment_candidates
+from indexing.scan import get_communities
+from baselines.ES_ECMC import ECMC
+from baselines.LCS_SCAN import SCAN
+from preprocess.synthetic import generate
+from utils.trajectory import batch_LCS
+from utils.evaluation import evaluate
+
+
+class Timer:
+    """Record the minimum elapsed time of each named stage"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def __call__(self, name, func, *args, **kwargs):
+        t1 = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - t1
+        self.stages[name] = min(elapsed, self.stages.get(name, elapsed))
+        return result
+
+
+def verify_pairs(trajectory_set, decide, batch_size=2048):
+    """batch_LCS on every candidate pair a < b, the same batches in exact and decide mode"""
+    indptr, indices = trajectory_set.intersections()
+    src = np.repeat(np.arange(len(trajectory_set)), np.diff(indptr))
+    upper = np.flatnonzero(src < indices)
+    for start in range(0, len(upper), batch_size):
+        batch = upper[start:start + batch_size]
+        batch_LCS([trajectory_set[a] for a in src[batch].tolist()],
+                  [trajectory_set[b] for b in indices[batch].tolist()],
+                  ss.min_lifetime, ss.dist_error, ss.time_error, decide)
+
+
+def run(h5path, num, candidates, timer):
+    """Run every stage once on the first num trajectories of h5path"""
+    loader = Loader(ss.scale, ss.time_size, h5path)
+    trajectory_set = timer("load", loader.load, num, tokenize=False)
+    timer("tokenize", loader.tokenize, trajectory_set)
+    idx = timer("index", bulk_rtree, trajectory_set.mbrs)
+    if candidates == "rtree":
+        intersections = timer("candidates", self_join, idx, trajectory_set.mbrs)
+    else:
+        generate_candidates = {"grid": grid_candidates, "segment": segment_candidates}[candidates]
+        intersections = timer("candidates", generate_candidates, trajectory_set,
+                              ss.dist_error, ss.time_error, ss.min_lifetime)
+    trajectory_set.set_intersections(*intersections)
+    timer("lcs_exact", verify_pairs, trajectory_set, False)
+    timer("lcs_decide", verify_pairs, trajectory_set, True)
+
+    ecmc = ECMC(ss.min_group_trj_num, ss.min_lifetime, ss.dist_error, ss.time_error)
+    e_pairs = timer("lcs_verify", ecmc.get_pairs, trajectory_set)
+    e_groups, e_labels = timer("ecmc_group", ecmc.group, trajectory_set, e_pairs)
+    scan = SCAN(ss.min_group_trj_num, ss.min_lifetime)
+    s_pairs = timer("scan_pairs", scan.get_pairs, trajectory_set)
+    communities, hubs, outliers = timer("scan_cluster", get_communities, s_pairs, ss.min_group_trj_num, ss.ep)
+    s_labels = [-1] * len(trajectory_set)
+    for ii, community in enumerate(communities):
+        for trj_id in community:
+            s_labels[trj_id] = ii
+    counts = {"trajectories": len(trajectory_set), "points": int(trajectory_set.offsets[-1]),
+              "candidate_pairs": int(trajectory_set.intersect_count.sum() - len(trajectory_set)),
+              "ecmc_pairs": len(e_pairs), "ecmc_groups": len(e_groups),
+              "scan_pairs": len(s_pairs), "scan_groups": len(communities)}
+    return counts, e_labels, s_labels
+
+
+def planted_groups(h5path):
+    """Planted group labels written by preprocess/synthetic.py, None for other files"""
+    with h5py.File(h5path, 'r') as f:
+        return np.array(f['groups']) if 'groups' in f else None
+
+
+def benchmark(nums, h5path, candidates="rtree", repeat=1):
+    """
+    :param nums: scales, the first num trajectories of h5path are used for each num
+    :return: list of dict, one per num: stage seconds, result sizes and quality against the planted groups
+    """
+    planted = planted_groups(h5path)
+    results = []
+    for num in nums:
+        timer = Timer()
+        for _ in range(repeat):
+            counts, e_labels, s_labels = run(h5path, num, candidates, timer)
+        quality = {"scan_vs_ecmc": evaluate(e_labels, s_labels)}
+        if planted is not None:
+            quality["ecmc_vs_planted"] = evaluate(planted[:len(e_labels)], e_labels)
+            quality["scan_vs_planted"] = evaluate(planted[:len(s_labels)], s_labels)
+        results.append({"num": num, "stages": timer.stages, "counts": counts, "quality": quality})
+        print(json.dumps(results[-1]))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark.py")
+    parser.add_argument("--nums", type=int, nargs="+", default=ss.nums, help="numbers of trajectories")
+    parser.add_argument("--h5", default=None, help="h5 file to use, a synthetic file is generated when omitted")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic file")
+    parser.add_argument("--group_ratio", type=float, default=0.5, help="fraction of trajectories in planted groups")
+    parser.add_argument("--group_size", type=int, nargs=2, default=[3, 8], help="min and max planted group size")
+    parser.add_argument("--noise", type=float, default=50.0, help="spatial noise of group members in meters")
+    parser.add_argument("--time_noise", type=float, default=30.0, help="time shift of group members in seconds")
+    parser.add_argument("--candidates", default="rtree", choices=["rtree", "grid", "segment"])
+    parser.add_argument("--repeat", type=int, default=1, help="runs per num, the minimum time is reported")
+    parser.add_argument("--out", default="benchmark.json", help="output json path")
+    args, _ = parser.parse_known_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        h5path = args.h5
+        if h5path is None:
+            h5path = os.path.join(tmp_dir, "synthetic.h5")
+            generate(h5path, max(args.nums), args.group_ratio, tuple(args.group_size), args.noise, args.time_noise,
+                     args.seed)
+        results = benchmark(args.nums, h5path, args.candidates, args.repeat)
+    report = {"config": {"city": ss.city, "scale": ss.scale, "time_size": ss.time_size, "dist_error": ss.dist_error,
+                         "time_error": ss.time_error, "min_lifetime": ss.min_lifetime,
+                         "min_group_trj_num": ss.min_group_trj_num, "ep": ss.ep, **vars(args)},
+              "platform": {"python": platform.python_version(), "numpy": np.__version__,
+                           "machine": platform.machine(), "processor": platform.processor()},
+              "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,60 @@
+def max_clique(vertices, adjacency):
+    """
+    在 vertices 导出的子图上求最大团
+    Bron–Kerbosch 算法, 带枢轴选择, 最外层按退化序 (degeneracy ordering) 展开, 集合用 Python int 位图表示
+    :param vertices: 候选顶点 id 序列
+    :param adjacency: id -> 相邻顶点 id 的集合
+    :return: 最大团的顶点 id, 按其在 vertices 中的顺序排列; 多个最大团时返回最先找到的
+    """
+    local = {v: k for k, v in enumerate(vertices)}
+    nbrs = [0] * len(vertices)
+    for k, v in enumerate(vertices):
+        for u in adjacency.get(v, ()):
+            j = local.get(u)
+            if j is not None and j != k:
+                nbrs[k] |= 1 << j
+                nbrs[j] |= 1 << k
+
+    best = [0]
+
+    def expand(R, P, X):
+        if P == 0:
+            if X == 0 and R.bit_count() > best[0].bit_count():
+                best[0] = R
+            return
+        # 即使 P 全部加入也无法超过当前最大团, 剪枝
+        if R.bit_count() + P.bit_count() <= best[0].bit_count():
+            return
+        pivot = max(_bits(P | X), key=lambda u: (P & nbrs[u]).bit_count())
+        for v in _bits(P & ~nbrs[pivot]):
+            expand(R | (1 << v), P & nbrs[v], X & nbrs[v])
+            P &= ~(1 << v)
+            X |= 1 << v
+
+    later = (1 << len(vertices)) - 1
+    for v in degeneracy_order(nbrs):
+        later &= ~(1 << v)
+        expand(1 << v, nbrs[v] & later, nbrs[v] & ~later)
+    return [vertices[k] for k in _bits(best[0])]
+
+
+def degeneracy_order(nbrs):
+    """反复取出剩余度数最小的顶点, 得到退化序"""
+    degree = [nbr.bit_count() for nbr in nbrs]
+    remain = (1 << len(nbrs)) - 1
+    order = []
+    while remain:
+        v = min(_bits(remain), key=lambda u: degree[u])
+        order.append(v)
+        remain &= ~(1 << v)
+        for u in _bits(nbrs[v] & remain):
+            degree[u] -= 1
+    return order
+
+
+def _bits(mask):
+    """位图中置 1 的位置, 从低到高"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
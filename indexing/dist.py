@@ -1,4 +1,5 @@
 from math import sin, asin, cos, radians, fabs, sqrt
+import numpy as np
 EARTH_RADIUS = 6371  # 地球平均半径，6371km
 
 
@@ -22,6 +23,31 @@ def get_distance_hav(lng0, lat0, lng1, lat1):
     return distance*1000
 
 
+def get_distance_hav_array(lng0, lat0, lng1, lat1):
+    """get_distance_hav 的向量化版本，输入可广播的经纬度数组，按元素返回距离(米)。"""
+    lat0 = np.radians(lat0)
+    lat1 = np.radians(lat1)
+    lng0 = np.radians(lng0)
+    lng1 = np.radians(lng1)
+
+    dlng = np.fabs(lng0 - lng1)
+    dlat = np.fabs(lat0 - lat1)
+    h = np.sin(dlat / 2) ** 2 + np.cos(lat0) * np.cos(lat1) * np.sin(dlng / 2) ** 2
+    distance = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(h))
+    return distance*1000
+
+
+def degree_errors(dist_error, max_lat):
+    """
+    球面距离不超过 dist_error(米) 的两点, 纬度差与经度差(度)的上界
+    纬度: d >= R*|dlat|; 经度: 两点纬度绝对值均不超过 max_lat 时 d >= 2R*asin(cos(max_lat)*sin(|dlng|/2))
+    """
+    r = dist_error / (EARTH_RADIUS * 1000)
+    lat_error = np.degrees(r)
+    lon_error = np.degrees(2 * np.arcsin(min(np.sin(r / 2) / np.cos(np.radians(max_lat)), 1.0)))
+    return float(lon_error), float(lat_error)
+
+
 if __name__ == "__main__":
     lng0, lat0, lng1, lat1 = 105.00231, -30.79532, 105.00231+0.001, -30.79532+0.001 # 公司到小区
     print(get_distance_hav(lng0, lat0, lng1, lat1))
@@ -0,0 +1,89 @@
+import numpy as np
+from indexing.dist import degree_errors
+
+
+def grid_cells(trajectory_set, dist_error, time_error):
+    """
+    将全部轨迹点划入时空网格, 经纬度方向的格子边长取 dist_error 对应的度数上界, 时间方向取 time_error,
+    因此可能匹配的两个点 (距离 <= dist_error 且时间差 <= time_error) 必定落在相同或相邻的格子中
+    :return: 每个点的格子编号 (N,), 以及 27 个相邻格子相对编号的偏移量
+    """
+    lon_lat, times = trajectory_set.lon_lat, trajectory_set.time
+    lon_error, lat_error = degree_errors(dist_error, np.abs(lon_lat[:, 1]).max())
+    # 略微放大格子, 避免浮点误差使相距恰为一个格子的点跨越两个格子
+    sizes = np.array([lon_error, lat_error, max(time_error, 1e-9)]) * (1 + 1e-6)
+    coords = np.column_stack([lon_lat, times])
+    cells = np.floor((coords - coords.min(axis=0)) / sizes).astype(np.int64) + 1
+    # 每个维度两侧各留一格空白, 相邻格子的编号运算不会越界
+    dims = cells.max(axis=0) + 2
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    steps = np.array([dims[1] * dims[2], dims[2], 1])
+    deltas = np.array([np.dot(steps, [dx, dy, dt]) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dt in (-1, 0, 1)])
+    return keys, deltas
+
+
+def grid_candidates(trajectory_set, dist_error, time_error, min_lifetime, chunk_size=1 << 20):
+    """
+    网格哈希连接生成候选轨迹对, 可替代 R-tree 的 intersect_trjs
+    1. 同一轨迹落在同一格子的点合并为一条占用记录 (格子, 轨迹, 点数), 按格子排序
+    2. 每条占用记录与 27 个相邻格子中的占用记录连接, 得到 (a 的格子, b) 即 a 的这些点在 b 中存在可能匹配的点
+    3. count(a, b) 为 a 中存在可能匹配点的点数, min(count(a, b), count(b, a)) 是 LCS 的上界,
+       只保留上界不小于 min_lifetime 的轨迹对
+    :return: CSR 形式 (indptr, indices), 与 R-tree 结果一样每条轨迹包含自身, 按 id 升序
+    """
+    n = len(trajectory_set)
+    keys, deltas = grid_cells(trajectory_set, dist_error, time_error)
+    trj_ids = np.repeat(np.arange(n, dtype=np.int64), trajectory_set.sizes)
+    occupancy, weights = np.unique(np.column_stack([keys, trj_ids]), axis=0, return_counts=True)
+    occ_keys, occ_trjs = occupancy[:, 0], occupancy[:, 1]
+
+    pair_codes, pair_counts = [], []
+    step = max(chunk_size // (len(deltas) * 8), 1)
+    for start in range(0, len(occ_keys), step):
+        src = np.arange(start, min(start + step, len(occ_keys)))
+        matched_src, matched_trj = [], []
+        for delta in deltas:
+            neighbor = occ_keys[src] + delta
+            lo = np.searchsorted(occ_keys, neighbor, side='left')
+            hi = np.searchsorted(occ_keys, neighbor, side='right')
+            count = hi - lo
+            matched_src.append(np.repeat(src, count))
+            matched_trj.append(occ_trjs[np.arange(count.sum()) - np.repeat(np.cumsum(count) - count - lo, count)])
+        # 同一占用记录在多个相邻格子中遇到同一条轨迹 b 只计一次
+        codes = np.unique(np.concatenate(matched_src) * n + np.concatenate(matched_trj))
+        src_ids, b = codes // n, codes % n
+        pair_codes.append(occ_trjs[src_ids] * n + b)
+        pair_counts.append(weights[src_ids])
+    return cover_candidates(np.concatenate(pair_codes), np.concatenate(pair_counts), n, min_lifetime)
+
+
+def cover_candidates(codes, weights, n, min_lifetime):
+    """
+    由覆盖计数得到候选轨迹对
+    :param codes: 有序对编号 a*n+b, 每个元素表示 a 的一组点 (点数为对应的 weights) 在 b 中存在可能匹配的点,
+                  同一组点对同一条 b 只出现一次
+    :return: CSR 形式 (indptr, indices), 保留 min(count(a, b), count(b, a)) >= min_lifetime 的轨迹对,
+             每条轨迹包含自身, 按 id 升序
+    """
+    codes, inverse = np.unique(codes, return_inverse=True)
+    counts = np.bincount(inverse.reshape(-1), weights=weights, minlength=len(codes)).astype(np.int64)
+
+    a, b = codes // n, codes % n
+    # 可能匹配关系是对称的, (b, a) 必定存在
+    reverse = np.searchsorted(codes, b * n + a)
+    upper = np.minimum(counts, counts[reverse])
+    keep = upper >= min_lifetime
+    a, b = a[keep], b[keep]
+    # 自身总是保留, 保证 intersect_count 的含义与 R-tree 一致
+    a = np.concatenate([a, np.arange(n)])
+    b = np.concatenate([b, np.arange(n)])
+    codes = np.unique(a * n + b)
+    indptr = np.searchsorted(codes // n, np.arange(n + 1), side='left').astype(np.int64)
+    return indptr, codes % n
+
+
+def compare_candidates(rtree_indptr, candidate_indptr):
+    """统计 R-tree 与其他候选生成方式的候选轨迹对数量 (有序对, 不含自身)"""
+    rtree_pairs = int(rtree_indptr[-1]) - (len(rtree_indptr) - 1)
+    candidate_pairs = int(candidate_indptr[-1]) - (len(candidate_indptr) - 1)
+    return {"rtree_pairs": rtree_pairs, "candidate_pairs": candidate_pairs, "pruned": rtree_pairs - candidate_pairs}
@@ -0,0 +1,99 @@
+import numpy as np
+from collections import deque
+from indexing.scan import CSRGraph
+
+
+class GSIndex:
+    """
+    GS*-Index: 在 CSRGraph 上一次性建立, 之后任意 (epsilon, mu) 的 SCAN 聚类都可直接由索引得到
+    1. 邻居序: 每个顶点的邻居按结构相似度降序排列, 顶点的 ϵ-邻居即其前缀
+    2. 核心序: 对每个 μ, 度数不小于 μ 的顶点按其第 μ 大的邻居相似度降序排列,
+       顶点在 (ϵ, μ) 下为核节点当且仅当该相似度 >= ϵ, 因此全部核节点是核心序的前缀
+    两者的总大小都等于有向边数
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        n = len(graph)
+        # 邻居序: 行内按相似度降序
+        order = np.lexsort((-graph.similarity, graph.src))
+        self.neighbors = graph.indices[order]
+        self.neighbor_sims = graph.similarity[order]
+        # 核心序: 行内第 r 个位置 (从 0 开始) 即该顶点在 μ = r + 1 时的核心相似度
+        rank = np.arange(len(order)) - graph.indptr[graph.src]
+        order = np.lexsort((-self.neighbor_sims, rank))
+        self.core_vertices = graph.src[order]
+        self.core_sims = self.neighbor_sims[order]
+        self.core_indptr = np.searchsorted(rank[order], np.arange(graph.degree.max(initial=0) + 1))
+        self._all = np.arange(n)
+
+    def __len__(self):
+        return len(self.graph)
+
+    def cores(self, epsilon, mu):
+        """(ϵ, μ) 下的全部核节点, 按核心序排列"""
+        if mu < 1:
+            return self._all
+        if mu >= len(self.core_indptr):
+            return self._all[:0]
+        lo, hi = self.core_indptr[mu - 1], self.core_indptr[mu]
+        count = np.searchsorted(-self.core_sims[lo:hi], -epsilon, side='right')
+        return self.core_vertices[lo:lo + count]
+
+    def get_epsilon_neighbor(self, node, epsilon):
+        lo, hi = self.graph.indptr[node], self.graph.indptr[node + 1]
+        count = np.searchsorted(-self.neighbor_sims[lo:hi], -epsilon, side='right')
+        return self.neighbors[lo:lo + count].tolist()
+
+    def query(self, epsilon, mu):
+        """
+        按核心序依次从尚未归类的核节点扩张社区, 扩张过程与 SCAN.execute 相同, 只访问核节点的 ϵ-邻居
+        :return: communities, hubs, outliers, 均为顶点内部编号
+        """
+        cores = self.cores(epsilon, mu)
+        is_core = np.zeros(len(self), dtype=bool)
+        is_core[cores] = True
+        node_community = np.full(len(self), -1, dtype=np.int64)
+        communities = []
+        for node in cores.tolist():
+            if node_community[node] != -1:
+                continue
+            community = [node]
+            node_community[node] = len(communities)
+            queue = deque([node])
+            while queue:
+                temp = queue.popleft()
+                for r in self.get_epsilon_neighbor(temp, epsilon):
+                    if node_community[r] != -1:
+                        continue
+                    node_community[r] = len(communities)
+                    community.append(r)
+                    if is_core[r]:
+                        queue.append(r)
+            communities.append(community)
+        hubs, outliers = self.get_hubs_outliers(node_community)
+        return communities, hubs, outliers
+
+    def get_hubs_outliers(self, node_community):
+        """未归类的顶点中, 邻居分属多于一个社区的为桥节点, 其余为离群点"""
+        graph = self.graph
+        src_community = node_community[graph.src]
+        dst_community = node_community[graph.indices]
+        mask = (src_community == -1) & (dst_community != -1)
+        touched = np.unique(graph.src[mask] * (len(self) + 1) + dst_community[mask]) // (len(self) + 1)
+        is_hub = np.bincount(touched, minlength=len(self)) > 1
+        unclassified = node_community == -1
+        return np.nonzero(unclassified & is_hub)[0].tolist(), np.nonzero(unclassified & ~is_hub)[0].tolist()
+
+
+def get_index(pairs):
+    """由轨迹对建立 GS*-Index, 之后可用 get_communities 回答任意 (epsilon, mu)"""
+    return GSIndex(CSRGraph(pairs))
+
+
+def get_communities(index, mu, epsilon):
+    """与 indexing.scan.get_communities 的返回相同, 顶点编号还原为轨迹 id"""
+    communities, hubs, outliers = index.query(epsilon, mu)
+    nodes = index.graph.nodes.tolist()
+    communities = [[nodes[node] for node in c] for c in communities]
+    return communities, [nodes[node] for node in hubs], [nodes[node] for node in outliers]
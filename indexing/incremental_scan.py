@@ -0,0 +1,181 @@
+import math
+from collections import deque
+
+
+class IncrementalSCAN:
+    """
+    增量维护的 SCAN 社区, 结果与 indexing.scan.get_communities 在同一轨迹对图上一致 (非核节点同时与多个社区的
+    核节点 ϵ-相邻时, 所归属的社区可能不同)
+    加入或删除边 (u, v) 时:
+    1. 只有 u、v 的度数与它们的邻居关系改变, 因此只重新计算与 u、v 相连的边的结构相似度
+    2. 只有 ϵ-邻居状态改变的边的端点需要重新判断是否为核节点
+    3. 只拆分或合并涉及这些端点的社区: 解散这些社区后从其核节点重新扩张, 扩张遇到其他社区的核节点时将其一并合并,
+       再为受影响的非核节点重新选择社区
+    """
+
+    def __init__(self, epsilon=0.5, mu=3, pairs=()):
+        self.epsilon = epsilon
+        self.mu = mu
+        self.adjacency = {}
+        # (min(u, v), max(u, v)) -> 结构相似度
+        self.similarity = {}
+        self.epsilon_count = {}
+        self.core = set()
+        # 节点 -> 社区 id, 社区 id -> 成员集合
+        self.label = {}
+        self.clusters = {}
+        self.next_cluster_id = 0
+        self.update(added=pairs)
+
+    def __len__(self):
+        return len(self.adjacency)
+
+    def add_edges(self, pairs):
+        return self.update(added=pairs)
+
+    def remove_edges(self, pairs):
+        return self.update(removed=pairs)
+
+    def cal_similarity(self, u, v):
+        s1, s2 = self.adjacency[u], self.adjacency[v]
+        if len(s1) > len(s2):
+            s1, s2 = s2, s1
+        common = sum(1 for w in s1 if w in s2)
+        # 邻居包含节点自身, 故共同邻居数为公共邻居数 + 2
+        return (common + 2) / math.sqrt((len(s1) + 1) * (len(s2) + 1))
+
+    def is_epsilon(self, key):
+        return self.similarity.get(key, -1.0) >= self.epsilon
+
+    def update(self, added=(), removed=()):
+        """
+        先删除后加入一批边, 再局部更新相似度、核节点与社区
+        :return: 本次改动涉及的节点数
+        """
+        changed = set()
+        touched = set()
+        for u, v in removed:
+            key = (min(u, v), max(u, v))
+            if key not in self.similarity:
+                continue
+            if self.is_epsilon(key):
+                self.epsilon_count[u] -= 1
+                self.epsilon_count[v] -= 1
+                touched.update(key)
+            del self.similarity[key]
+            self.adjacency[u].discard(v)
+            self.adjacency[v].discard(u)
+            changed.update(key)
+        for u, v in added:
+            key = (min(u, v), max(u, v))
+            if u == v or key in self.similarity:
+                continue
+            for node in key:
+                if node not in self.adjacency:
+                    self.adjacency[node] = set()
+                    self.epsilon_count[node] = 0
+            self.adjacency[u].add(v)
+            self.adjacency[v].add(u)
+            self.similarity[key] = -1.0
+            changed.update(key)
+        # 与度数或邻居改变的节点相连的边重新计算相似度, 记录 ϵ-邻居状态改变的端点
+        for u in changed:
+            for v in self.adjacency.get(u, ()):
+                key = (min(u, v), max(u, v))
+                before = self.is_epsilon(key)
+                self.similarity[key] = self.cal_similarity(u, v)
+                after = self.is_epsilon(key)
+                if before != after:
+                    delta = 1 if after else -1
+                    self.epsilon_count[u] += delta
+                    self.epsilon_count[v] += delta
+                    touched.update(key)
+        touched |= changed
+        # 删除孤立节点
+        for node in changed:
+            if node in self.adjacency and not self.adjacency[node]:
+                del self.adjacency[node]
+                del self.epsilon_count[node]
+        for node in touched:
+            if node in self.adjacency and self.epsilon_count[node] >= self.mu:
+                self.core.add(node)
+            else:
+                self.core.discard(node)
+        self.recluster(touched)
+        return len(touched)
+
+    def epsilon_neighbors(self, node):
+        return [v for v in self.adjacency[node] if self.is_epsilon((min(node, v), max(node, v)))]
+
+    def dissolve(self, cluster_id):
+        """解散社区, 返回其成员"""
+        members = self.clusters.pop(cluster_id)
+        for member in members:
+            del self.label[member]
+        return members
+
+    def recluster(self, touched):
+        # 解散涉及改动节点的社区
+        released = set()
+        for node in touched:
+            if node in self.label:
+                released |= self.dissolve(self.label[node])
+        seeds = sorted(node for node in released | touched if node in self.core)
+        borders = {node for node in released | touched if node in self.adjacency and node not in self.core}
+        visited = set()
+        for seed in seeds:
+            if seed in visited:
+                continue
+            visited.add(seed)
+            members = {seed}
+            queue = deque([seed])
+            while queue:
+                node = queue.popleft()
+                for r in self.epsilon_neighbors(node):
+                    if r not in self.core:
+                        borders.add(r)
+                        continue
+                    if r in visited:
+                        continue
+                    if r in self.label:
+                        # 与未受影响社区的核节点 ϵ-相连, 两个社区合并; 其非核成员重新选择社区
+                        borders |= {m for m in self.dissolve(self.label[r]) if m not in self.core}
+                    visited.add(r)
+                    members.add(r)
+                    queue.append(r)
+            cluster_id = self.next_cluster_id
+            self.next_cluster_id += 1
+            self.clusters[cluster_id] = members
+            for member in members:
+                self.label[member] = cluster_id
+        # 非核节点: 原社区仍有 ϵ-相邻的核节点时保留, 否则归入 ϵ-相邻核节点所在社区中 id 最小的一个
+        for node in borders:
+            if node in self.core or node not in self.adjacency:
+                continue
+            options = {self.label[v] for v in self.epsilon_neighbors(node) if v in self.core}
+            current = self.label.get(node)
+            if current in options:
+                continue
+            if current is not None:
+                self.clusters[current].discard(node)
+                del self.label[node]
+            if options:
+                cluster_id = min(options)
+                self.clusters[cluster_id].add(node)
+                self.label[node] = cluster_id
+
+    def get_communities(self):
+        """
+        与 indexing.scan.get_communities 的返回相同
+        :return: communities, hubs, outliers; 桥节点与离群点需要检查全部未归类节点, 按需计算
+        """
+        communities = [sorted(self.clusters[cluster_id]) for cluster_id in sorted(self.clusters)]
+        hubs, outliers = [], []
+        for node, neighbors in self.adjacency.items():
+            if node in self.label:
+                continue
+            if len({self.label[v] for v in neighbors if v in self.label}) > 1:
+                hubs.append(node)
+            else:
+                outliers.append(node)
+        return communities, hubs, outliers
@@ -1,16 +1,68 @@
+import os
+import uuid
+import numpy as np
 from rtree import index
 from loader.data_loader import Loader
 from tqdm import tqdm
 
 
 def my_rtree():
-    from rtree import index
+    p = rtree_property()
+    idx = index.Index('3d_index', properties=p, interleaved=False, overwrite=True)
+    return idx
+
+
+def rtree_property():
     p = index.Property()
     p.dimension = 3
     p.dat_extension = 'data'
     p.idx_extension = 'index'
-    idx = index.Index('3d_index', properties=p, interleaved=False, overwrite=True)
-    return idx
+    return p
+
+
+def rtree_path(index_dir, city, num):
+    """按数据集与轨迹数区分的持久化索引路径, MBR 与 scale/time_size 无关"""
+    return os.path.join(index_dir, "%s_%d_3d_index" % (city, num))
+
+
+def bulk_rtree(mbrs, path=None):
+    """
+    以流的方式批量装载全部 MBR, libspatialindex 对流式输入使用 STR 打包建树
+    :param mbrs: (n, 6) [min_lon, max_lon, min_lat, max_lat, start_time, end_time], 第 i 行的 id 为 i
+    :param path: None 时索引只在内存中; 否则持久化到 path, 先写入临时文件再改名, 同目录的并发运行互不覆盖
+    """
+    p = rtree_property()
+    stream = ((i, tuple(mbr), None) for i, mbr in enumerate(np.asarray(mbrs, dtype=float).tolist()))
+    if path is None:
+        return index.Index(stream, properties=p, interleaved=False)
+    tmp_path = "%s.%s" % (path, uuid.uuid4().hex)
+    idx = index.Index(tmp_path, stream, properties=p, interleaved=False)
+    idx.close()
+    for extension in (p.dat_extension, p.idx_extension):
+        os.replace("%s.%s" % (tmp_path, extension), "%s.%s" % (path, extension))
+    return open_rtree(path)
+
+
+def open_rtree(path):
+    """重新打开已持久化的索引, 不覆盖已有文件, 调用方只做查询"""
+    p = rtree_property()
+    p.overwrite = False
+    return index.Index(path, properties=p, interleaved=False)
+
+
+def self_join(idx, mbrs):
+    """
+    批量自连接: 一次调用得到每个 MBR 相交的全部 id
+    :return: CSR 形式 (indptr, indices), 第 i 条轨迹的 intersect_trjs 为 indices[indptr[i]:indptr[i+1]], 按 id 升序
+    """
+    mbrs = np.asarray(mbrs, dtype=float)
+    if len(mbrs) == 0:
+        return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    ids, counts = idx.intersection_v(mbrs[:, 0::2], mbrs[:, 1::2])
+    indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    # 每行内按 id 排序, 使结果与树的装载方式无关
+    order = np.lexsort((ids, np.repeat(np.arange(len(mbrs)), counts.astype(np.int64))))
+    return indptr, ids[order].astype(np.int64)
 
 
 if __name__ == "__main__":
@@ -26,4 +78,3 @@ if __name__ == "__main__":
     for trj in tqdm(trajectory_set):
         interset_trjs = list(idx.intersection(trj.mbr))
         count.append(len(interset_trjs))
-
@@ -3,6 +3,8 @@ import random
 import math
 import matplotlib.pyplot as plt
 import numpy as np
+from collections import deque
+from utils.profiler import NULL_PROFILER
 
 
 class SCAN:
@@ -136,7 +138,155 @@ def load_graph(path):
     return G
 
 
-def get_communities(pairs, mu, epsilon):
+class CSRGraph:
+    """
+    以 CSR (indptr, indices) 存储的无向图, 顶点为 pairs 中出现过的 id, 内部编号为其升序排名
+    每条边的结构相似度在建图时一次性算好, 按有向边存放在 similarity 中 (与 indices 对齐)
+    """
+
+    def __init__(self, pairs, chunk_size=1 << 22):
+        edges = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        edges = edges[edges[:, 0] != edges[:, 1]]
+        self.nodes, local = np.unique(edges, return_inverse=True)
+        n = len(self.nodes)
+        local = local.reshape(-1, 2)
+        src = np.concatenate([local[:, 0], local[:, 1]])
+        dst = np.concatenate([local[:, 1], local[:, 0]])
+        keys = np.unique(src * n + dst)
+        self.src, self.indices = keys // n, keys % n
+        self.indptr = np.searchsorted(self.src, np.arange(n + 1)).astype(np.int64)
+        self.degree = np.diff(self.indptr)
+        self.similarity = self.cal_similarity(keys, chunk_size)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def cal_similarity(self, keys, chunk_size):
+        """
+        结构相似度 |N[u] ∩ N[v]| / sqrt(|N[u]| * |N[v]|), 邻居包含自身, 故共同邻居数为 u、v 的公共邻居数 + 2
+        每条无向边只计算一次: 枚举度数较小端点的每个邻居 w, 在有序边键中二分查找另一端点与 w 是否相连
+        """
+        n = len(self)
+        u, v = self.src, self.indices
+        forward = np.nonzero(u < v)[0]
+        small = np.where(self.degree[u[forward]] <= self.degree[v[forward]], u[forward], v[forward])
+        other = u[forward] + v[forward] - small
+        common = np.zeros(len(forward), dtype=np.int64)
+        # 按展开后的元素数分块, 控制内存
+        expand = np.cumsum(self.degree[small])
+        start = 0
+        while start < len(forward):
+            end = max(int(np.searchsorted(expand, (expand[start - 1] if start else 0) + chunk_size)), start + 1)
+            end = min(end, len(forward))
+            counts = self.degree[small[start:end]]
+            edge = np.repeat(np.arange(start, end), counts)
+            w = self.indices[np.repeat(self.indptr[small[start:end]] - np.cumsum(counts) + counts, counts)
+                             + np.arange(counts.sum())]
+            query = other[edge] * n + w
+            found = keys[np.minimum(np.searchsorted(keys, query), len(keys) - 1)] == query
+            common[start:end] = np.bincount(edge[found] - start, minlength=end - start)
+            start = end
+        undirected = (self.degree[u[forward]] + 1.0) * (self.degree[v[forward]] + 1.0)
+        similarity_forward = (common + 2) / np.sqrt(undirected)
+        # 反向边 (v, u) 与 (u, v) 共用同一个相似度
+        position = np.searchsorted(keys[forward], np.minimum(u, v) * n + np.maximum(u, v))
+        return similarity_forward[position]
+
+
+class CSRSCAN:
+    """
+    基于 CSR 图的 SCAN, 每条边的结构相似度只计算一次, ϵ-邻居与核节点状态对给定的 (epsilon, mu) 只计算一次,
+    扩张过程与 SCAN.execute 相同
+    """
+
+    def __init__(self, graph, epsilon=0.5, mu=3):
+        self._graph = graph
+        self._epsilon = epsilon
+        self._mu = mu
+        self._epsilon_edge = graph.similarity >= epsilon
+        # 核节点: ϵ-邻居数不小于 μ
+        self._core = np.bincount(graph.src[self._epsilon_edge], minlength=len(graph)) >= mu
+
+    def get_epsilon_neighbor(self, node):
+        lo, hi = self._graph.indptr[node], self._graph.indptr[node + 1]
+        return self._graph.indices[lo:hi][self._epsilon_edge[lo:hi]].tolist()
+
+    def is_core(self, node):
+        return self._core[node]
+
+    def execute(self, shuffle=True):
+        visit_sequence = list(range(len(self._graph)))
+        if shuffle:
+            random.shuffle(visit_sequence)
+        classified = np.zeros(len(self._graph), dtype=bool)
+        core = self._core.tolist()
+        communities = []
+        for node in visit_sequence:
+            if classified[node] or not core[node]:
+                continue
+            community = [node]
+            communities.append(community)
+            classified[node] = True
+            queue = deque(self.get_epsilon_neighbor(node))
+            while queue:
+                temp = queue.popleft()
+                if not classified[temp]:
+                    classified[temp] = True
+                    community.append(temp)
+                if not core[temp]:
+                    continue
+                for r in self.get_epsilon_neighbor(temp):
+                    if classified[r]:
+                        continue
+                    classified[r] = True
+                    community.append(r)
+                    queue.append(r)
+        return communities
+
+    def get_hubs_outliers(self, communities):
+        node_community = np.full(len(self._graph), -1, dtype=np.int64)
+        for i, c in enumerate(communities):
+            node_community[c] = i
+        hubs = []
+        outliers = []
+        for node in np.nonzero(node_community == -1)[0].tolist():
+            neighbor_community = set(node_community[self._graph.neighbors(node)].tolist())
+            neighbor_community.discard(-1)
+            if len(neighbor_community) > 1:
+                hubs.append(node)
+            else:
+                outliers.append(node)
+        return hubs, outliers
+
+
+def get_communities(pairs, mu, epsilon, profiler=NULL_PROFILER):
+    """
+    :param profiler: utils.profiler.Profiler, 记录建图 (含相似度) 与聚类的耗时及计数
+    :return: communities, hubs, outliers
+    """
+    with profiler.stage("scan.graph"):
+        graph = CSRGraph(pairs)
+    with profiler.stage("scan.cluster"):
+        algorithm = CSRSCAN(graph, epsilon, mu)
+        communities = algorithm.execute()
+        hubs, outliers = algorithm.get_hubs_outliers(communities)
+    if profiler.enabled:
+        profiler.count("graph_nodes", len(graph))
+        profiler.count("graph_edges", len(graph.indices) // 2)
+        profiler.count("core_nodes", algorithm._core.sum())
+        profiler.count("groups", len(communities))
+        profiler.count("hubs", len(hubs))
+        profiler.count("outliers", len(outliers))
+    # 内部编号还原为轨迹 id
+    nodes = graph.nodes.tolist()
+    communities = [[nodes[node] for node in c] for c in communities]
+    return communities, [nodes[node] for node in hubs], [nodes[node] for node in outliers]
+
+
+def get_communities_nx(pairs, mu, epsilon):
     G = nx.Graph()
     for line in pairs:
         source, target = line[0], line[1]
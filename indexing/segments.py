@@ -0,0 +1,46 @@
+import numpy as np
+from indexing.dist import degree_errors
+from indexing.myRtree import bulk_rtree, self_join
+from indexing.grid_join import cover_candidates
+
+
+def segment_mbrs(trajectory_set, seg_len, dist_error, time_error):
+    """
+    将每条轨迹按 seg_len 个点切分为短片段, 每个片段的 MBR 在经纬度方向各扩张 dist_error 的一半(度数上界),
+    时间方向扩张 time_error 的一半, 因此两条轨迹中可能匹配的两个点所在片段的 MBR 必定相交
+    :return: seg_trjs (S,) 片段所属轨迹, seg_sizes (S,) 片段点数, mbrs (S, 6)
+    """
+    sizes = trajectory_set.sizes
+    seg_counts = -(-sizes // seg_len)
+    seg_trjs = np.repeat(np.arange(len(sizes), dtype=np.int64), seg_counts)
+    # 片段在轨迹内的序号, 片段起点 = 轨迹起点 + 序号 * seg_len
+    seg_rank = np.arange(len(seg_trjs)) - np.repeat(np.cumsum(seg_counts) - seg_counts, seg_counts)
+    starts = trajectory_set.offsets[seg_trjs] + seg_rank * seg_len
+    ends = np.minimum(starts + seg_len, trajectory_set.offsets[seg_trjs + 1])
+    lon_lat, times = trajectory_set.lon_lat, trajectory_set.time
+    lon_error, lat_error = degree_errors(dist_error, np.abs(lon_lat[:, 1]).max())
+    margin = np.array([lon_error, lat_error, time_error]) * (1 + 1e-6) / 2
+    mbrs = np.empty((len(seg_trjs), 6))
+    mbrs[:, 0::2] = np.column_stack([np.minimum.reduceat(lon_lat, starts, axis=0),
+                                     np.minimum.reduceat(times, starts)]) - margin
+    mbrs[:, 1::2] = np.column_stack([np.maximum.reduceat(lon_lat, starts, axis=0),
+                                     np.maximum.reduceat(times, starts)]) + margin
+    return seg_trjs, ends - starts, mbrs
+
+
+def segment_candidates(trajectory_set, dist_error, time_error, min_lifetime, seg_len=5):
+    """
+    片段级 MBR 索引生成候选轨迹对, 可替代整条轨迹 MBR 的 intersect_trjs
+    1. 对全部片段 MBR 批量建 R-tree 并自连接, 得到相交的片段对
+    2. cover(a, b) 为 a 中与 b 的某个片段相交的片段点数之和, a 中每个可能匹配 b 的点都被计入,
+       min(cover(a, b), cover(b, a)) 是 LCS 的上界, 只保留上界不小于 min_lifetime 的轨迹对
+    :return: CSR 形式 (indptr, indices), 每条轨迹包含自身, 按 id 升序
+    """
+    n = len(trajectory_set)
+    seg_trjs, seg_sizes, mbrs = segment_mbrs(trajectory_set, seg_len, dist_error, time_error)
+    indptr, indices = self_join(bulk_rtree(mbrs), mbrs)
+    src = np.repeat(np.arange(len(seg_trjs)), np.diff(indptr))
+    # 同一片段与轨迹 b 的多个片段相交时只计一次
+    codes = np.unique(src * n + seg_trjs[indices])
+    src, b = codes // n, codes % n
+    return cover_candidates(seg_trjs[src] * n + b, seg_sizes[src], n, min_lifetime)
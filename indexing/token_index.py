@@ -0,0 +1,77 @@
+import numpy as np
+
+
+def occurrence_keys(token, offsets):
+    """
+    将每个点的 token 改写为 (token, 该 token 在本轨迹中第几次出现) 的编码,
+    两条轨迹共有的编码数即两者 token 的多重集交集大小 sum(min(count_a(t), count_b(t)))
+    :return: keys (N,), trj_ids (N,)
+    """
+    n = len(offsets) - 1
+    token = np.asarray(token, dtype=np.int64)
+    trj_ids = np.repeat(np.arange(n, dtype=np.int64), np.diff(offsets))
+    order = np.lexsort((token, trj_ids))
+    sorted_trj, sorted_token = trj_ids[order], token[order]
+    # 排序后 (轨迹, token) 相同的点相邻, 出现序号为其在该段内的位置
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = (sorted_trj[1:] != sorted_trj[:-1]) | (sorted_token[1:] != sorted_token[:-1])
+    first = np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))
+    rank = np.arange(len(order)) - first
+    keys = sorted_token * (int(rank.max(initial=0)) + 1) + rank
+    return keys, sorted_trj
+
+
+def token_overlaps(token, offsets, indptr, indices, active=None, chunk_size=1 << 22):
+    """
+    倒排索引计算候选轨迹对的 token 重合数 (与 Counter 交集的元素个数相同)
+    1. 以 (token, 出现序号) 为键建立倒排表, 键 -> 含有该键的轨迹
+    2. 同一倒排表内的轨迹两两成对, 每出现一次重合数加一, 只累计 (indptr, indices) 中的候选轨迹对
+    :param indptr, indices: CSR 形式的候选轨迹对, 每行按 id 升序
+    :param active: (n,) bool, 只统计两端都为 True 的轨迹对, 其余为 0
+    :return: (len(indices),) 与 indices 对齐的重合数
+    """
+    n = len(offsets) - 1
+    keys, trj_ids = occurrence_keys(token, offsets)
+    if active is not None:
+        keys, trj_ids = keys[active[trj_ids]], trj_ids[active[trj_ids]]
+    # 倒排表: 按 (键, 轨迹) 排序, 每个键的轨迹为连续一段
+    order = np.lexsort((trj_ids, keys))
+    keys, trj_ids = keys[order], trj_ids[order]
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    sizes = np.diff(np.append(starts, len(keys)))
+    starts, sizes = starts[sizes > 1], sizes[sizes > 1]
+
+    # 候选的无序轨迹对 a < b, 编码 a*n+b 有序
+    src = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    upper = src < indices
+    candidates = src[upper] * n + indices[upper]
+    counts = np.zeros(len(candidates), dtype=np.int64)
+    if len(candidates):
+        # 按生成的轨迹对数量分块, 控制内存
+        emitted = np.cumsum(sizes * (sizes - 1) // 2)
+        begin = 0
+        while begin < len(starts):
+            end = max(int(np.searchsorted(emitted, (emitted[begin - 1] if begin else 0) + chunk_size)), begin + 1)
+            end = min(end, len(starts))
+            codes = posting_pairs(trj_ids, starts[begin:end], sizes[begin:end], n)
+            position = np.minimum(np.searchsorted(candidates, codes), len(candidates) - 1)
+            hit = candidates[position] == codes
+            counts += np.bincount(position[hit], minlength=len(candidates))
+            begin = end
+    # 有向的 (a, b) 与 (b, a) 取同一个无序对的重合数
+    lo, hi = np.minimum(src, indices), np.maximum(src, indices)
+    position = np.minimum(np.searchsorted(candidates, lo * n + hi), max(len(candidates) - 1, 0))
+    overlaps = np.zeros(len(indices), dtype=np.int64)
+    found = src != indices
+    overlaps[found] = counts[position[found]]
+    return overlaps
+
+
+def posting_pairs(trj_ids, starts, sizes, n):
+    """倒排表 [starts, starts+sizes) 内的轨迹两两组成的无序对编码 a*n+b (a < b)"""
+    # 每个元素与同一倒排表内排在它之后的元素成对
+    element = np.repeat(starts, sizes) + np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    after = np.repeat(starts + sizes, sizes) - element - 1
+    first = np.repeat(element, after)
+    second = first + 1 + np.arange(after.sum()) - np.repeat(np.cumsum(after) - after, after)
+    return trj_ids[first] * n + trj_ids[second]
@@ -0,0 +1,105 @@
+import os
+import sys
+from collections import OrderedDict
+import numpy as np
+from rtree import index
+
+# 内存中的 R-tree (libspatialindex, 3 维) 每个条目占用的字节数, 由批量装载前后进程 RSS 的差估计
+RTREE_ENTRY_BYTES = 192
+
+
+class DatasetCache:
+    """
+    Keyed cache of loaded datasets, shared by load_index across the Evaluator sweeps
+
+    Each entry is a dict of numpy arrays, plus optional in-memory objects (trajectory store, R-tree) that are
+    only kept in memory. The size of an entry counts its arrays and the estimated size of its objects (entry_nbytes),
+    entries are evicted in least-recently-used order once the total exceeds max_bytes.
+    With cache_dir, the arrays of every entry are also written to disk and reloaded after eviction or restart.
+    """
+
+    def __init__(self, max_bytes=4 << 30, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, "_".join(str(k) for k in key) + ".npz")
+
+    def get(self, key):
+        """
+        :return: dict of arrays and in-memory objects, only the arrays when restored from disk, None on a miss
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            arrays, objects, _ = self.entries[key]
+            return dict(arrays, **objects)
+        if self.cache_dir is not None and os.path.exists(self.path(key)):
+            with np.load(self.path(key)) as f:
+                arrays = {name: f[name] for name in f.files}
+            self._insert(key, arrays, {})
+            return dict(arrays)
+        return None
+
+    def put(self, key, arrays, objects=None):
+        if key in self.entries:
+            self.evict(key)
+        self._insert(key, arrays, objects or {})
+        if self.cache_dir is not None:
+            np.savez(self.path(key), **arrays)
+
+    def evict(self, key):
+        _, _, nbytes = self.entries.pop(key)
+        self.nbytes -= nbytes
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def _insert(self, key, arrays, objects):
+        nbytes = entry_nbytes(arrays, objects)
+        self.entries[key] = (arrays, objects, nbytes)
+        self.nbytes += nbytes
+        # 超出容量时按最近最少使用的顺序淘汰, 至少保留刚插入的条目
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            self.evict(next(iter(self.entries)))
+
+
+def entry_nbytes(arrays, objects):
+    """
+    估计一个条目占用的内存: 数组按底层缓冲区计数, 对象中与 arrays 共用的数组不重复计入
+    """
+    seen = set()
+    return sum(object_nbytes(array, seen) for array in arrays.values()) + \
+        sum(object_nbytes(obj, seen) for obj in objects.values())
+
+
+def object_nbytes(obj, seen):
+    """
+    :param seen: 已计入的数组缓冲区地址与对象 id
+    :return: numpy 数组为 nbytes; 内存中的 R-tree 按条目数估计; 其余对象为自身大小加上其属性与元素
+    """
+    if isinstance(obj, np.ndarray):
+        address = ("buffer", obj.__array_interface__["data"][0])
+        if address in seen:
+            return 0
+        seen.add(address)
+        return obj.nbytes
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, index.Index):
+        if obj.properties.storage == index.RT_Memory:
+            return len(obj) * RTREE_ENTRY_BYTES
+        return sys.getsizeof(obj)
+    nbytes = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return nbytes + sum(object_nbytes(value, seen) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return nbytes + sum(object_nbytes(item, seen) for item in obj)
+    if hasattr(obj, "__dict__"):
+        return nbytes + object_nbytes(vars(obj), seen)
+    return nbytes
@@ -6,7 +6,8 @@ import settings
 warnings.filterwarnings("ignore")
 import matplotlib.pyplot as plt
 from tqdm import tqdm
-from utils.trajectory import Trajectory
+from utils.trajectory import TrajectoryStore
+from preprocess.h5consolidate import is_consolidated, memmap_dataset
 
 
 def set_region_args(scale, time_size):
@@ -35,37 +36,115 @@ def set_region_args(scale, time_size):
     parser.add_argument("-time_span", type=int, default=86400 // time_size, help="Length of each time period")
     # Spatio-Temporal grid parameter
     parser.add_argument("-map_cell_size", type=int, default=maxx*maxy*time_size, help="Number of space-time cells (x,y,t) three dimensions")
-    args = parser.parse_args()
+    # 忽略调用脚本自己的命令行参数
+    args, _ = parser.parse_known_args()
     return args
 
 
 class Loader:
 
-    def __init__(self, scale, time_size):
+    def __init__(self, scale, time_size, h5path=None):
         self.args = set_region_args(scale, time_size)
         self.h5path = os.path.join("/data/Like/", self.args.city + ".h5")
         # self.h5path = os.path.join("E:\\data\porto.h5")
+        # 优先使用 preprocess/h5consolidate 生成的合并布局文件
+        packed_path = os.path.join("/data/Like/", self.args.city + "_packed.h5")
+        if os.path.exists(packed_path):
+            self.h5path = packed_path
+        if h5path is not None:
+            self.h5path = h5path
         # print("parameter setting： \n", self.args)
 
     # load trajectory instance, return a set of trajectories
-    def load(self, read_trj_num):
-        f = h5py.File(self.h5path, 'r')
-        trj_nums = min(f.attrs['num'], read_trj_num)
-        trajectory_set = [Trajectory(ii) for ii in range(trj_nums)]
-        # for i in tqdm(range(trj_nums), desc='read lon, lat'):
-        for i in range(trj_nums):
+    def load(self, read_trj_num, ids=None, mmap=False, tokenize=True):
+        """
+        :param read_trj_num: read the first read_trj_num trajectories
+        :param ids: read this subset of trajectory ids (0-based) instead of a prefix
+        :param mmap: memory-map the points of an uncompressed consolidated file instead of reading them
+        :param tokenize: tokenize the points, otherwise the store is returned without tokens
+        """
+        with h5py.File(self.h5path, 'r') as f:
+            if ids is None:
+                ids = np.arange(min(f.attrs['num'], read_trj_num))
+            ids = np.asarray(ids, dtype=np.int64)
+            if is_consolidated(f):
+                lon_lat, timestamps, offsets = self.read_consolidated(f, ids, mmap)
+            else:
+                lon_lat, timestamps, offsets = self.read_trips(f, ids)
+        trajectory_set = TrajectoryStore(lon_lat, timestamps, offsets)
+        if not tokenize:
+            return trajectory_set
+        return self.tokenize(trajectory_set)
+
+    def read_trips(self, f, ids):
+        """Read the per-trajectory layout trips/%d, timestamps/%d (1-based)"""
+        trips, timestamps = [], []
+        # for i in tqdm(ids, desc='read lon, lat'):
+        for i in ids:
             trip = np.array(f.get('trips/%d' % (i+1)))[:settings.max_len] # numpy n*2, [[lon,lat],[lon,lat]]
-            trajectory_set[i].set_lon_lat(trip)
-        # for i in tqdm(range(trj_nums), desc='read timestamp'):
-        for i in range(trj_nums):
+            trips.append(trip)
             ts = np.array(f.get('timestamps/%d' % (i+1)))[:settings.max_len] # numpy n*1
-            trajectory_set[i].set_time_seq(ts)
-        for i in range(trj_nums):
-        # for i in tqdm(range(trj_nums), desc='get token seqs'):
-            trj = trajectory_set[i]
-            trj.token_seq = self.trip2mapIDs(trj.lon_lat_seq, trj.time_seq)[:settings.max_len]
-            # trj.token_seq = self.trip2spaceIDs(trj.lon_lat_seq)
-        return trajectory_set
+            timestamps.append(ts)
+        offsets = np.concatenate([[0], np.cumsum([len(ts) for ts in timestamps])])
+        return np.concatenate(trips).reshape(-1, 2), np.concatenate(timestamps), offsets
+
+    def read_consolidated(self, f, ids, mmap=False, max_gap=4096):
+        """
+        Read the consolidated layout (points, timestamps, offsets), keeping the first max_len points of each trajectory.
+        The point ranges of ids are merged into runs, a run is read with one slice, so a prefix or a dense subset
+        is one read and a sparse subset never reads the points between far apart trajectories
+        :param max_gap: ranges less than max_gap points apart are read in the same run
+        """
+        all_offsets = f['offsets'][:]
+        if len(ids) == 0:
+            return np.zeros((0, 2)), np.zeros(0), np.zeros(1, dtype=np.int64)
+        starts = all_offsets[ids]
+        sizes = np.minimum(all_offsets[ids + 1] - starts, settings.max_len)
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        order = np.argsort(starts, kind="stable")
+        run_starts, run_ends = starts[order], np.maximum.accumulate(starts[order] + sizes[order])
+        first = np.flatnonzero(np.concatenate([[True], run_starts[1:] > run_ends[:-1] + max_gap]))
+        lo, hi = run_starts[first], run_ends[np.append(first[1:], len(order)) - 1]
+        if mmap:
+            points, timestamps = memmap_dataset(f['points']), memmap_dataset(f['timestamps'])
+        else:
+            points, timestamps = f['points'], f['timestamps']
+        if len(first) == 1 and offsets[-1] == hi[0] - lo[0] and np.all(starts - lo[0] == offsets[:-1]):
+            # 连续读取且无需截断, 直接使用 (可能是内存映射的) 切片
+            return points[lo[0]:hi[0]], timestamps[lo[0]:hi[0]], offsets
+        # 各段读入后首尾相接, 每条轨迹的起点换算为在拼接结果中的位置
+        run_offsets = np.concatenate([[0], np.cumsum(hi - lo)])
+        run = np.empty(len(ids), dtype=np.int64)
+        run[order] = np.repeat(np.arange(len(first)), np.diff(np.append(first, len(order))))
+        starts = starts - lo[run] + run_offsets[run]
+        points = np.concatenate([points[a:b] for a, b in zip(lo, hi)])
+        timestamps = np.concatenate([timestamps[a:b] for a, b in zip(lo, hi)])
+        index = np.repeat(starts - offsets[:-1], sizes) + np.arange(offsets[-1])
+        return points[index], timestamps[index], offsets
+
+    def time_bounds(self, read_trj_num, batch_size=65536):
+        """
+        Read only the first and the last timestamp of the first max_len points of each trajectory, batch_size
+        trajectories at a time
+        :return: (n, 2) [start_time, end_time], the time columns of TrajectoryStore.mbrs for load(read_trj_num)
+        """
+        with h5py.File(self.h5path, 'r') as f:
+            num = min(int(f.attrs['num']), read_trj_num)
+            bounds = np.empty((num, 2))
+            if not is_consolidated(f):
+                for i in range(num):
+                    ts = np.array(f.get('timestamps/%d' % (i+1))).reshape(-1)[:settings.max_len]
+                    bounds[i] = ts[0], ts[-1]
+                return bounds
+            offsets = f['offsets'][:num + 1]
+            for start in range(0, num, batch_size):
+                end = min(start + batch_size, num)
+                lo = offsets[start]
+                ts = f['timestamps'][lo:offsets[end]]
+                first = offsets[start:end] - lo
+                last = first + np.minimum(np.diff(offsets[start:end + 1]), settings.max_len) - 1
+                bounds[start:end, 0], bounds[start:end, 1] = ts[first], ts[last]
+            return bounds
 
     def observe(self, raw_trj, map_ids):
         plt.figure()
@@ -85,37 +164,39 @@ class Loader:
         ****************************************************************************************************************************************************
         '''
     '''Latitude and longitude are converted into meters and mapped onto the plane plan (116.3, 40.0)->(4,8)'''
+    '''The transformation functions accept scalars or numpy arrays, arrays are converted element-wise'''
 
     def lonlat2xyoffset(self, lon, lat):
-        x_offset = round((lon - self.args.lons[0]) / self.args.scale)
-        y_offset = round((lat - self.args.lats[0]) / self.args.scale)
-        return int(x_offset), int(y_offset)
+        # np.rint rounds half to even, the same as the built-in round
+        x_offset = np.rint((np.asarray(lon) - self.args.lons[0]) / self.args.scale)
+        y_offset = np.rint((np.asarray(lat) - self.args.lats[0]) / self.args.scale)
+        return as_int(x_offset), as_int(y_offset)
 
     ''' Meters convert to latitude and longitude  (4,8)-> (116.3, 40.0)'''
 
     def xyoffset2lonlat(self, x_offset, y_offset):
-        lon = self.args.lons[0] + x_offset * self.args.scale
-        lat = self.args.lats[0] + y_offset * self.args.scale
-        return lon, lat
+        lon = self.args.lons[0] + np.asarray(x_offset) * self.args.scale
+        lat = self.args.lats[0] + np.asarray(y_offset) * self.args.scale
+        return as_float(lon), as_float(lat)
 
     ''' (x_offset,y_offset) -> space_cell_id  (4,8)->116'''
 
     def offset2spaceId(self, x_offset, y_offset):
-        return int(y_offset * self.args.numx + x_offset)
+        return as_int(np.asarray(y_offset) * self.args.numx + x_offset)
 
     ''' space_cell_id -->(x,y) 116->(4.8)'''
 
     def spaceId2offset(self, space_cell_id):
-        y_offset = space_cell_id // self.args.numx
-        x_offset = space_cell_id % self.args.numx
-        return int(x_offset), int(y_offset)
+        y_offset = np.asarray(space_cell_id) // self.args.numx
+        x_offset = np.asarray(space_cell_id) % self.args.numx
+        return as_int(x_offset), as_int(y_offset)
 
     ''' gps--> space_cell_id  116.3,40->116'''
 
     def gps2spaceId(self, lon, lat):
         x_offset, y_offset = self.lonlat2xyoffset(lon, lat)
         space_cell_id = self.offset2spaceId(x_offset, y_offset)
-        return int(space_cell_id)
+        return space_cell_id
 
     '''space_cell_id -->gps 116->116.3,40'''
 
@@ -127,28 +208,56 @@ class Loader:
     ''' space_cell_id+t --> map_id  116,10->1796'''
 
     def spaceId2mapId(self, space_id, t):
-        return int(space_id + t * self.args.space_cell_size)
+        return as_int(np.asarray(space_id) + np.asarray(t) * self.args.space_cell_size)
 
     ''' map_id -->space_cell_id  1796-> 116'''
 
     def mapId2spaceId(self, map_id):
-        return int(map_id % self.args.space_cell_size)
+        return as_int(np.asarray(map_id) % self.args.space_cell_size)
+
+    ''' map_id -->time period  1796-> 10'''
+
+    def mapId2time(self, map_id):
+        return as_int(np.asarray(map_id) // self.args.space_cell_size)
+
+    ''' trip (n, 2) --> space_cell_ids (n,) uint32'''
 
     def trip2spaceIDs(self, trip):
-        space_ids = []
-        for (lon, lat) in trip:
-            space_id = self.gps2spaceId(lon, lat)
-            space_ids.append(space_id)
-        return space_ids
+        trip = np.asarray(trip).reshape(-1, 2)
+        return self.gps2spaceId(trip[:, 0], trip[:, 1]).astype(np.uint32)
+
+    ''' trip (n, 2), ts (n,) --> map_ids (n,) uint32, also used to tokenize all points of a dataset at once'''
 
     def trip2mapIDs(self, trip, ts):
-        map_ids = []
-        for (lon, lat), t in zip(trip, ts):
-            space_id = self.gps2spaceId(lon, lat)
-            t = int(t) // self.args.time_span
-            map_id = int(self.spaceId2mapId(space_id, t))
-            map_ids.append(map_id)
-        return map_ids
+        space_ids = self.trip2spaceIDs(trip).astype(np.int64)
+        t = np.asarray(ts).astype(np.int64) // self.args.time_span
+        return self.spaceId2mapId(space_ids, t).astype(np.uint32)
+
+    ''' map_ids (n,) --> trip (n, 2) of cell corners, ts (n,) of period starts'''
+
+    def mapIDs2trip(self, map_ids):
+        lon, lat = self.spaceId2gps(self.mapId2spaceId(map_ids))
+        ts = self.mapId2time(map_ids) * self.args.time_span
+        return np.stack([lon, lat], axis=-1), ts
+
+    def tokenize(self, trajectory_set):
+        '''Re-tokenize every point of a TrajectoryStore with this loader's scale and time_size'''
+        trajectory_set.token = self.trip2mapIDs(trajectory_set.lon_lat, trajectory_set.time)
+        return trajectory_set
+
+
+def as_int(x):
+    '''int for a scalar, int64 array for an array'''
+    if np.ndim(x) == 0:
+        return int(x)
+    return np.asarray(x).astype(np.int64)
+
+
+def as_float(x):
+    '''float for a scalar, float64 array for an array'''
+    if np.ndim(x) == 0:
+        return float(x)
+    return np.asarray(x, dtype=float)
 
 
 if __name__ == "__main__":
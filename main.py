@@ -1,44 +1,118 @@
 from loader.data_loader import Loader
-from indexing.myRtree import my_rtree
+from loader.cache import DatasetCache
+from utils.trajectory import TrajectoryStore
+from indexing.myRtree import bulk_rtree, open_rtree, rtree_path, self_join
+from indexing.grid_join import grid_candidates, compare_candidates
+from indexing.segments import segment_candidates
+from utils import evaluation
+from utils.profiler import get_profiler
 import numpy as np
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 import time
+import os
+import argparse
 from baselines.ES_ECMC_multi import ECMC
 from baselines.LCS_SCAN import SCAN
+from baselines.ES_ECMC_stream import ECMC as StreamECMC
+from indexing.incremental_scan import IncrementalSCAN
+from indexing.scan import get_communities
+import heapq
+from baselines import sharded
+from baselines.tiled import TileDriver
 from baselines.GS_ACMC import ACMC
+from benchmark import planted_groups
 import settings as ss
 
+dataset_cache = DatasetCache(ss.cache_bytes, ss.cache_dir)
+# 可替代 R-tree intersect_trjs 的候选生成方式
+candidate_generators = {"grid": grid_candidates, "segment": segment_candidates}
+
 
 def recall(real_label, pred_label):
-    hit_count = 0
-    unhit_count = 0
-    for ii in  range(len(real_label)):
-        for jj in range(ii+1, len(real_label)):
-            if real_label[ii] == -1 or real_label[jj] == -1:
-                continue
-            if real_label[ii] == real_label[jj]:
-                if pred_label[ii] == pred_label[jj] and pred_label[ii] != -1:
-                    hit_count += 1
-                else:
-                    unhit_count += 1
-    if (hit_count+unhit_count) == 0:
-        return 0
+    # 由列联表 O(n) 统计, 与逐对统计的结果一致; precision / F1 / ARI 见 evaluation.evaluate
+    return evaluation.recall(real_label, pred_label)
+
+
+def build_index(trajectory_set, city, num):
+    # 批量装载建立索引, 设置 index_dir 时按 (city, num) 持久化并复用已有索引
+    if ss.index_dir is None:
+        return bulk_rtree(trajectory_set.mbrs)
+    path = rtree_path(ss.index_dir, city, num)
+    if os.path.exists(path + ".index"):
+        return open_rtree(path)
+    return bulk_rtree(trajectory_set.mbrs, path)
+
+
+def load_index(scale, time_size, num, candidates=None, profile=False):
+    """
+    加载数据并建立索引, 结果缓存在 dataset_cache 中:
+    原始点、MBR 索引与相交序列按 (city, num) 缓存并原样复用, token 按 (city, num, scale, time_size) 缓存,
+    复用时只重置每次运行写入的 candiate_match / cluster_id
+    :param candidates: (name, dist_error, time_error, min_lifetime) 时用 candidate_generators[name] 生成的候选
+                       代替 R-tree 的 intersect_trjs, name 为 "grid" (网格哈希连接) 或 "segment" (片段级 MBR 索引)
+    :param profile: 记录各阶段耗时与计数, 作为第三个返回值
+    :return: trajectory_set, idx (, report)
+    """
+    profiler = get_profiler(profile)
+    loader = Loader(scale, time_size, ss.h5path)
+    # 指定 h5path 时以文件名代替城市名区分数据集
+    name = loader.args.city if ss.h5path is None else os.path.splitext(os.path.basename(ss.h5path))[0]
+    data_key = (name, num)
+    token_key = data_key + (scale, time_size)
+    entry = dataset_cache.get(data_key)
+    if entry is None:
+        # 加载数据
+        with profiler.stage("load"):
+            trajectory_set = loader.load(num)
+        with profiler.stage("index"):
+            idx = build_index(trajectory_set, *data_key)
+        # 索引批量自连接, 对每条轨迹记录其有时空交集的其他轨迹id序列
+        with profiler.stage("self_join"):
+            trajectory_set.set_intersections(*self_join(idx, trajectory_set.mbrs))
+        trajectory_set.intersect_key = data_key
+        entry = trajectory_set.to_arrays()
+        dataset_cache.put(data_key, entry, {"trajectory_set": trajectory_set, "idx": idx})
+        dataset_cache.put(token_key, {"token": trajectory_set.token})
     else:
-        # print(hit_count, unhit_count)
-        return hit_count/(hit_count+unhit_count)
-
-
-def load_index(scale, time_size, num):
-    # 加载数据
-    trajectory_set = Loader(scale, time_size).load(num)
-    # 建立索引
-    idx = my_rtree()
-    for trj in trajectory_set:
-        idx.insert(trj.id, trj.mbr)
-    # 索引查询, 对每条轨迹记录其有时空交集的其他轨迹id序列
-    for trj in trajectory_set:
-        trj.set_intersect_trjs(list(idx.intersection(trj.mbr)))
+        profiler.count("cache_hits")
+        if "trajectory_set" in entry:
+            trajectory_set, idx = entry["trajectory_set"], entry["idx"]
+            trajectory_set.reset()
+        else:
+            # 从磁盘缓存还原, 相交序列已还原, 只需重建内存中的 R-tree
+            trajectory_set = TrajectoryStore.from_arrays(entry)
+            trajectory_set.intersect_key = data_key
+            with profiler.stage("index"):
+                idx = build_index(trajectory_set, *data_key)
+            dataset_cache.put(data_key, entry, {"trajectory_set": trajectory_set, "idx": idx})
+        tokens = dataset_cache.get(token_key)
+        if tokens is None:
+            with profiler.stage("tokenize"):
+                loader.tokenize(trajectory_set)
+            dataset_cache.put(token_key, {"token": trajectory_set.token})
+        else:
+            trajectory_set.token = tokens["token"]
+    # 选择候选来源: R-tree 相交序列或其他候选生成方式, 来源未变时不重复设置
+    intersect_key = data_key if candidates is None else data_key + tuple(candidates)
+    if trajectory_set.intersect_key != intersect_key:
+        if candidates is None:
+            trajectory_set.set_intersections(entry["indptr"], entry["indices"])
+        else:
+            generated = dataset_cache.get(intersect_key)
+            if generated is None:
+                generate = candidate_generators[candidates[0]]
+                with profiler.stage("candidates"):
+                    generated = dict(zip(("indptr", "indices"), generate(trajectory_set, *candidates[1:])))
+                dataset_cache.put(intersect_key, generated)
+            print("{} candidates: {}".format(candidates[0], compare_candidates(entry["indptr"], generated["indptr"])))
+            trajectory_set.set_intersections(generated["indptr"], generated["indices"])
+        trajectory_set.intersect_key = intersect_key
+    if profile:
+        profiler.count("trajectories", len(trajectory_set))
+        profiler.count("points", trajectory_set.offsets[-1])
+        profiler.count("index_candidates", trajectory_set.intersect_count.sum() - len(trajectory_set))
+        return trajectory_set, idx, profiler.report()
     return trajectory_set, idx
 
 import datetime
@@ -100,6 +174,15 @@ class Evaluator:
     def vary_min_life_times(self):
         res = []
         times = []
+        # 轨迹对得分 (LCS 长度 / token 重合数) 只在取值最小时计算一次, 每个取值由筛选得分得到
+        trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
+        t1 = time.time()
+        e_scores = ECMC(min(ss.min_life_times), ss.min_group_trj_num, ss.dist_error, ss.time_error).get_scores(
+            trajectory_set)
+        t2 = time.time()
+        s_scores = SCAN(min(ss.min_life_times), ss.min_group_trj_num).get_scores(trajectory_set)
+        t3 = time.time()
+        e_score_time, s_score_time = t2 - t1, t3 - t2
         for min_lifetime in ss.min_life_times:
             print("min_lifetime: {}".format(min_lifetime))
             # 随机加载数据
@@ -107,14 +190,14 @@ class Evaluator:
             t1 = time.time()
             e_pairs, e_groups, e_labels = ECMC(min_lifetime, ss.min_group_trj_num, ss.dist_error,
                                                ss.time_error).get_groups(
-                trajectory_set)
+                trajectory_set, e_scores)
             t2 = time.time()
             trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
             t3 = time.time()
             s_pairs, s_groups, s_labels = SCAN(min_lifetime, ss.min_group_trj_num).get_groups(
-            trajectory_set, ss.ep)
+            trajectory_set, ss.ep, s_scores)
             t4 = time.time()
-            times.append([t2-t1,t4-t3])
+            times.append([t2 - t1 + e_score_time, t4 - t3 + s_score_time])
             r = recall(e_labels, s_labels)
             print("Recall: {}".format(r))
             res.append(r)
@@ -123,6 +206,15 @@ class Evaluator:
     def vary_min_group_trj_nums(self):
         res = []
         times = []
+        # 轨迹对得分与 min_lifetime 阈值无关, 只计算一次, 每个取值由筛选得分得到
+        trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
+        t1 = time.time()
+        e_scores = ECMC(ss.min_lifetime, min(ss.min_group_trj_nums), ss.dist_error, ss.time_error).get_scores(
+            trajectory_set)
+        t2 = time.time()
+        s_scores = SCAN(ss.min_lifetime, min(ss.min_group_trj_nums)).get_scores(trajectory_set)
+        t3 = time.time()
+        e_score_time, s_score_time = t2 - t1, t3 - t2
         for min_group_trj_num in ss.min_group_trj_nums:
             print("min_group_trj_num: {}".format(min_group_trj_num))
             # 随机加载数据
@@ -130,14 +222,14 @@ class Evaluator:
             t1 = time.time()
             e_pairs, e_groups, e_labels = ECMC(ss.min_lifetime, min_group_trj_num, ss.dist_error,
                                                ss.time_error).get_groups(
-                trajectory_set)
+                trajectory_set, e_scores)
             t2 = time.time()
             trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
             t3 = time.time()
             s_pairs, s_groups, s_labels = SCAN(ss.min_lifetime, min_group_trj_num).get_groups(
-            trajectory_set, ss.ep)
+            trajectory_set, ss.ep, s_scores)
             t4 = time.time()
-            times.append([t2 - t1, t4 - t3])
+            times.append([t2 - t1 + e_score_time, t4 - t3 + s_score_time])
             r = recall(e_labels, s_labels)
             print("Recall: {}".format(r))
             res.append(r)
@@ -146,27 +238,168 @@ class Evaluator:
     def vary_eps(self):
         res = []
         times = []
+        # ECMC 与 SCAN 的轨迹对图都与 ep 无关, 各计算一次; SCAN 建立 GS*-Index 后每个 ep 直接查询
+        trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
+        t1 = time.time()
+        e_pairs, e_groups, e_labels = ECMC(ss.min_lifetime, ss.min_group_trj_num, ss.dist_error,
+                                           ss.time_error).get_groups(
+            trajectory_set)
+        t2 = time.time()
+        trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
+        t3 = time.time()
+        scan = SCAN(ss.min_lifetime, ss.min_group_trj_num)
+        s_pairs, index = scan.get_index(trajectory_set)
+        index_time = time.time() - t3
         for ep in ss.eps:
             print("ep: {}".format(ep))
-            # 随机加载数据
-            trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
-            t1 = time.time()
-            e_pairs, e_groups, e_labels = ECMC(ss.min_lifetime, ss.min_group_trj_num, ss.dist_error,
-                                               ss.time_error).get_groups(
-                trajectory_set)
-            t2 = time.time()
-            trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
             t3 = time.time()
-            s_pairs, s_groups, s_labels = SCAN(ss.min_lifetime, ss.min_group_trj_num).get_groups(
-            trajectory_set, ep)
+            s_pairs, s_groups, s_labels = scan.get_groups_from_index(trajectory_set, s_pairs, index, ep)
             t4 = time.time()
-            times.append([t2 - t1, t4 - t3])
+            times.append([t2 - t1, t4 - t3 + index_time])
             r = recall(e_labels, s_labels)
             print("Recall: {}".format(r))
             res.append(r)
         print(res, times)
 
+    def vary_shards(self, shard_buckets_list=(1, 2, 4)):
+        # 按时间分片并行计算轨迹对, 分组与不分片的 ES-ECMC 一致; 每个分片包含 shard_buckets 个 time_span
+        res = []
+        times = []
+        time_span = Loader(ss.scale, ss.time_size).args.time_span
+        trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
+        t1 = time.time()
+        e_pairs, e_groups, e_labels = ECMC(ss.min_lifetime, ss.min_group_trj_num, ss.dist_error,
+                                           ss.time_error).get_groups(trajectory_set)
+        base_time = time.time() - t1
+        for shard_buckets in shard_buckets_list:
+            print("shard_buckets: {}".format(shard_buckets))
+            t1 = time.time()
+            # 各分片的工作进程自行读取本片时间窗内的轨迹, 主进程只合并轨迹对
+            p_pairs, p_groups, p_labels = sharded.get_groups(
+                ECMC(ss.min_lifetime, ss.min_group_trj_num, ss.dist_error, ss.time_error),
+                Loader(ss.scale, ss.time_size, ss.h5path), ss.num, time_span, shard_buckets=shard_buckets,
+                processes=ss.process_num)
+            times.append([base_time, time.time() - t1])
+            res.append(list(p_labels) == list(e_labels))
+        print(res, times)
 
+    def vary_tiles(self, tiles_list=((2, 2), (4, 4), (8, 8)), work_dir="tiles"):
+        # 按空间分块的 map/reduce 计算候选与轨迹对, 每块带 dist_error 的 halo;
+        # 分组应与单个块 (1, 1) 时一致, 召回率相对于 R-tree 候选上的 ES-ECMC
+        res = []
+        times = []
+        trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
+        e_pairs, e_groups, e_labels = ECMC(ss.min_lifetime, ss.min_group_trj_num, ss.dist_error,
+                                           ss.time_error).get_groups(trajectory_set)
+        base_labels = None
+        for tiles in ((1, 1),) + tuple(tiles_list):
+            print("tiles: {}".format(tiles))
+            trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
+            t1 = time.time()
+            driver = TileDriver(ECMC(ss.min_lifetime, ss.min_group_trj_num, ss.dist_error, ss.time_error),
+                                os.path.join(work_dir, "%d_%d" % tiles), tiles, halo=ss.dist_error)
+            p_pairs, p_groups, p_labels = driver.get_groups(trajectory_set)
+            times.append(time.time() - t1)
+            if base_labels is None:
+                base_labels = list(p_labels)
+            res.append([list(p_labels) == base_labels, recall(e_labels, p_labels)])
+        print(res, times)
+
+    def vary_windows(self, windows=(0, 1800, 3600)):
+        # 流式 ES-ECMC: 轨迹按起始时间依次到达, 只在 window 秒的滑动窗口内增量维护群组;
+        # 每条轨迹的标签取其最后一次所在的群组, 召回率相对于批处理的 ES-ECMC, 耗时为每条轨迹的平均处理时间
+        res = []
+        times = []
+        trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
+        e_pairs, e_groups, e_labels = ECMC(ss.min_lifetime, ss.min_group_trj_num, ss.dist_error,
+                                           ss.time_error).get_groups(trajectory_set)
+        for window in windows:
+            print("window: {}".format(window))
+            stream = StreamECMC(ss.min_lifetime, ss.min_group_trj_num, ss.dist_error, ss.time_error, window)
+            labels = [-1] * len(trajectory_set)
+            event_count = 0
+            t1 = time.time()
+            for trj_id, events in stream.run(trajectory_set):
+                event_count += len(events)
+                for kind, group_id, members in events:
+                    if kind != "break":
+                        for member in members:
+                            labels[member] = group_id
+            times.append((time.time() - t1) / len(trajectory_set))
+            r = recall(e_labels, labels)
+            print("Recall: {}\tevents: {}".format(r, event_count))
+            res.append(r)
+        print(res, times)
+
+    def vary_churn(self, batch_sizes=(100, 1000, 10000), window=3600):
+        # 增量 SCAN: SCAN 的轨迹对按较晚一端的起始时间分批到达, 较早一端的起始时间早于 (当前时间 - window) 的边被删除;
+        # 每批由 IncrementalSCAN.update 维护社区, 与在当前的边上重新 get_communities 比较耗时,
+        # 召回率为最后一批时增量结果相对于重新计算结果的社区一致程度
+        res = []
+        times = []
+        trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
+        pairs = SCAN(ss.min_lifetime, ss.min_group_trj_num).get_pairs(trajectory_set)
+        pairs = np.unique(np.sort(np.array(pairs, dtype=np.int64).reshape(-1, 2), axis=1), axis=0)
+        starts = trajectory_set.mbrs[:, 4][pairs]
+        order = np.argsort(starts.max(axis=1), kind="stable")
+        pairs, arrival, departure = pairs[order].tolist(), starts.max(axis=1)[order], starts.min(axis=1)[order]
+        for batch_size in batch_sizes:
+            print("batch_size: {}".format(batch_size))
+            algorithm = IncrementalSCAN(ss.ep, ss.min_group_trj_num)
+            # 已加入的边按较早一端的起始时间排列, 依次过期
+            alive, expiry = set(), []
+            update_time = scratch_time = 0
+            communities = []
+            for begin in range(0, len(pairs), batch_size):
+                end = min(begin + batch_size, len(pairs))
+                now = arrival[end - 1]
+                removed = []
+                while expiry and expiry[0][0] < now - window:
+                    removed.append(pairs[heapq.heappop(expiry)[1]])
+                fresh = [k for k in range(begin, end) if departure[k] >= now - window]
+                for k in fresh:
+                    heapq.heappush(expiry, (departure[k], k))
+                added = [pairs[k] for k in fresh]
+                alive.difference_update(map(tuple, removed))
+                alive.update(map(tuple, added))
+                t1 = time.time()
+                algorithm.update(added=added, removed=removed)
+                update_time += time.time() - t1
+                t1 = time.time()
+                communities, hubs, outliers = get_communities(sorted(alive), ss.min_group_trj_num, ss.ep)
+                scratch_time += time.time() - t1
+            labels, i_labels = [-1] * len(trajectory_set), [-1] * len(trajectory_set)
+            for ii, community in enumerate(communities):
+                for trj_id in community:
+                    labels[trj_id] = ii
+            for ii, community in enumerate(algorithm.get_communities()[0]):
+                for trj_id in community:
+                    i_labels[trj_id] = ii
+            times.append([update_time, scratch_time])
+            r = recall(labels, i_labels)
+            print("Recall: {}\tedges: {}".format(r, len(alive)))
+            res.append(r)
+        print(res, times)
+
+    def vary_planted(self):
+        # 在带有植入群组的合成数据 (preprocess/synthetic.py 生成, 以 -data 指定) 上,
+        # ES-ECMC 与 LCS_SCAN 的分组相对于植入群组的 recall / precision / F1 / ARI
+        planted = planted_groups(Loader(ss.scale, ss.time_size, ss.h5path).h5path)
+        if planted is None:
+            raise ValueError("the h5 file has no planted groups, generate one with preprocess/synthetic.py")
+        res = []
+        for num in ss.nums:
+            print("num: {}".format(num))
+            trajectory_set, idx = load_index(ss.scale, ss.time_size, num)
+            e_pairs, e_groups, e_labels = ECMC(ss.min_lifetime, ss.min_group_trj_num, ss.dist_error,
+                                               ss.time_error).get_groups(trajectory_set)
+            trajectory_set, idx = load_index(ss.scale, ss.time_size, num)
+            s_pairs, s_groups, s_labels = SCAN(ss.min_lifetime, ss.min_group_trj_num).get_groups(
+                trajectory_set, ss.ep)
+            truth = planted[:len(trajectory_set)]
+            res.append([evaluation.evaluate(truth, e_labels), evaluation.evaluate(truth, s_labels)])
+            print("ECMC: {}\tSCAN: {}".format(*res[-1]))
+        print(res)
 
 
 if __name__ == "__main__":
@@ -180,12 +413,17 @@ if __name__ == "__main__":
     # eps = [0.5]
     # find_best(nums, time_sizes, scales, eps, dist_errors, time_errors)
 
-    # evaluate
+    # evaluate, e.g. python main.py -experiments vary_windows
+    parser = argparse.ArgumentParser(description="main.py")
+    parser.add_argument("-experiments", nargs="+",
+                        default=["vary_min_life_times", "vary_min_group_trj_nums", "vary_eps", "vary_nums"],
+                        help="Evaluator methods to run in order")
+    parser.add_argument("-data", default=ss.h5path, help="h5 file to read instead of the city's file")
+    args, _ = parser.parse_known_args()
+    ss.h5path = args.data
     E = Evaluator(ss.n)
-    E.vary_min_life_times()
-    E.vary_min_group_trj_nums()
-    E.vary_eps()
-    E.vary_nums()
+    for experiment in args.experiments:
+        getattr(E, experiment)()
 
     # trajectory_set, idx = load_index(ss.scale, ss.time_size, ss.num)
     # t3 = time.time()
@@ -0,0 +1,128 @@
+"""
+Rewrite the per-trajectory h5 output of preprocess into one consolidated layout
+
+points      (N, 2) [[longitude, latitude], ...] of all trajectories, concatenated
+
+timestamps  (N,) [ts, ts, ...] of all trajectories, concatenated
+
+offsets     (num+1,) trajectory i (0-based) is [offsets[i], offsets[i+1])
+
+f.attrs['num']  ：The total number of valid tracks recorded
+"""
+import h5py
+import numpy as np
+from tqdm import tqdm
+import os
+import time
+
+
+def is_consolidated(f):
+    """Whether an opened h5 file uses the consolidated layout"""
+    return 'offsets' in f
+
+
+def memmap_dataset(dataset):
+    """
+    Memory-map an uncompressed contiguous dataset (written with contiguous=True) as a read-only numpy array
+    """
+    offset = dataset.id.get_offset()
+    if offset is None or dataset.chunks is not None:
+        raise ValueError("dataset %s is chunked or empty and cannot be memory-mapped" % dataset.name)
+    return np.memmap(dataset.file.filename, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape)
+
+
+def cut_lengths(rng, lengths, min_length, max_length):
+    """
+    Cut every day trajectory into pieces of random length in [min_length, max_length) while the rest is not shorter
+    than max_length, the rest is kept if it is not shorter than min_length
+    :param lengths: (g,) lengths of the day trajectories
+    :return: starts, ends of the pieces relative to each day trajectory, and the day trajectory each piece belongs to
+    """
+    if len(lengths) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    k = int(lengths.max()) // min_length + 1
+    # prefix[:, j] is the start of the j-th piece
+    prefix = np.zeros((len(lengths), k + 1), dtype=np.int64)
+    np.cumsum(rng.integers(min_length, max_length, size=(len(lengths), k)), axis=1, out=prefix[:, 1:])
+    cuts = np.sum(lengths[:, None] - prefix >= max_length, axis=1)
+    # pieces [prefix[j], prefix[j+1]) for j < cuts, and the rest [prefix[cuts], length)
+    rows, cols = np.nonzero(np.arange(k + 1) <= cuts[:, None])
+    starts = prefix[rows, cols]
+    ends = np.where(cols < cuts[rows], prefix[rows, np.minimum(cols + 1, k)], lengths[rows])
+    keep = ends - starts >= min_length
+    return starts[keep], ends[keep], rows[keep]
+
+
+class ConsolidatedWriter:
+    """Append batches of (points, timestamps, lengths) to resizable chunked datasets"""
+
+    def __init__(self, f, chunk_points, compression):
+        self.f = f
+        self.points = f.create_dataset("points", (0, 2), maxshape=(None, 2), dtype=float,
+                                       chunks=(chunk_points, 2), compression=compression)
+        self.timestamps = f.create_dataset("timestamps", (0,), maxshape=(None,), dtype=float,
+                                           chunks=(chunk_points,), compression=compression)
+        self.lengths = []
+
+    def append(self, batch):
+        if not batch:
+            return
+        points = np.concatenate([points for points, _, _ in batch])
+        timestamps = np.concatenate([ts for _, ts, _ in batch])
+        lo, hi = self.timestamps.shape[0], self.timestamps.shape[0] + len(timestamps)
+        self.points.resize((hi, 2))
+        self.timestamps.resize((hi,))
+        self.points[lo:hi] = points
+        self.timestamps[lo:hi] = timestamps
+        self.lengths.extend(lengths for _, _, lengths in batch)
+
+    def close(self):
+        lengths = np.concatenate(self.lengths) if self.lengths else np.zeros(0, dtype=np.int64)
+        self.f.create_dataset("offsets", data=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64))
+        self.f.attrs['num'] = len(lengths)
+        return len(lengths)
+
+
+def consolidate(src_path, dst_path, batch_size=10000, chunk_points=65536, compression="gzip", contiguous=False):
+    """
+    Convert trips/%d + timestamps/%d (1-based) into the consolidated layout
+    :param batch_size: number of trajectories read before each append
+    :param chunk_points: chunk length of the points/timestamps datasets
+    :param compression: h5py compression filter of the chunked datasets
+    :param contiguous: write uncompressed contiguous datasets, which Loader can memory-map
+    """
+    with h5py.File(src_path, 'r') as src, h5py.File(dst_path, 'w') as dst:
+        num = int(src.attrs['num'])
+        if contiguous:
+            # contiguous datasets cannot be resized, count the points first
+            total = sum(src['timestamps/%d' % (i + 1)].shape[0] for i in range(num))
+            points = dst.create_dataset("points", (total, 2), dtype=float)
+            timestamps = dst.create_dataset("timestamps", (total,), dtype=float)
+        else:
+            points = dst.create_dataset("points", (0, 2), maxshape=(None, 2), dtype=float,
+                                        chunks=(chunk_points, 2), compression=compression)
+            timestamps = dst.create_dataset("timestamps", (0,), maxshape=(None,), dtype=float,
+                                            chunks=(chunk_points,), compression=compression)
+        offsets = np.zeros(num + 1, dtype=np.int64)
+        for start in tqdm(range(0, num, batch_size), desc='consolidate'):
+            end = min(start + batch_size, num)
+            trips = [np.array(src['trips/%d' % (i + 1)]).reshape(-1, 2) for i in range(start, end)]
+            ts = [np.array(src['timestamps/%d' % (i + 1)]).reshape(-1) for i in range(start, end)]
+            offsets[start + 1:end + 1] = offsets[start] + np.cumsum([len(t) for t in ts])
+            lo, hi = offsets[start], offsets[end]
+            if not contiguous:
+                points.resize((hi, 2))
+                timestamps.resize((hi,))
+            points[lo:hi] = np.concatenate(trips)
+            timestamps[lo:hi] = np.concatenate(ts)
+        dst.create_dataset("offsets", data=offsets)
+        dst.attrs['num'] = num
+    return num
+
+
+if __name__ == "__main__":
+    t1 = time.time()
+    city = "beijing"
+    consolidate(os.path.join("/data/Like/", city + ".h5"), os.path.join("/data/Like/", city + "_packed.h5"))
+    print("The time of consolidate the h5 files ：", time.time()-t1)
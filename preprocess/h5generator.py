@@ -1,27 +1,94 @@
 import pandas as pd
 import os
+from collections import deque
+from multiprocessing import Pool
 from tqdm import tqdm
 import numpy as np
 import h5py
 import warnings
 import time
+from preprocess.h5consolidate import ConsolidatedWriter, cut_lengths
 warnings.filterwarnings("ignore")
 
 
+def parse_file(path, lons_range, lats_range, min_file_rows=100):
+    """
+    Parse one taxi txt file: "id,YYYY-MM-DD HH:MM:SS,longitude,latitude" per line
+    :return: DataFrame [id, day, ts, longitude, latitude] within the range, ts in seconds of the day;
+             None if the file has fewer than min_file_rows records
+    """
+    data = pd.read_csv(path, names=['id', 'times', 'longitude', 'latitude'], header=None)
+    if len(data) < min_file_rows:
+        return None
+    data = data[(lons_range[0] <= data.longitude) & (data.longitude <= lons_range[1]) &
+                (lats_range[0] <= data.latitude) & (data.latitude <= lats_range[1])]
+    times = pd.to_datetime(data['times'], format="%Y-%m-%d %H:%M:%S")
+    day = times.dt.normalize()
+    return pd.DataFrame({'id': data['id'].to_numpy(),
+                         'day': day.to_numpy().astype('datetime64[D]').astype(np.int64),
+                         'ts': (times - day).dt.total_seconds().to_numpy(),
+                         'longitude': data['longitude'].to_numpy(),
+                         'latitude': data['latitude'].to_numpy()})
+
+
+def segment_files(paths, seed, lons_range, lats_range, min_length, max_length, freq_interval):
+    """
+    Worker of Processor: parse a chunk of taxi files and cut them into trajectories
+    1. split by (taxi, day), drop days shorter than min_length
+    2. cut long days into random lengths, see cut_lengths
+    3. drop trajectories having any sampling interval not longer than freq_interval
+    :param seed: seed of this chunk, the output does not depend on which process runs it
+    :return: points (N, 2), timestamps (N,), lengths (num,)
+    """
+    frames = [frame for frame in (parse_file(path, lons_range, lats_range) for path in paths) if frame is not None]
+    if not frames:
+        return np.zeros((0, 2)), np.zeros(0), np.zeros(0, dtype=np.int64)
+    data = pd.concat(frames, ignore_index=True)
+    ids, days, ts = data['id'].to_numpy(), data['day'].to_numpy(), data['ts'].to_numpy()
+    # runs of consecutive records of the same taxi and day
+    bounds = np.flatnonzero((ids[1:] != ids[:-1]) | (days[1:] != days[:-1])) + 1
+    day_starts = np.concatenate([[0], bounds])
+    day_lengths = np.diff(np.concatenate([day_starts, [len(ids)]]))
+    valid = day_lengths >= min_length
+    day_starts, day_lengths = day_starts[valid], day_lengths[valid]
+    rng = np.random.default_rng(seed)
+    starts, ends, rows = cut_lengths(rng, day_lengths, min_length, max_length)
+    starts, ends = starts + day_starts[rows], ends + day_starts[rows]
+    # frequent[i] counts intervals <= freq_interval among records [0, i]
+    frequent = np.concatenate([[0], np.cumsum(np.diff(ts) <= freq_interval)])
+    keep = (frequent[ends - 1] == frequent[starts]) & (ends - starts <= max_length)
+    starts, ends = starts[keep], ends[keep]
+    lengths = ends - starts
+    index = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+    points = np.stack([data['longitude'].to_numpy()[index], data['latitude'].to_numpy()[index]], axis=1)
+    return points, ts[index], lengths
+
+
+def _segment_files(args):
+    return segment_files(*args)
+
+
 class Processor:
     """
-    Read a certain number of Taxi texts and generate track text h5 that meets the conditions
+    Read a certain number of Taxi texts and generate track text h5 that meets the conditions, in the consolidated
+    layout of h5consolidate
+
+    points      (N, 2) [[longitude, latitude], ...] of all trajectories, concatenated
 
-    trips       trips/0 -> [[longitude, latitude], ...]
+    timestamps  (N,) [ts, ts, ...] of all trajectories, concatenated
 
-    timestamps     timestamps/0 -> [ts, ts,...]
+    offsets     (num+1,) trajectory i (0-based) is [offsets[i], offsets[i+1])
 
     f.attrs['num']  ：The total number of valid tracks recorded
+
+    Files are parsed and cut by a process pool, each_read files per task, with at most 2 * processes tasks in flight;
+    results are appended in file order once batch_points points are buffered, so memory is bounded by the tasks in
+    flight and one buffer
     """
-    def __init__(self, read_txt_size, each_read):
+    def __init__(self, read_txt_size, each_read, processes=None, batch_points=1 << 22, chunk_points=65536,
+                 compression="gzip", seed=0):
         self.longtitude_range = [116.25, 116.55]
         self.latitude_range = [39.83, 40.03]
-        self.current_read = 0
         self.each_read = each_read
         self.read_txt_size = read_txt_size
         self.min_length, self.max_length = 20, 100
@@ -29,116 +96,48 @@ class Processor:
         self.valid_trip_nums = 0
         self.h5_filepath = os.path.join("F://data/beijing.h5")
         self.freq_interval = 10
+        self.processes = processes
+        self.batch_points = batch_points
+        self.chunk_points = chunk_points
+        self.compression = compression
+        self.seed = seed
 
     def go(self):
         """
         Read the taxi text in batches and write it into the h5 file
         :return:
         """
-        f = h5py.File(self.h5_filepath, 'w')
-        for ii in tqdm(range(self.read_txt_size//self.each_read)):
-            batch_trjs = self.read_files()
-            self.address_data(batch_trjs)
-            self.output_src_tgr(f)
-            self.current_read += self.each_read
-        f.close()
-        print("\n The total number of writed trajectories："+str(self.valid_trip_nums))
-
-    def read_files(self):
-        """
-        Read a batch of trajectory information from a certain number of taxi txt trajectory text, store it in raw_trjs and return it
-        :return: trjs_raw is a fixed number of txt files, Within the latitude and longitude range, each record is a track within the same day, and meets the minimum length limit of the track
-        """
-        trjs_raw = []
-        all_file_list = os.listdir(self.file_dir)
+        all_file_list = [file for file in os.listdir(self.file_dir) if file.endswith(".txt")]
         all_file_list.sort(key=lambda x: int(x[:-4]))
-        all_file_list = all_file_list[self.current_read:self.current_read + self.each_read]
-        all_data = pd.DataFrame()
-        for file in all_file_list:
-            single_data = pd.read_csv(os.path.join(self.file_dir, file), ['id', 'times', 'longitude', 'latitude'],
-                                      header=None)
-            if (len(single_data)) < 100: continue
-            all_data = all_data.append(single_data)
-
-        all_data = all_data[self.longtitude_range[0] <= all_data.longitude]
-        all_data = all_data[all_data.longitude <= self.longtitude_range[1]]
-        all_data = all_data[self.latitude_range[0] <= all_data.latitude]
-        all_data = all_data[all_data.latitude <= self.latitude_range[1]]
-
-        str_times = list(all_data['times'])
-        longitudes = list(all_data['longitude'])
-        latitudes = list(all_data['latitude'])
-        location = list(zip(longitudes, latitudes))
-
-        i = 0
-        while i < len(location):
-            cur_date = str_times[i]
-            single_taj_with_time = []
-            while i < len(location) and cur_date[:10] == str_times[i][:10]:
-                single_taj_with_time.append((str_times[i][11:], location[i]))
-                i += 1
-            if len(single_taj_with_time) >= self.min_length:
-                trjs_raw.append(single_taj_with_time)
-        return trjs_raw
-
-    def address_data(self, batch_trjs):
-        """
-        Process a batch of tracks, and divide tracks if the tracks are too long
-        """
-        # [Latitude and longitude coordinates, time]
-        self.tajs_with_time = []
-        # [Latitude and longitude coordinates, timestamp of the transformation]
-        self.tajs_with_ts = []
-        for taj in batch_trjs:
-            # A single track cannot exceed the maximum length(max_length). If the length is larger than max_length, it needs to be divided
-            # taj = [('13:33:52', (116.36421999999999, 39.887809999999995))]
-            tajs = []
-            while len(taj) >= self.max_length:
-                # Generate a trajectory of random length according to the length of min-max trajectory
-                rand_len = np.random.randint(self.min_length, self.max_length)
-                tajs.append(taj[0:rand_len])
-                taj = taj[rand_len:]
-            if len(taj) >= self.min_length:
-                tajs.append(taj)
-
-            for ii in range(len(tajs)):
-                # t = [('13:33:52', (116.36421999999999, 39.887809999999995))]
-                t = tajs[ii]
-                single_taj_with_time = []
-                single_taj_with_ts = []
-                # Record the previous timestamp to prevent tracks from being recorded too frequently
-                last_timestamp = 0
-                flag = True
-                for jj in range(len(t)):
-                    time = t[jj][0]
-                    h, m, s = [int(i) for i in time.split(":")]
-                    timestamp = h * 3600 + m * 60 + s
-                    # Filter records frequent trajectory
-                    if timestamp - last_timestamp <= self.freq_interval:
-                        flag = False
-                        break
-                    longtitude, latitude = t[jj][1][0], t[jj][1][1]
-                    single_taj_with_ts.append([longtitude, latitude, timestamp])
-                    single_taj_with_time.append([longtitude, latitude, time])
-                # If there is no more frequent sampling interval in the trajectory, then record
-                if flag:
-                    self.tajs_with_ts.append(single_taj_with_ts)
-                    self.tajs_with_time.append(single_taj_with_time)
-
-    def output_src_tgr(self, f):
-        """
-        Write a batch of trajectories
-        :param f: Target h5 file
-        """
-        for each_taj in self.tajs_with_ts:
-            if self.min_length <= len(each_taj) <= self.max_length:
-                self.valid_trip_nums += 1
-                each_taj = np.array(each_taj)
-                locations = each_taj[:, 0:2]
-                times = [each[0] for each in each_taj[:, 2:3]]
-                f["trips/"+str(self.valid_trip_nums)] = locations
-                f["timestamps/"+str(self.valid_trip_nums)] = times
-        f.attrs['num'] = self.valid_trip_nums
+        all_file_list = all_file_list[:self.read_txt_size]
+        tasks = (([os.path.join(self.file_dir, file) for file in all_file_list[start:start + self.each_read]],
+                  (self.seed, start), self.longtitude_range, self.latitude_range,
+                  self.min_length, self.max_length, self.freq_interval)
+                 for start in range(0, len(all_file_list), self.each_read))
+        processes = self.processes or os.cpu_count()
+        with h5py.File(self.h5_filepath, 'w') as f, Pool(processes) as pool, \
+                tqdm(total=-(-len(all_file_list) // self.each_read)) as bar:
+            writer = ConsolidatedWriter(f, self.chunk_points, self.compression)
+            buffer = []
+            # at most 2 * processes tasks in flight, results are taken in file order
+            pending = deque()
+
+            def collect():
+                buffer.append(pending.popleft().get())
+                bar.update()
+                if sum(len(ts) for _, ts, _ in buffer) >= self.batch_points:
+                    writer.append(buffer)
+                    buffer.clear()
+
+            for task in tasks:
+                pending.append(pool.apply_async(_segment_files, (task,)))
+                while len(pending) >= 2 * processes or (pending and pending[0].ready()):
+                    collect()
+            while pending:
+                collect()
+            writer.append(buffer)
+            self.valid_trip_nums = writer.close()
+        print("\n The total number of writed trajectories："+str(self.valid_trip_nums))
 
 
 class ProcessorTester:
@@ -152,9 +151,10 @@ class ProcessorTester:
 
     def observe(self):
         with h5py.File(self.h5_filepath, 'r') as f:
+            offsets = np.array(f['offsets'])
             for ii in tqdm(range(self.checked_nums)):
-                trip = np.array(f.get('trips/' + str(ii + 1)))
-                ts = np.array(f.get('timestamps/' + str(ii + 1)))
+                trip = np.array(f['points'][offsets[ii]:offsets[ii + 1]])
+                ts = np.array(f['timestamps'][offsets[ii]:offsets[ii + 1]])
                 print(trip)
                 print(ts)
 
@@ -163,14 +163,11 @@ class ProcessorTester:
         Check whether the track length is reasonable
         """
         with h5py.File(self.h5_filepath, 'r') as f:
-            # print(f.keys())
-            lens = []
-            for ii in tqdm(range(self.checked_nums)):
-                trip = np.array(f.get('trips/' + str(ii + 1)))
-                ts = np.array(f.get('timestamps/' + str(ii + 1)))
-                lens.append(len(ts))
-                assert 20 <= len(ts) <= 100, "The length exceeds the range limit"
-                assert len(trip) == len(ts), "locations The length exceeds the range limit!!"
+            offsets = np.array(f['offsets'])
+            lens = np.diff(offsets)[:self.checked_nums]
+            assert np.all((20 <= lens) & (lens <= 100)), "The length exceeds the range limit"
+            assert f['points'].shape[0] == f['timestamps'].shape[0] == offsets[-1], \
+                "locations The length exceeds the range limit!!"
 
 
 if __name__ == "__main__":
@@ -179,5 +176,3 @@ if __name__ == "__main__":
     P = Processor(10200, 50)
     P.go()
     print("The time of get the h5 files ：", time.time()-t1)
-
-
@@ -1,52 +1,81 @@
 """
 Change the Porto timestamp to a random value
+
+Trips are read in chunks of chunk_trips, then filtered to the Porto range, cut into pieces of random length in
+[min_len, max_len) and given timestamps random_start + 15*i with array operations over the whole chunk; each chunk is
+written with one append in the consolidated layout of h5consolidate
 """
 import numpy as np
 import h5py
 from tqdm import tqdm
-import pandas as pd
+import os
+import time
 import settings
+from preprocess.h5consolidate import ConsolidatedWriter, cut_lengths, is_consolidated
+
+
+def read_trips(f, start, end):
+    """
+    Read trips [start, end) (0-based) of either layout
+    :return: points (N, 2), lengths (end-start,)
+    """
+    if is_consolidated(f):
+        offsets = np.array(f['offsets'][start:end + 1])
+        return np.array(f['points'][offsets[0]:offsets[-1]]).reshape(-1, 2), np.diff(offsets)
+    trips = [np.array(f['trips/%d' % (i + 1)]).reshape(-1, 2) for i in range(start, end)]
+    return np.concatenate(trips), np.array([len(trip) for trip in trips], dtype=np.int64)
+
+
+def change_chunk(rng, points, lengths, lons_range, lats_range, min_len, max_len, interval=15, max_start=3600):
+    """
+    Filter, cut and re-time a chunk of trips
+    :return: points (M, 2), timestamps (M,), lengths of the pieces; M and the number of pieces may be 0
+    """
+    inside = ((lons_range[0] <= points[:, 0]) & (points[:, 0] <= lons_range[1]) &
+              (lats_range[0] <= points[:, 1]) & (points[:, 1] <= lats_range[1]))
+    points = points[inside]
+    lengths = np.bincount(np.repeat(np.arange(len(lengths)), lengths)[inside], minlength=len(lengths))
+    trip_starts = np.cumsum(lengths) - lengths
+    starts, ends, rows = cut_lengths(rng, lengths, min_len, max_len)
+    lengths = ends - starts
+    # position of each point within its piece
+    position = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    index = np.repeat(starts + trip_starts[rows], lengths) + position
+    timestamps = np.repeat(rng.integers(0, max_start, size=len(lengths)), lengths) + interval * position
+    return points[index], timestamps.astype(float), lengths
+
+
+def update(src_path="/home/like/data/porto.h5", dst_path="/home/like/data/porto1.h5", chunk_trips=100000, seed=0,
+           chunk_points=65536, compression="gzip"):
+    """
+    :return: the number of written trajectories
+    """
+    rng = np.random.default_rng(seed)
+    with h5py.File(src_path, 'r') as raw_f, h5py.File(dst_path, 'w') as new_f:
+        num = int(raw_f.attrs['num'])
+        writer = ConsolidatedWriter(new_f, chunk_points, compression)
+        for start in tqdm(range(0, num, chunk_trips), desc='porto'):
+            points, lengths = read_trips(raw_f, start, min(start + chunk_trips, num))
+            pieces = change_chunk(rng, points, lengths, settings.lons_range_pt, settings.lats_range_pt,
+                                  settings.min_len, settings.max_len)
+            # a chunk may have no trip left inside the range
+            if len(pieces[2]):
+                writer.append([pieces])
+        count = writer.close()
+    print("Write a valid trajectory: ", count)
+    return count
+
+
+def show(path, trj_id=2):
+    """Test the timestamp generated by the simulation"""
+    with h5py.File(path, 'r') as f:
+        print(f.attrs['num'])
+        offsets = f['offsets'][trj_id:trj_id + 2]
+        print(np.array(f['timestamps'][offsets[0]:offsets[1]]))
+
 
-def update():
-    raw_f = h5py.File("/home/like/data/porto.h5", 'r')
-    new_f = h5py.File("/home/like/data/porto1.h5", 'a')
-    num = raw_f.attrs['num']
-
-    count = 0
-    for ii in tqdm(range(num)):
-        # Restricted latitude and longitude
-        trip = np.array(raw_f.get('trips/' + str(ii+1)))
-        trip = pd.DataFrame(trip, columns=['lon', 'lat'])
-        trip = trip[trip.lon >= settings.lons_range_pt[0]]
-        trip = trip[trip.lon <= settings.lons_range_pt[1]]
-        trip = trip[trip.lat >= settings.lats_range_pt[0]]
-        trip = trip[trip.lat <= settings.lats_range_pt[1]]
-        trip = np.array(trip)
-        trips = []
-        while len(trip) >= settings.max_len:
-            # Generate a trajectory of random length according to the length of min-max trajectory
-            rand_len = np.random.randint(settings.min_len, settings.max_len)
-            trips.append(trip[0:rand_len])
-            trip = trip[rand_len:]
-        if len(trip) >= settings.min_len:
-            trips.append(trip)
-
-        for trip in trips:
-            length = len(trip)
-            # Create a random timestamp
-            random_timestamp = np.random.randint(0, 3600)
-            timestamps = [random_timestamp + 15*i for i in range(length)]
-            new_f["trips/" + str(count)] = trip
-            new_f["timestamps/" + str(count)] = timestamps
-            count += 1
-    new_f.attrs['num'] = count + 1
-    print("Write a valid trajectory: ", count + 1)
-    raw_f.close()
-    new_f.close()
-
-# update()
-# Test the timestamp generated by the simulation
-new_f = h5py.File("/home/like/data/beijing.h5", 'r')
-print(new_f.attrs['num'])
-ts = np.array(new_f.get('timestamps/' + str(2)))
-print(ts)
\ No newline at end of file
+if __name__ == "__main__":
+    t1 = time.time()
+    update()
+    show("/home/like/data/porto1.h5")
+    print("The time of change the Porto timestamps ：", time.time()-t1)
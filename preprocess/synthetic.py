@@ -0,0 +1,125 @@
+"""
+Generate a seeded synthetic trajectory h5 with planted co-moving groups, readable by Loader
+
+trips       trips/1 -> [[longitude, latitude], ...]   (consolidated=False, the per-trajectory layout)
+
+timestamps  timestamps/1 -> [ts, ts,...]
+
+points, timestamps, offsets                         (consolidated=True, the layout of h5consolidate)
+
+groups      (num,) planted group id of each trajectory (0-based), -1 for trajectories outside any group
+
+f.attrs['num']  ：The total number of valid tracks recorded
+"""
+import argparse
+import h5py
+import numpy as np
+import os
+import time
+import settings
+
+# meters of one degree of latitude
+METERS_PER_DEGREE = 111195.0
+
+
+def city_range(city=settings.city):
+    if city == "beijing":
+        return settings.lons_range_bj, settings.lats_range_bj
+    return settings.lons_range_pt, settings.lats_range_pt
+
+
+def random_walk(rng, length, lons_range, lats_range, step=300.0, interval=(15, 120)):
+    """
+    One trajectory of a moving object inside the region: steps of about `step` meters with a persistent heading,
+    sampled every `interval` seconds, within one day
+    :return: lon_lat (length, 2), timestamps (length,)
+    """
+    lat0 = np.mean(lats_range)
+    scale = np.array([METERS_PER_DEGREE * np.cos(np.radians(lat0)), METERS_PER_DEGREE])
+    heading = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.3, length))
+    steps = step * rng.uniform(0.5, 1.5, length)[:, None] * np.column_stack([np.cos(heading), np.sin(heading)])
+    start = np.array([rng.uniform(*lons_range), rng.uniform(*lats_range)])
+    lon_lat = start + np.cumsum(steps / scale, axis=0)
+    # 越界的部分折返到区域内
+    low, high = np.array([lons_range[0], lats_range[0]]), np.array([lons_range[1], lats_range[1]])
+    lon_lat = high - np.abs(high - low - np.abs(lon_lat - low) % (2 * (high - low)))
+    gaps = rng.integers(interval[0], interval[1] + 1, length)
+    timestamps = rng.integers(0, 86400 - gaps.sum()) + np.cumsum(gaps)
+    return lon_lat, timestamps.astype(float)
+
+
+def plant_group(rng, size, lons_range, lats_range, noise, time_noise):
+    """
+    A co-moving group: a leader walk, every member follows a contiguous part of it (at least min_len points)
+    with `noise` meters of spatial noise per point and a constant time shift of at most `time_noise` seconds
+    """
+    length = rng.integers(settings.min_len, settings.max_len + 1)
+    lon_lat, timestamps = random_walk(rng, length, lons_range, lats_range)
+    scale = np.array([METERS_PER_DEGREE * np.cos(np.radians(np.mean(lats_range))), METERS_PER_DEGREE])
+    members = []
+    for _ in range(size):
+        start = rng.integers(0, length - settings.min_len + 1)
+        end = rng.integers(start + settings.min_len, length + 1)
+        points = lon_lat[start:end] + rng.normal(0, noise, (end - start, 2)) / scale
+        points = np.clip(points, [lons_range[0], lats_range[0]], [lons_range[1], lats_range[1]])
+        shift = rng.uniform(-time_noise, time_noise)
+        members.append((points, np.clip(timestamps[start:end] + shift, 0, 86399)))
+    return members
+
+
+def generate(path, num, group_ratio=0.5, group_size=(3, 8), noise=50.0, time_noise=30.0, seed=0,
+             consolidated=False):
+    """
+    :param num: number of trajectories
+    :param group_ratio: fraction of trajectories that belong to a planted group
+    :param group_size: (min, max) members of a planted group
+    :param noise: standard deviation in meters of a member's points around the leader walk
+    :param time_noise: maximum time shift in seconds of a member against the leader walk
+    :param seed: the same seed writes the same file
+    :param consolidated: write the consolidated layout instead of trips/%d, timestamps/%d
+    :return: groups (num,) planted group id of each trajectory in file order, -1 outside any group
+    """
+    rng = np.random.default_rng(seed)
+    lons_range, lats_range = city_range()
+    # 每个单元为一个群组或一条独立轨迹
+    units = []
+    grouped = int(round(num * group_ratio))
+    while grouped >= group_size[0]:
+        size = min(rng.integers(group_size[0], group_size[1] + 1), grouped)
+        units.append(plant_group(rng, size, lons_range, lats_range, noise, time_noise))
+        grouped -= size
+    group_num = len(units)
+    while sum(len(unit) for unit in units) < num:
+        length = rng.integers(settings.min_len, settings.max_len + 1)
+        units.append([random_walk(rng, length, lons_range, lats_range)])
+    # 以单元为粒度打乱顺序, 任意前 n 条轨迹都是均匀抽样且群组成员相邻 (只有末尾的群组可能不完整)
+    trips, labels = [], []
+    for k in rng.permutation(len(units)):
+        trips.extend(units[k])
+        labels.extend([k if k < group_num else -1] * len(units[k]))
+    groups = np.array(labels, dtype=np.int64)
+
+    with h5py.File(path, 'w') as f:
+        if consolidated:
+            f.create_dataset("points", data=np.concatenate([trip[0] for trip in trips]).reshape(-1, 2))
+            f.create_dataset("timestamps", data=np.concatenate([trip[1] for trip in trips]))
+            f.create_dataset("offsets", data=np.concatenate([[0], np.cumsum([len(trip[1]) for trip in trips])]))
+        else:
+            for i, (points, timestamps) in enumerate(trips):
+                f["trips/%d" % (i + 1)] = points
+                f["timestamps/%d" % (i + 1)] = timestamps
+        f.create_dataset("groups", data=groups)
+        f.attrs['num'] = num
+    return groups
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="synthetic.py")
+    parser.add_argument("--out", default=os.path.join("/data/Like/", settings.city + "_synthetic.h5"), help="h5 path")
+    parser.add_argument("--num", type=int, default=max(settings.nums), help="number of trajectories")
+    parser.add_argument("--seed", type=int, default=0, help="the same seed writes the same file")
+    parser.add_argument("--consolidated", action="store_true", help="write the consolidated layout")
+    args, _ = parser.parse_known_args()
+    t1 = time.time()
+    generate(args.out, args.num, seed=args.seed, consolidated=args.consolidated)
+    print("The time of generate the h5 files ：", time.time()-t1)
@@ -11,6 +11,13 @@ lats_range_bj = [39.83, 40.03]
 lons_range_pt = [-8.735, -8.156]
 lats_range_pt = [40.953,  41.307]
 process_num = 40
+# dataset cache of load_index, in-memory bytes bound and optional on-disk directory
+cache_bytes = 4 << 30
+cache_dir = None
+# directory of persisted R-tree indexes, None keeps the index in memory
+index_dir = None
+# h5 file read by load_index, e.g. a preprocess/synthetic.py file; None reads the city's file under /data/Like/
+h5path = None
 # experimental number
 n = 20
 
@@ -0,0 +1,71 @@
+import networkx as nx
+import numpy as np
+import pytest
+import settings
+from indexing import scan
+from indexing.myRtree import bulk_rtree, self_join
+from loader.data_loader import Loader
+from preprocess.synthetic import generate
+from utils.trajectory import batch_LCS
+
+NUM = 200
+
+
+@pytest.fixture(scope="session")
+def synthetic_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("synthetic") / "synthetic.h5")
+    generate(path, NUM, seed=0)
+    return path
+
+
+@pytest.fixture
+def synthetic_store(synthetic_path):
+    """合成数据的 TrajectoryStore, 相交序列为 R-tree 自连接的结果, 每个测试单独加载"""
+    store = Loader(settings.scale, settings.time_size, synthetic_path).load(NUM)
+    store.set_intersections(*self_join(bulk_rtree(store.mbrs), store.mbrs))
+    store.intersect_key = ("synthetic", NUM)
+    return store
+
+
+@pytest.fixture(scope="session")
+def pair_lcs(synthetic_path):
+    """
+    全部无序轨迹对 (a < b) 的完整 LCS 长度 (不做时间预判), 作为候选生成的真值
+    :return: a, b, lcs
+    """
+    store = Loader(settings.scale, settings.time_size, synthetic_path).load(NUM, tokenize=False)
+    a, b = np.triu_indices(len(store), 1)
+    lcs = np.concatenate([batch_LCS([store[i] for i in a[k:k + 2048].tolist()],
+                                    [store[j] for j in b[k:k + 2048].tolist()],
+                                    1, settings.dist_error, settings.time_error, time_prune=False)
+                          for k in range(0, len(a), 2048)])
+    return a, b, lcs
+
+
+@pytest.fixture(scope="session")
+def scan_summary():
+    """
+    SCAN 结果中与访问顺序无关的部分: 各社区的核节点集合、已归类节点、未归类节点;
+    非核节点同时与多个社区的核节点 ϵ-相邻时所属社区取决于访问顺序, 只检查其归入的社区含有与它 ϵ-相邻的核节点,
+    桥节点与离群点只检查与本次结果的社区划分一致
+    :return: summarize(pairs, mu, epsilon, communities, hubs, outliers)
+    """
+    def summarize(pairs, mu, epsilon, communities, hubs, outliers):
+        G = nx.Graph()
+        G.add_edges_from((int(u), int(v)) for u, v in pairs if u != v)
+        algorithm = scan.SCAN(G, epsilon, mu)
+        cores = {node for node in G.nodes() if algorithm.is_core(node)}
+        node_community = {}
+        for i, community in enumerate(communities):
+            assert len(set(community)) == len(community)
+            for node in community:
+                assert node not in node_community
+                node_community[node] = i
+        for node, i in node_community.items():
+            if node not in cores:
+                assert any(node_community.get(v) == i for v in algorithm.get_epsilon_neighbor(node) if v in cores)
+        expected_hubs, expected_outliers = algorithm.get_hubs_outliers(communities)
+        assert sorted(hubs) == sorted(expected_hubs) and sorted(outliers) == sorted(expected_outliers)
+        core_sets = frozenset(frozenset(set(community) & cores) for community in communities)
+        return core_sets, frozenset(node_community), frozenset(hubs) | frozenset(outliers)
+    return summarize
@@ -0,0 +1,37 @@
+import numpy as np
+from utils.trajectory import Trajectory, batch_LCS
+
+
+def make_trajectory(trj_id, lon_lat, times):
+    trj = Trajectory(trj_id)
+    trj.set_lon_lat(np.asarray(lon_lat, dtype=float))
+    trj.set_time_seq(np.asarray(times, dtype=float))
+    return trj
+
+
+def test_decide_suffix_match():
+    # a 与 b 的最后 3 个点重合, LCS = min_lifetime = min(m, n) = 3
+    lon_lat = np.column_stack([116.3 + 0.01 * np.arange(6), np.full(6, 39.9)])
+    times = 100.0 * np.arange(6)
+    b = make_trajectory(0, lon_lat, times)
+    a = make_trajectory(1, lon_lat[3:], times[3:])
+    assert a.LCS_to(b, 3, 50, 50) == 3
+    assert a.LCS_reach(b, 3, 50, 50)
+    assert batch_LCS([a], [b], 3, 50, 50, decide=True).tolist() == [True]
+    assert batch_LCS([b], [a], 3, 50, 50, decide=True).tolist() == [True]
+
+
+def test_decide_matches_LCS_to():
+    rng = np.random.default_rng(0)
+    trjs_a, trjs_b = [], []
+    for k in range(400):
+        m, n = rng.integers(4, 10, size=2)
+        # 小范围内的随机点, 相邻点之间约 100 米, 匹配与不匹配都常见
+        trjs_a.append(make_trajectory(2 * k, 116.3 + rng.integers(0, 4, size=(m, 2)) * 1e-3,
+                                      np.sort(rng.integers(0, 8, size=m)) * 30.0))
+        trjs_b.append(make_trajectory(2 * k + 1, 116.3 + rng.integers(0, 4, size=(n, 2)) * 1e-3,
+                                      np.sort(rng.integers(0, 8, size=n)) * 30.0))
+    for min_lifetime in (1, 2, 3, 4):
+        expected = [a.LCS_to(b, min_lifetime, 50, 30) >= min_lifetime for a, b in zip(trjs_a, trjs_b)]
+        reach = batch_LCS(trjs_a, trjs_b, min_lifetime, 50, 30, decide=True)
+        assert reach.tolist() == expected
@@ -0,0 +1,61 @@
+import h5py
+import numpy as np
+import pytest
+import settings
+from loader.data_loader import Loader
+from preprocess.h5consolidate import consolidate
+from preprocess.synthetic import city_range, random_walk
+
+
+@pytest.fixture(scope="module")
+def h5_files(tmp_path_factory):
+    # 逐条轨迹布局, 部分轨迹长于 max_len; 再转为分块压缩与连续 (可内存映射) 两种合并布局
+    tmp_path = tmp_path_factory.mktemp("layouts")
+    rng = np.random.default_rng(0)
+    lons_range, lats_range = city_range()
+    trips_path = str(tmp_path / "trips.h5")
+    with h5py.File(trips_path, 'w') as f:
+        for i in range(300):
+            lon_lat, timestamps = random_walk(rng, rng.integers(5, 2 * settings.max_len), lons_range, lats_range)
+            f["trips/%d" % (i + 1)] = lon_lat
+            f["timestamps/%d" % (i + 1)] = timestamps
+        f.attrs['num'] = 300
+    packed_path, contiguous_path = str(tmp_path / "packed.h5"), str(tmp_path / "contiguous.h5")
+    consolidate(trips_path, packed_path, batch_size=64, chunk_points=1000)
+    consolidate(trips_path, contiguous_path, contiguous=True)
+    return trips_path, packed_path, contiguous_path
+
+
+def load(path, num, ids=None, mmap=False):
+    store = Loader(settings.scale, settings.time_size, path).load(num, ids, mmap, tokenize=False)
+    return np.asarray(store.lon_lat), np.asarray(store.time), store.offsets
+
+
+def assert_same(expected, actual):
+    for a, b in zip(expected, actual):
+        np.testing.assert_array_equal(a, b)
+
+
+@pytest.mark.parametrize("ids", [None, [7, 250, 3, 120, 121, 122], [299]])
+def test_consolidated_matches_trips(h5_files, ids):
+    trips_path, packed_path, contiguous_path = h5_files
+    expected = load(trips_path, 200, ids)
+    assert_same(expected, load(packed_path, 200, ids))
+    assert_same(expected, load(contiguous_path, 200, ids, mmap=True))
+
+
+def test_sparse_ids_read_separate_runs(h5_files):
+    trips_path, packed_path, _ = h5_files
+    ids = np.array([290, 0, 150, 151, 10])
+    expected = load(trips_path, 0, ids)
+    loader = Loader(settings.scale, settings.time_size, packed_path)
+    with h5py.File(packed_path, 'r') as f:
+        # max_gap=0 时每段不相邻的轨迹都单独读取
+        assert_same(expected, loader.read_consolidated(f, ids, max_gap=0))
+
+
+def test_time_bounds_match_mbrs(h5_files):
+    expected = Loader(settings.scale, settings.time_size, h5_files[0]).load(250, tokenize=False).mbrs[:, 4:]
+    for path in h5_files:
+        loader = Loader(settings.scale, settings.time_size, path)
+        assert np.array_equal(loader.time_bounds(250, batch_size=7), expected)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import settings
+from baselines.ES_ECMC import ECMC
+
+PARAMS = [(2, 2), (4, 4), (3, 6)]
+
+
+def reference_pairs(trjs, min_group_trj_nums, min_lifetime):
+    """原有的逐条轨迹实现: 按相交序列顺序逐对调用 LCS_to, 有效轨迹对不足时提前终止"""
+    all_pairs = []
+    for trj in trjs:
+        if trj.intersect_count < min_group_trj_nums:
+            continue
+        pairs, count = [trj.id], 0
+        for ii, intersect in enumerate(trj.intersect_trjs.tolist()):
+            if intersect == trj.id or trjs[intersect].intersect_count < min_group_trj_nums:
+                continue
+            if trj.LCS_to(trjs[intersect], min_lifetime, settings.dist_error, settings.time_error) >= min_lifetime:
+                pairs.append(intersect)
+                count += 1
+            if count + trj.intersect_count - ii < min_group_trj_nums:
+                break
+        if count >= min_group_trj_nums:
+            all_pairs.append(pairs)
+    return all_pairs
+
+
+@pytest.mark.parametrize("min_group_trj_nums, min_lifetime", PARAMS)
+def test_get_pairs_matches_LCS_to(synthetic_store, min_group_trj_nums, min_lifetime):
+    ecmc = ECMC(min_group_trj_nums, min_lifetime, settings.dist_error, settings.time_error)
+    all_pairs = ecmc.get_pairs(synthetic_store)
+    expected = reference_pairs(synthetic_store, min_group_trj_nums, min_lifetime)
+    assert len(expected) > 0
+    assert [[trj.id for trj in pairs] for pairs in all_pairs] == expected
+    for pairs in all_pairs:
+        assert pairs[0].candiate_match == pairs
+
+
+def test_each_unordered_pair_verified_once(synthetic_store):
+    ecmc = ECMC(2, 4, settings.dist_error, settings.time_error)
+    report = ecmc.get_groups(synthetic_store, profile=True)[-1]
+    indptr, indices = synthetic_store.intersections()
+    src = np.repeat(np.arange(len(synthetic_store)), np.diff(indptr))
+    active = synthetic_store.intersect_count >= 2
+    assert report["counters"]["pairs_verified"] == np.sum((src < indices) & active[src] & active[indices])
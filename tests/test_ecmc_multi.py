@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+import settings
+from baselines.ES_ECMC import ECMC as SingleECMC
+from baselines.ES_ECMC_multi import ECMC, weighted_chunks
+
+
+@pytest.fixture
+def two_processes(monkeypatch):
+    monkeypatch.setattr(settings, "process_num", 2)
+
+
+@pytest.mark.parametrize("min_group_trj_nums, min_lifetime", [(2, 2), (4, 4), (3, 6)])
+def test_multi_matches_single(synthetic_store, two_processes, min_group_trj_nums, min_lifetime):
+    args = (min_group_trj_nums, min_lifetime, settings.dist_error, settings.time_error)
+    single = SingleECMC(*args).get_groups(synthetic_store, profile=True)
+    multi = ECMC(*args).get_groups(synthetic_store, profile=True)
+    assert [[trj.id for trj in pairs] for pairs in multi[0]] == [[trj.id for trj in pairs] for pairs in single[0]]
+    assert multi[2] == single[2]
+    # 每个无序对只验证一次, 与单进程相同
+    for name in ("index_candidates", "candidates_pruned", "pairs_verified", "valid_pairs", "lcs_time_pruned"):
+        assert multi[3]["counters"].get(name) == single[3]["counters"].get(name), name
+
+
+def test_weighted_chunks_cover_positions_in_order():
+    positions = np.arange(10, 1010)
+    cost = np.random.default_rng(0).integers(1, 2500, size=len(positions))
+    chunks = weighted_chunks(positions, cost, 16)
+    assert 8 <= len(chunks) <= 17
+    np.testing.assert_array_equal(np.concatenate(chunks), positions)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from utils.evaluation import evaluate, pair_counts, recall
+
+
+def loop_recall(real_label, pred_label):
+    """原有的逐对统计实现"""
+    hit_count = 0
+    unhit_count = 0
+    for ii in range(len(real_label)):
+        for jj in range(ii + 1, len(real_label)):
+            if real_label[ii] == -1 or real_label[jj] == -1:
+                continue
+            if real_label[ii] == real_label[jj]:
+                if pred_label[ii] == pred_label[jj] and pred_label[ii] != -1:
+                    hit_count += 1
+                else:
+                    unhit_count += 1
+    if (hit_count + unhit_count) == 0:
+        return 0
+    return hit_count / (hit_count + unhit_count)
+
+
+def loop_counts(real_label, pred_label):
+    counts = {"hit": 0, "real_pairs": 0, "pred_pairs": 0, "total_pairs": 0}
+    for ii in range(len(real_label)):
+        for jj in range(ii + 1, len(real_label)):
+            real = real_label[ii] == real_label[jj] != -1
+            pred = pred_label[ii] == pred_label[jj] != -1
+            counts["hit"] += real and pred
+            counts["real_pairs"] += real
+            counts["pred_pairs"] += pred
+            counts["total_pairs"] += 1
+    return counts
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_pair_loop(seed):
+    rng = np.random.default_rng(seed)
+    n = 120
+    real_label = rng.integers(-1, 10, n).tolist()
+    pred_label = rng.integers(-1, 8, n).tolist()
+    assert recall(real_label, pred_label) == loop_recall(real_label, pred_label)
+    assert pair_counts(real_label, pred_label) == loop_counts(real_label, pred_label)
+
+
+def test_degenerate_labels():
+    assert recall([-1, -1, -1], [0, 0, 0]) == loop_recall([-1, -1, -1], [0, 0, 0]) == 0
+    assert recall([0, 1, 2], [0, 0, 0]) == 0
+    assert recall([0, 0, 1, 1], [-1, -1, 3, 3]) == loop_recall([0, 0, 1, 1], [-1, -1, 3, 3]) == 0.5
+    scores = evaluate([0, 0, 1, 1], [0, 0, 1, 1])
+    assert scores == {"recall": 1.0, "precision": 1.0, "f1": 1.0, "ari": 1.0}
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+import settings
+from indexing.grid_join import grid_candidates
+
+
+def candidate_codes(indptr, indices):
+    n = len(indptr) - 1
+    return np.repeat(np.arange(n), np.diff(indptr)) * n + indices
+
+
+@pytest.mark.parametrize("min_lifetime", [1, 2, 4, 8])
+def test_grid_keeps_every_valid_pair(synthetic_store, pair_lcs, min_lifetime):
+    n = len(synthetic_store)
+    indptr, indices = grid_candidates(synthetic_store, settings.dist_error, settings.time_error, min_lifetime)
+    codes = candidate_codes(indptr, indices)
+    # 每行按 id 升序且包含自身
+    assert np.all(np.diff(codes) > 0)
+    assert np.isin(np.arange(n) * (n + 1), codes).all()
+    a, b, lcs = pair_lcs
+    valid = lcs >= min_lifetime
+    assert valid.sum() > 0
+    assert np.isin(a[valid] * n + b[valid], codes).all()
+    assert np.isin(b[valid] * n + a[valid], codes).all()
+
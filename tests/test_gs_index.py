@@ -0,0 +1,38 @@
+import networkx as nx
+import pytest
+from baselines.LCS_SCAN import SCAN
+from indexing import gs_index, scan
+
+PARAMS = [(1, 0.9), (2, 0.3), (3, 0.5), (4, 0.7), (6, 0.6)]
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_one_index_answers_every_parameter(scan_summary, seed):
+    G = nx.planted_partition_graph(6, 8, 0.6, 0.04, seed=seed)
+    pairs = [[u, v] for u, v in G.edges()]
+    index = gs_index.get_index(pairs)
+    for mu, epsilon in PARAMS:
+        result = gs_index.get_communities(index, mu, epsilon)
+        expected = scan.get_communities_nx(pairs, mu, epsilon)
+        assert scan_summary(pairs, mu, epsilon, *result) == scan_summary(pairs, mu, epsilon, *expected)
+
+
+def test_similarity_equal_to_epsilon():
+    # 团内的边相似度恰为 1, 等于 epsilon 的边也是 ϵ-邻居
+    pairs = [[u, v] for u, v in nx.caveman_graph(3, 5).edges()] + [[0, 5], [5, 10]]
+    index = gs_index.get_index(pairs)
+    for mu in (1, 3, 4):
+        communities, hubs, outliers = gs_index.get_communities(index, mu, 1.0)
+        assert sorted(map(sorted, communities)) == sorted(map(sorted, scan.get_communities_nx(pairs, mu, 1.0)[0]))
+
+
+def test_index_on_trajectory_pairs(synthetic_store, scan_summary):
+    model = SCAN(3, 2)
+    pairs, index = model.get_index(synthetic_store)
+    for epsilon in (0.3, 0.5, 0.7):
+        _, communities, labels = model.get_groups_from_index(synthetic_store, pairs, index, epsilon)
+        expected = scan.get_communities_nx(pairs, 3, epsilon)
+        hubs, outliers = scan.SCAN(nx.Graph(pairs), epsilon, 3).get_hubs_outliers(communities)
+        assert scan_summary(pairs, 3, epsilon, communities, hubs, outliers) == scan_summary(pairs, 3, epsilon,
+                                                                                            *expected)
+        assert sum(label != -1 for label in labels) == sum(len(c) for c in communities)
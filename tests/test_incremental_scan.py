@@ -0,0 +1,40 @@
+import networkx as nx
+import numpy as np
+import pytest
+from indexing.incremental_scan import IncrementalSCAN
+from indexing.scan import get_communities_nx
+
+PARAMS = [(2, 0.3), (3, 0.5), (4, 0.7)]
+
+
+@pytest.mark.parametrize("mu, epsilon", PARAMS)
+def test_churn_matches_networkx(scan_summary, mu, epsilon):
+    rng = np.random.default_rng(mu)
+    G = nx.planted_partition_graph(6, 8, 0.6, 0.04, seed=mu)
+    candidates = [(u, v) for u in G.nodes() for v in G.nodes() if u < v]
+    edges = {(min(u, v), max(u, v)) for u, v in G.edges()}
+    algorithm = IncrementalSCAN(epsilon, mu, sorted(edges))
+    for step in range(120):
+        # 每批只改动少量边, 大部分社区不受影响; 隔若干批加入重复边与删除不存在的边
+        current = sorted(edges)
+        removed = [current[k] for k in rng.integers(0, len(current), rng.integers(0, 3))]
+        added = [candidates[k] for k in rng.integers(0, len(candidates), rng.integers(0, 4))]
+        if step % 10 == 0:
+            removed += [(0, 47)]
+            added += added[:1]
+        algorithm.update(added=added, removed=removed)
+        edges = (edges - set(removed)) | set(added)
+        pairs = sorted(edges)
+        result = algorithm.get_communities()
+        expected = get_communities_nx(pairs, mu, epsilon)
+        assert scan_summary(pairs, mu, epsilon, *result) == scan_summary(pairs, mu, epsilon, *expected)
+        assert len(algorithm) == len({node for edge in edges for node in edge})
+
+
+def test_remove_everything():
+    pairs = [(0, 1), (1, 2), (0, 2), (2, 3)]
+    algorithm = IncrementalSCAN(0.5, 2, pairs)
+    assert algorithm.get_communities()[0] == [[0, 1, 2, 3]]
+    algorithm.remove_edges(pairs)
+    assert len(algorithm) == 0
+    assert algorithm.get_communities() == ([], [], [])
@@ -0,0 +1,59 @@
+from collections import Counter
+import pytest
+import settings
+from baselines.ES_ECMC import ECMC
+from baselines.LCS_SCAN import SCAN
+
+THRESHOLDS = [(2, 1), (2, 4), (3, 3), (4, 6), (6, 2)]
+
+
+def reference_scan_pairs(trjs, min_group_trj_nums, min_lifetime):
+    """原有的逐条轨迹实现: 按相交序列顺序逐对计算 Counter 交集, 有效轨迹对不足时提前终止"""
+    all_pairs = []
+    for trj in trjs:
+        pairs, count = [], 0
+        if trj.intersect_count < min_group_trj_nums or trj.size < min_lifetime:
+            continue
+        for ii, intersect in enumerate(trj.intersect_trjs.tolist()):
+            if intersect == trj.id:
+                continue
+            intersect_trj = trjs[intersect]
+            if intersect_trj.intersect_count < min_group_trj_nums or intersect_trj.size < min_lifetime:
+                continue
+            if sum((Counter(trj.token_seq) & Counter(intersect_trj.token_seq)).values()) >= min_lifetime:
+                pairs.append([trj.id, intersect_trj.id])
+                count += 1
+            if count + trj.intersect_count - ii < min_group_trj_nums:
+                break
+        if count >= min_group_trj_nums:
+            all_pairs.extend(pairs)
+    return all_pairs
+
+
+def test_ecmc_replay_matches_get_pairs(synthetic_store):
+    scores = ECMC(2, 1, settings.dist_error, settings.time_error).get_scores(synthetic_store)
+    for min_group_trj_nums, min_lifetime in THRESHOLDS:
+        ecmc = ECMC(min_group_trj_nums, min_lifetime, settings.dist_error, settings.time_error)
+        replayed = [[trj.id for trj in pairs] for pairs in ecmc.get_pairs(synthetic_store, scores)]
+        synthetic_store.reset()
+        expected = [[trj.id for trj in pairs] for pairs in ecmc.get_pairs(synthetic_store)]
+        assert len(expected) > 0
+        assert replayed == expected
+
+
+def test_scan_replay_matches_counter_loop(synthetic_store):
+    scores = SCAN(2, 1).get_scores(synthetic_store)
+    for min_group_trj_nums, min_lifetime in THRESHOLDS:
+        pairs = SCAN(min_group_trj_nums, min_lifetime).get_pairs(synthetic_store, scores)
+        expected = reference_scan_pairs(synthetic_store, min_group_trj_nums, min_lifetime)
+        assert len(expected) > 0
+        assert pairs == expected
+
+
+def test_scores_reject_other_settings(synthetic_store):
+    scores = SCAN(3, 1).get_scores(synthetic_store)
+    with pytest.raises(ValueError):
+        SCAN(2, 1).get_pairs(synthetic_store, scores)
+    synthetic_store.intersect_key = ("other", len(synthetic_store))
+    with pytest.raises(ValueError):
+        SCAN(3, 1).get_pairs(synthetic_store, scores)
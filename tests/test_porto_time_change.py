@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+import h5py
+import numpy as np
+from preprocess.porto_time_change import change_chunk, update
+
+
+def test_chunk_without_pieces():
+    rng = np.random.default_rng(0)
+    points = np.column_stack([np.linspace(0, 1, 30), np.linspace(0, 1, 30)])
+    # 全部点都在范围外
+    result = change_chunk(rng, points, np.array([10, 20]), (5, 6), (5, 6), 4, 8)
+    assert [len(array) for array in result] == [0, 0, 0]
+    # 轨迹都短于 min_len
+    result = change_chunk(rng, points, np.array([2, 28]), (0, 1), (0, 0.05), 4, 8)
+    assert [len(array) for array in result] == [0, 0, 0]
+    assert len(change_chunk(rng, points[:0], np.zeros(0, dtype=np.int64), (0, 1), (0, 1), 4, 8)[2]) == 0
+
+
+def test_pieces_keep_points_in_order():
+    rng = np.random.default_rng(0)
+    points = np.column_stack([np.arange(100.0), np.zeros(100)])
+    new_points, timestamps, lengths = change_chunk(rng, points, np.array([40, 60]), (0, 89), (-1, 1), 5, 10)
+    assert lengths.min() >= 5 and lengths.max() < 10 and lengths.sum() == len(new_points) == len(timestamps)
+    assert np.all(new_points[:, 0] <= 89)
+    bounds = np.cumsum(lengths)[:-1]
+    for piece, ts in zip(np.split(new_points[:, 0], bounds), np.split(timestamps, bounds)):
+        assert np.all(np.diff(piece) == 1) and np.all(np.diff(ts) == 15)
+
+
+def test_update_skips_empty_chunks(tmp_path, monkeypatch):
+    import settings
+    monkeypatch.setattr(settings, "lons_range_pt", (0, 1))
+    monkeypatch.setattr(settings, "lats_range_pt", (0, 1))
+    monkeypatch.setattr(settings, "min_len", 5)
+    monkeypatch.setattr(settings, "max_len", 10)
+    src, dst = str(tmp_path / "porto.h5"), str(tmp_path / "porto1.h5")
+    with h5py.File(src, 'w') as f:
+        # 第二个分块的轨迹都在范围外
+        trips = [np.full((30, 2), 0.5), np.full((30, 2), 0.5), np.full((30, 2), 9.0), np.full((30, 2), 9.0)]
+        for i, trip in enumerate(trips):
+            f.create_dataset('trips/%d' % (i + 1), data=trip)
+        f.attrs['num'] = len(trips)
+    assert update(src, dst, chunk_trips=2) > 0
+    with h5py.File(dst, 'r') as f:
+        assert f['offsets'][-1] == len(f['timestamps']) == len(f['points'])
+
+
+def test_import_keeps_warning_filters():
+    # h5generator 在导入时忽略全部警告, 共用的写入函数不能经由它导入
+    code = ("import warnings, preprocess.porto_time_change; "
+            "print(any(f[0] == 'ignore' and f[1] is None and f[2] is Warning for f in warnings.filters))")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "False"
@@ -0,0 +1,40 @@
+import networkx as nx
+import numpy as np
+import pytest
+from baselines.LCS_SCAN import SCAN
+from indexing import scan
+
+PARAMS = [(2, 0.3), (3, 0.5), (4, 0.7)]
+
+
+def random_pairs(seed):
+    """若干稠密社区加上社区间的随机边, 覆盖核节点、边界节点、桥节点与离群点"""
+    G = nx.planted_partition_graph(6, 8, 0.6, 0.04, seed=seed)
+    return [[u, v] for u, v in G.edges()]
+
+
+def test_similarity_matches_networkx():
+    pairs = random_pairs(0)
+    graph = scan.CSRGraph(pairs)
+    G = nx.Graph(pairs)
+    nodes = graph.nodes
+    expected = [scan.cal_similarity(G, nodes[u], nodes[v]) for u, v in zip(graph.src.tolist(), graph.indices.tolist())]
+    assert np.allclose(graph.similarity, expected)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("mu, epsilon", PARAMS)
+def test_random_graph_matches_networkx(scan_summary, seed, mu, epsilon):
+    pairs = random_pairs(seed)
+    result = scan.get_communities(pairs, mu, epsilon)
+    expected = scan.get_communities_nx(pairs, mu, epsilon)
+    assert scan_summary(pairs, mu, epsilon, *result) == scan_summary(pairs, mu, epsilon, *expected)
+
+
+@pytest.mark.parametrize("mu, epsilon", PARAMS)
+def test_trajectory_pairs_match_networkx(synthetic_store, scan_summary, mu, epsilon):
+    pairs = SCAN(mu, 2).get_pairs(synthetic_store)
+    assert len(pairs) > 0
+    result = scan.get_communities(pairs, mu, epsilon)
+    expected = scan.get_communities_nx(pairs, mu, epsilon)
+    assert scan_summary(pairs, mu, epsilon, *result) == scan_summary(pairs, mu, epsilon, *expected)
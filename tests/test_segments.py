@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+import settings
+from indexing.segments import segment_candidates
+
+
+@pytest.mark.parametrize("seg_len", [1, 5, 20])
+@pytest.mark.parametrize("min_lifetime", [1, 4, 8])
+def test_segments_keep_every_valid_pair(synthetic_store, pair_lcs, seg_len, min_lifetime):
+    n = len(synthetic_store)
+    indptr, indices = segment_candidates(synthetic_store, settings.dist_error, settings.time_error, min_lifetime,
+                                         seg_len)
+    codes = np.repeat(np.arange(n), np.diff(indptr)) * n + indices
+    # 每行按 id 升序且包含自身
+    assert np.all(np.diff(codes) > 0)
+    assert np.isin(np.arange(n) * (n + 1), codes).all()
+    a, b, lcs = pair_lcs
+    valid = lcs >= min_lifetime
+    assert np.isin(a[valid] * n + b[valid], codes).all()
+    assert np.isin(b[valid] * n + a[valid], codes).all()
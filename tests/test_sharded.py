@@ -0,0 +1,55 @@
+import networkx as nx
+import numpy as np
+import pytest
+import settings
+from baselines import sharded
+from baselines.ES_ECMC import ECMC
+from baselines.LCS_SCAN import SCAN
+from indexing import scan
+from loader.data_loader import Loader
+
+SHARDS = [(600, 1), (600, 4), (86400, 1)]
+
+
+@pytest.fixture
+def loader(synthetic_path):
+    return Loader(settings.scale, settings.time_size, synthetic_path)
+
+
+def test_time_windows_cover_candidates(synthetic_store, loader):
+    bounds = loader.time_bounds(len(synthetic_store))
+    assert np.array_equal(bounds, synthetic_store.mbrs[:, 4:])
+    shards = sharded.time_shards(bounds[:, 0], 600)
+    assert len(shards) > 1
+    assert np.array_equal(np.sort(np.concatenate(shards)), np.arange(len(synthetic_store)))
+    indptr, indices = synthetic_store.intersections()
+    for shard in shards:
+        window = sharded.time_window(bounds, shard)
+        for trj_id in shard.tolist():
+            assert np.isin(indices[indptr[trj_id]:indptr[trj_id + 1]], window).all()
+
+
+@pytest.mark.parametrize("time_span, shard_buckets", SHARDS)
+def test_ecmc_matches_single_process(synthetic_store, loader, time_span, shard_buckets):
+    model = ECMC(3, 4, settings.dist_error, settings.time_error)
+    e_pairs, e_groups, e_labels = model.get_groups(synthetic_store)
+    p_pairs, p_groups, p_labels = sharded.get_groups(model, loader, len(synthetic_store), time_span,
+                                                     shard_buckets=shard_buckets, processes=1)
+    assert [[trj.id for trj in pairs] for pairs in p_pairs] == [[trj.id for trj in pairs] for pairs in e_pairs]
+    assert [[trj.id for trj in group] for group in p_groups] == [[trj.id for trj in group] for group in e_groups]
+    assert list(p_labels) == list(e_labels)
+    src, dst, intersect_count = sharded.get_pairs(model, loader, len(synthetic_store), time_span, shard_buckets, 1)
+    assert np.array_equal(intersect_count, synthetic_store.intersect_count)
+
+
+@pytest.mark.parametrize("time_span, shard_buckets", SHARDS)
+def test_scan_matches_single_process(synthetic_store, loader, scan_summary, time_span, shard_buckets):
+    model = SCAN(3, 2)
+    e_pairs = model.get_pairs(synthetic_store)
+    p_pairs, p_communities, p_labels = sharded.get_groups(model, loader, len(synthetic_store), time_span, 0.5,
+                                                          shard_buckets=shard_buckets, processes=2)
+    assert p_pairs == e_pairs
+    assert len(p_communities) > 0
+    expected = scan.get_communities(e_pairs, 3, 0.5)
+    hubs, outliers = scan.SCAN(nx.Graph(p_pairs), 0.5, 3).get_hubs_outliers(p_communities)
+    assert scan_summary(p_pairs, 3, 0.5, p_communities, hubs, outliers) == scan_summary(e_pairs, 3, 0.5, *expected)
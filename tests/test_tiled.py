@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import settings
+from baselines.ES_ECMC import ECMC
+from baselines.LCS_SCAN import SCAN
+from baselines.tiled import SerialRunner, TileDriver
+
+TILES = [(1, 1), (3, 2), (8, 8)]
+
+
+def candidate_codes(indptr, indices):
+    n = len(indptr) - 1
+    return np.repeat(np.arange(n), np.diff(indptr)) * n + indices
+
+
+def ecmc():
+    return ECMC(3, 4, settings.dist_error, settings.time_error)
+
+
+@pytest.mark.parametrize("tiles", TILES)
+def test_no_halo_matches_rtree(synthetic_store, tmp_path, tiles):
+    indptr, indices = [array.copy() for array in synthetic_store.intersections()]
+    expected = ecmc().get_scores(synthetic_store)
+    e_pairs, e_groups, e_labels = ecmc().get_groups(synthetic_store)
+    driver = TileDriver(ecmc(), str(tmp_path), tiles, halo=0, runner=SerialRunner())
+    scores = driver.get_scores(synthetic_store)
+    # 不扩张 MBR 时, 分块得到的候选与 R-tree 自连接相同
+    assert np.array_equal(synthetic_store.indptr, indptr) and np.array_equal(synthetic_store.indices, indices)
+    assert np.array_equal(scores.values, expected.values)
+    p_pairs, p_groups, p_labels = ecmc().get_groups(synthetic_store, scores)
+    assert [[trj.id for trj in group] for group in p_groups] == [[trj.id for trj in group] for group in e_groups]
+    assert p_labels == e_labels
+
+
+@pytest.mark.parametrize("tiles", TILES[1:])
+def test_halo_is_tiling_invariant(synthetic_store, tmp_path, tiles):
+    rtree_codes = candidate_codes(*synthetic_store.intersections())
+    base = TileDriver(ecmc(), str(tmp_path / "base"), (1, 1), runner=SerialRunner())
+    b_pairs, b_groups, b_labels = base.get_groups(synthetic_store)
+    base_indices = synthetic_store.indices.copy()
+    driver = TileDriver(ecmc(), str(tmp_path / "tiles"), tiles, runner=SerialRunner())
+    p_pairs, p_groups, p_labels = driver.get_groups(synthetic_store)
+    assert np.array_equal(synthetic_store.indices, base_indices)
+    assert p_labels == b_labels
+    # 扩张后的候选包含 R-tree 的候选
+    assert np.isin(rtree_codes, candidate_codes(*synthetic_store.intersections())).all()
+
+
+def test_scan_pairs_match_rtree(synthetic_store, tmp_path):
+    e_pairs = SCAN(3, 4).get_pairs(synthetic_store)
+    p_pairs = TileDriver(SCAN(3, 4), str(tmp_path), (3, 2), halo=0, runner=SerialRunner()).get_groups(
+        synthetic_store, 0.5)[0]
+    assert len(e_pairs) > 0 and p_pairs == e_pairs
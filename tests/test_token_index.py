@@ -0,0 +1,42 @@
+from collections import Counter
+import numpy as np
+import pytest
+from indexing.token_index import token_overlaps
+
+
+def counter_overlaps(token, offsets, indptr, indices, active=None):
+    """原有实现: 每个候选轨迹对的 Counter 交集元素个数"""
+    counters = [Counter(token[offsets[i]:offsets[i + 1]].tolist()) for i in range(len(offsets) - 1)]
+    src = np.repeat(np.arange(len(offsets) - 1), np.diff(indptr))
+    expected = np.zeros(len(indices), dtype=np.int64)
+    for k, (a, b) in enumerate(zip(src.tolist(), indices.tolist())):
+        if a != b and (active is None or active[a] and active[b]):
+            expected[k] = sum((counters[a] & counters[b]).values())
+    return expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 64, 1 << 22])
+def test_random_tokens_match_counter(chunk_size):
+    rng = np.random.default_rng(0)
+    n = 40
+    sizes = rng.integers(0, 30, n)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    # token 取值范围小, 同一轨迹内重复出现的 token 很多
+    token = rng.integers(0, 12, offsets[-1])
+    adjacency = rng.random((n, n)) < 0.3
+    adjacency |= adjacency.T | np.eye(n, dtype=bool)
+    indptr = np.concatenate([[0], np.cumsum(adjacency.sum(axis=1))])
+    indices = np.nonzero(adjacency)[1]
+    active = rng.random(n) < 0.8
+    for mask in (None, active):
+        overlaps = token_overlaps(token, offsets, indptr, indices, mask, chunk_size=chunk_size)
+        assert np.array_equal(overlaps, counter_overlaps(token, offsets, indptr, indices, mask))
+
+
+def test_trajectory_tokens_match_counter(synthetic_store):
+    indptr, indices = synthetic_store.intersections()
+    token, offsets = synthetic_store.token, synthetic_store.offsets
+    active = synthetic_store.intersect_count >= 3
+    overlaps = token_overlaps(token, offsets, indptr, indices, active)
+    assert overlaps.max() > 0
+    assert np.array_equal(overlaps, counter_overlaps(token, offsets, indptr, indices, active))
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+def pair_counts(real_label, pred_label):
+    """
+    由 (真实标签, 预测标签) 列联表统计轨迹对数量, O(n); 标签 -1 表示未归组, 视为各自独立的单点组
+    :return: dict
+        hit: 真实与预测都在同一组 (标签不为 -1) 的轨迹对数
+        real_pairs: 真实在同一组的轨迹对数
+        pred_pairs: 预测在同一组的轨迹对数
+        total_pairs: 全部轨迹对数
+    """
+    real_label = np.asarray(real_label, dtype=np.int64)
+    pred_label = np.asarray(pred_label, dtype=np.int64)
+    grouped = (real_label != -1) & (pred_label != -1)
+    _, cell = np.unique(np.column_stack([real_label[grouped], pred_label[grouped]]), axis=0, return_counts=True)
+    _, real_size = np.unique(real_label[real_label != -1], return_counts=True)
+    _, pred_size = np.unique(pred_label[pred_label != -1], return_counts=True)
+    n = len(real_label)
+    return {"hit": comb2(cell), "real_pairs": comb2(real_size), "pred_pairs": comb2(pred_size),
+            "total_pairs": n * (n - 1) // 2}
+
+
+def comb2(sizes):
+    """sum C(size, 2), 以 Python int 计算避免溢出"""
+    return sum(int(size) * (int(size) - 1) // 2 for size in sizes)
+
+
+def recall(real_label, pred_label):
+    """真实在同一组的轨迹对中, 预测也在同一组的比例; 与逐对统计的结果完全一致"""
+    counts = pair_counts(real_label, pred_label)
+    if counts["real_pairs"] == 0:
+        return 0
+    return counts["hit"] / counts["real_pairs"]
+
+
+def evaluate(real_label, pred_label):
+    """
+    一次统计同时给出轨迹对的 recall, precision, F1 与调整兰德指数 (ARI)
+    :return: dict
+    """
+    counts = pair_counts(real_label, pred_label)
+    hit, real_pairs, pred_pairs, total_pairs = \
+        counts["hit"], counts["real_pairs"], counts["pred_pairs"], counts["total_pairs"]
+    r = hit / real_pairs if real_pairs else 0
+    p = hit / pred_pairs if pred_pairs else 0
+    f1 = 2 * p * r / (p + r) if p + r else 0
+    expected = real_pairs * pred_pairs / total_pairs if total_pairs else 0
+    maximum = (real_pairs + pred_pairs) / 2
+    ari = (hit - expected) / (maximum - expected) if maximum != expected else 1.0
+    return {"recall": r, "precision": p, "f1": f1, "ari": ari}
@@ -0,0 +1,34 @@
+class PairCache:
+    """
+    轨迹对验证结果的对称缓存, LCS 与 token 重合数都与顺序无关,
+    (i, j) 与 (j, i) 共用以 min(i, j) * n + max(i, j) 编码的整数键, 每个无序对只计算一次
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.results = {}
+
+    def key(self, i, j):
+        if i > j:
+            i, j = j, i
+        return i * self.n + j
+
+    def __contains__(self, pair):
+        return self.key(*pair) in self.results
+
+    def __len__(self):
+        return len(self.results)
+
+    def get(self, i, j, default=None):
+        return self.results.get(self.key(i, j), default)
+
+    def put(self, i, j, value):
+        self.results[self.key(i, j)] = value
+
+    def update(self, i, js, values):
+        for j, value in zip(js, values):
+            self.results[self.key(i, j)] = value
+
+    def missing(self, i, js):
+        """js 中与 i 尚未验证过的轨迹 id"""
+        return [j for j in js if self.key(i, j) not in self.results]
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+class PairScores:
+    """
+    候选轨迹对的原始得分 (ECMC 为 LCS 长度, SCAN 为 token 重合数), 与计算时的相交序列 CSR 对齐, 只计算一次;
+    参数扫描中的每个阈值都由筛选这些得分得到, 无需重新计算
+    只对两端 intersect_count 都不小于 min_group_trj_nums 的轨迹对计分, 可回答不小于该值的任意 min_group_trj_nums
+    """
+
+    def __init__(self, indptr, indices, values, min_group_trj_nums, intersect_key=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.values = values
+        self.min_group_trj_nums = min_group_trj_nums
+        self.intersect_key = intersect_key
+        self.src = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+    def check(self, trjs, min_group_trj_nums):
+        if trjs.intersect_key != self.intersect_key or len(trjs) != len(self.indptr) - 1:
+            raise ValueError("pair scores were computed on other candidate pairs")
+        if min_group_trj_nums < self.min_group_trj_nums:
+            raise ValueError("pair scores only cover min_group_trj_nums >= {}".format(self.min_group_trj_nums))
+
+    def replay(self, active, passed, min_group_trj_nums):
+        """
+        按原有的逐条轨迹规则回放: 跳过自身及 active 为 False 的轨迹, passed 的轨迹对为有效轨迹对,
+        有效轨迹对不少于 min_group_trj_nums 的原点轨迹才保留
+        :param active: (n,) bool
+        :param passed: 与 indices 对齐的 bool, 该轨迹对的得分是否达到阈值
+        :return: src, dst, 保留的有向轨迹对, 按原点轨迹 id 和相交序列的顺序排列
+        """
+        src, dst = self.src, self.indices
+        valid = active[src] & active[dst] & (src != dst) & passed
+        count = np.bincount(src[valid], minlength=len(active))
+        valid &= count[src] >= min_group_trj_nums
+        return src[valid], dst[valid]
+
+
+def mirror_upper(src, indices, values, upper, lower, n):
+    """
+    无序对只在 src < dst 的一侧计算, 有向的 (b, a) 取 (a, b) 的结果
+    :param upper: 已计算的 src < dst 的位置, 升序; lower 为需要填充的 src > dst 的位置, 其对称位置必须在 upper 中
+    :param n: 轨迹数
+    """
+    codes = src[upper] * n + indices[upper]
+    values[lower] = values[upper[np.searchsorted(codes, indices[lower] * n + src[lower])]]
+    return values
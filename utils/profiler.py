@@ -0,0 +1,101 @@
+import sys
+import time
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块, 不记录峰值内存
+    resource = None
+
+
+class Profiler:
+    """
+    记录每个阶段的耗时与调用次数, 以及各类计数, 结束时由 report 给出结果
+    计数只在循环外按批累加, 不在逐对的热路径上调用
+    """
+    enabled = True
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def count(self, name, k=1):
+        self.counters[name] = self.counters.get(name, 0) + int(k)
+
+    def merge(self, counters):
+        """合并其他进程中记录的计数"""
+        for name, k in counters.items():
+            self.count(name, k)
+
+    def report(self):
+        """
+        :return: dict
+            stages: 阶段名 -> {"time": 秒, "calls": 次数}
+            counters: 计数名 -> 数值
+            peak_rss: 进程 (含已结束的子进程) 的峰值常驻内存, 字节; 平台不支持时为 None
+        """
+        return {"stages": {name: dict(stage) for name, stage in self.stages.items()},
+                "counters": dict(self.counters), "peak_rss": peak_rss()}
+
+
+class NullProfiler:
+    """关闭时使用, 全部操作为空, 开销只有一次方法调用"""
+    enabled = False
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def count(self, name, k=1):
+        pass
+
+    def merge(self, counters):
+        pass
+
+    def report(self):
+        return None
+
+
+class _Stage:
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stage = self.profiler.stages.setdefault(self.name, {"time": 0.0, "calls": 0})
+        stage["time"] += time.perf_counter() - self.start
+        stage["calls"] += 1
+        return False
+
+
+class _NullStage:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+NULL_PROFILER = NullProfiler()
+
+
+def get_profiler(profile):
+    return Profiler() if profile else NULL_PROFILER
+
+
+def peak_rss():
+    if resource is None:
+        return None
+    # Linux 上 ru_maxrss 的单位为 KB, macOS 上为字节
+    scale = 1 if sys.platform == "darwin" else 1024
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return usage * scale
@@ -1,5 +1,5 @@
 import settings
-from indexing.dist import get_distance_hav
+from indexing.dist import get_distance_hav, get_distance_hav_array
 import numpy as np
 
 
@@ -66,3 +66,358 @@ class Trajectory:
                     record[i + 1][j + 1] = record[i][j + 1]
         return record[-1][-1]
 
+    def LCS_reach(self, trj, min_lifetime, dist_error, time_error):
+        """
+        判定模式的 LCS: 只回答 LCS_to(trj) >= min_lifetime, 结果与 LCS_to 一致
+        时间戳有序, 第 i 行可能匹配的列被 time_error 限定在一条时间带 [lo_i, hi_i) 内, 用二分查找得到,
+        只计算带内格子; 达到阈值或剩余行无法再达到阈值时立即返回
+        """
+        m = self.size
+        n = trj.size
+        if trj.time_seq[0]>self.time_seq[-min_lifetime] or self.time_seq[0]>trj.time_seq[-min_lifetime]:
+            return False
+        lo = np.searchsorted(trj.time_seq, self.time_seq - time_error, side='left')
+        hi = np.searchsorted(trj.time_seq, self.time_seq + time_error, side='right')
+        band = np.maximum(hi - lo, 0)
+        rows = np.repeat(np.arange(m), band)
+        cols = np.arange(band.sum()) - np.repeat(np.cumsum(band) - band, band) + np.repeat(lo, band)
+        match = get_distance_hav_array(self.lon_lat_seq[rows, 0], self.lon_lat_seq[rows, 1],
+                                       trj.lon_lat_seq[cols, 0], trj.lon_lat_seq[cols, 1]) <= dist_error
+        # 第 i 行之后仍含匹配格子的行数, 每行最多令 LCS 加 1
+        matched_rows = np.zeros(m, dtype=int)
+        np.add.at(matched_rows, rows[match], 1)
+        remain = np.cumsum((matched_rows > 0)[::-1])[::-1].tolist() + [0]
+        if remain[0] < min_lifetime:
+            return False
+        match = match.tolist()
+        lo, hi = lo.tolist(), hi.tolist()
+        record = [0] * (n + 1)
+        k = 0
+        for i in range(m):
+            if hi[i] <= lo[i]:
+                continue
+            last = record
+            record = last[:]
+            # 时间带左侧的格子与上一行相同, 带内按 LCS 递推, 带右侧为带内末值与上一行的较大值
+            for j in range(lo[i], hi[i]):
+                if match[k]:
+                    record[j + 1] = last[j] + 1
+                elif record[j] > last[j + 1]:
+                    record[j + 1] = record[j]
+                k += 1
+            value = record[hi[i]]
+            for j in range(hi[i] + 1, n + 1):
+                if last[j] >= value:
+                    break
+                record[j] = value
+            if record[n] >= min_lifetime:
+                return True
+            if record[n] + remain[i + 1] < min_lifetime:
+                return False
+        return record[n] >= min_lifetime
+
+    def LCS_to_batch(self, trjs, min_lifetime, dist_error, time_error, decide=False, stats=None):
+        """
+        一次性计算该轨迹与一批轨迹的 LCS，结果与逐条调用 LCS_to 一致
+        :param trjs: a batch of candidate trajectories
+        :param decide: 判定模式, 只返回每个 LCS 是否 >= min_lifetime
+        :param stats: dict, 见 batch_LCS
+        :return: numpy int array, LCS length to each trajectory in trjs; numpy bool array in decide mode
+        """
+        return batch_LCS([self] * len(trjs), trjs, min_lifetime, dist_error, time_error, decide, stats=stats)
+
+
+class TrajectoryView:
+    """
+    TrajectoryStore 中一条轨迹的轻量视图, 只保存 store 与 id, 其余属性均映射到 store 的列式数组上,
+    与 Trajectory 的属性/方法保持一致
+    """
+    __slots__ = ('store', 'id')
+
+    __len__ = Trajectory.__len__
+    __str__ = Trajectory.__str__
+    LCS_to = Trajectory.LCS_to
+    LCS_reach = Trajectory.LCS_reach
+    LCS_to_batch = Trajectory.LCS_to_batch
+
+    def __init__(self, store, id):
+        self.store = store
+        self.id = id
+
+    @property
+    def lon_lat_seq(self):
+        return self.store.lon_lat[self.store.offsets[self.id]:self.store.offsets[self.id + 1]]
+
+    @property
+    def time_seq(self):
+        return self.store.time[self.store.offsets[self.id]:self.store.offsets[self.id + 1]]
+
+    @property
+    def token_seq(self):
+        return self.store.token[self.store.offsets[self.id]:self.store.offsets[self.id + 1]]
+
+    @token_seq.setter
+    def token_seq(self, token_seq):
+        self.token_seq[:] = token_seq
+
+    @property
+    def mbr(self):
+        return self.store.mbrs[self.id]
+
+    @property
+    def time_range(self):
+        return self.store.mbrs[self.id, 4:6]
+
+    @property
+    def size(self):
+        return int(self.store.offsets[self.id + 1] - self.store.offsets[self.id])
+
+    @property
+    def intersect_trjs(self):
+        # 相交序列 CSR 中本轨迹的一段, 只读视图
+        return self.store.indices[self.store.indptr[self.id]:self.store.indptr[self.id + 1]]
+
+    @property
+    def intersect_count(self):
+        return int(self.store.intersect_count[self.id])
+
+    @property
+    def candiate_match(self):
+        start, end = self.store.indptr[self.id], self.store.indptr[self.id + 1]
+        matched = self.store.indices[start:end][self.store.matched[start:end]]
+        if len(matched) == 0:
+            return []
+        return [self] + [self.store[i] for i in matched.tolist()]
+
+    @candiate_match.setter
+    def candiate_match(self, candiate_match):
+        # [trj, trj1, trj2, ...], 以本轨迹为原点, 记录为相交序列中对应位置的标记
+        start, end = self.store.indptr[self.id], self.store.indptr[self.id + 1]
+        self.store.matched[start:end] = np.isin(self.store.indices[start:end], [trj.id for trj in candiate_match[1:]])
+
+    @property
+    def cluster_id(self):
+        return int(self.store.cluster_id[self.id])
+
+    @cluster_id.setter
+    def cluster_id(self, cluster_id):
+        self.store.cluster_id[self.id] = cluster_id
+
+
+class TrajectoryStore:
+    """
+    列式 (structure-of-arrays) 轨迹集合, 替代 Trajectory 对象列表
+    lon_lat     (N, 2) 全部轨迹点首尾相接
+    time        (N,)   对应时间戳
+    token       (N,)   uint32 时空网格编号
+    offsets     (n+1,) 第 i 条轨迹的点为 [offsets[i], offsets[i+1])
+    mbrs        (n, 6) [min_lon, max_lon, min_lat, max_lat, start_time, end_time]
+    indptr      (n+1,) 与 indices (E,) 为 CSR 形式的相交序列, matched (E,) 标记以各轨迹为原点的有效轨迹对
+    store[i] 返回第 i 条轨迹的 TrajectoryView, 可直接替代 Trajectory 用于建索引与各 baseline
+    """
+
+    def __init__(self, lon_lat, time, offsets, token=None):
+        self.lon_lat = np.ascontiguousarray(lon_lat, dtype=float)
+        self.time = np.ascontiguousarray(time, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        if token is None:
+            token = np.zeros(len(self.time), dtype=np.uint32)
+        self.token = np.ascontiguousarray(token, dtype=np.uint32)
+        n = len(self.offsets) - 1
+        starts, ends = self.offsets[:-1], self.offsets[1:]
+        self.mbrs = np.empty((n, 6))
+        if n > 0:
+            self.mbrs[:, 0::2][:, :2] = np.minimum.reduceat(self.lon_lat, starts, axis=0)
+            self.mbrs[:, 1::2][:, :2] = np.maximum.reduceat(self.lon_lat, starts, axis=0)
+            self.mbrs[:, 4], self.mbrs[:, 5] = self.time[starts], self.time[ends - 1]
+        # 相交序列为 CSR 形式: 第 i 条轨迹的 intersect_trjs 为 indices[indptr[i]:indptr[i+1]]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.intersect_count = np.zeros(n, dtype=np.int64)
+        # 当前 intersect_trjs 的来源标识 (R-tree 或其他候选生成方式), 由调用方设置
+        self.intersect_key = None
+        # 与 indices 对齐: 以第 i 条轨迹为扩张原点时, 该位置的轨迹可以和它形成有效pair
+        self.matched = np.zeros(0, dtype=bool)
+        self.cluster_id = np.full(n, -1, dtype=np.int64)
+        self._views = [None] * n
+
+    @classmethod
+    def from_trajectories(cls, trjs):
+        offsets = np.concatenate([[0], np.cumsum([trj.size for trj in trjs])])
+        store = cls(np.concatenate([trj.lon_lat_seq for trj in trjs]),
+                    np.concatenate([trj.time_seq for trj in trjs]), offsets,
+                    np.concatenate([np.asarray(trj.token_seq, dtype=np.uint32) for trj in trjs]))
+        indptr = np.concatenate([[0], np.cumsum([len(trj.intersect_trjs) for trj in trjs])]).astype(np.int64)
+        store.set_intersections(indptr, [i for trj in trjs for i in trj.intersect_trjs])
+        return store
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """由 to_arrays 的结果还原, token 与相交序列若存在也一并还原"""
+        store = cls(arrays["lon_lat"], arrays["time"], arrays["offsets"], arrays.get("token"))
+        if "indptr" in arrays:
+            store.set_intersections(arrays["indptr"], arrays["indices"])
+        return store
+
+    def to_arrays(self):
+        """导出可落盘的数组: 轨迹点与 CSR 形式的相交序列"""
+        indptr, indices = self.intersections()
+        return {"lon_lat": self.lon_lat, "time": self.time, "offsets": self.offsets,
+                "indptr": indptr, "indices": indices}
+
+    def set_intersections(self, indptr, indices):
+        """以 CSR 形式 (indptr, indices) 设置每条轨迹的 intersect_trjs, 数组直接保存, 不展开为列表"""
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.intersect_count = np.diff(self.indptr)
+        self.matched = np.zeros(len(self.indices), dtype=bool)
+
+    def intersections(self):
+        return self.indptr, self.indices
+
+    def set_matches(self, src, dst):
+        """一次性记录有效轨迹对 (src[k], dst[k]) 的 candiate_match, 其余位置清空"""
+        n = len(self)
+        codes = np.repeat(np.arange(n), self.intersect_count) * n + self.indices
+        self.matched = np.isin(codes, np.asarray(src, dtype=np.int64) * n + np.asarray(dst, dtype=np.int64))
+
+    def reset(self):
+        """清空每次运行写入的可变字段 (candiate_match, cluster_id), 轨迹点/token/相交序列保持不变"""
+        self.matched[:] = False
+        self.cluster_id.fill(-1)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        # 视图按需创建并缓存, 保证同一条轨迹总是同一个对象 (ECMC 以对象判断成员关系)
+        if i < 0:
+            i += len(self)
+        view = self._views[i]
+        if view is None:
+            view = self._views[i] = TrajectoryView(self, i)
+        return view
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def sizes(self):
+        return np.diff(self.offsets)
+
+
+def pad_trajectories(trjs, length=settings.max_len):
+    """
+    将一批轨迹填充为等长数组, 填充位置的经纬度为 nan, 不会与任何点匹配
+    :return: lon_lat (B, length, 2), time (B, length), sizes (B,)
+    """
+    lon_lat = np.full((len(trjs), length, 2), np.nan)
+    times = np.zeros((len(trjs), length))
+    sizes = np.zeros(len(trjs), dtype=int)
+    for b, trj in enumerate(trjs):
+        lon_lat[b, :trj.size] = trj.lon_lat_seq
+        times[b, :trj.size] = trj.time_seq
+        sizes[b] = trj.size
+    return lon_lat, times, sizes
+
+
+def batch_LCS(trjs_a, trjs_b, min_lifetime, dist_error, time_error, decide=False, time_prune=True, stats=None):
+    """
+    批量计算轨迹对 (trjs_a[k], trjs_b[k]) 的 LCS 长度
+    1. 先按时间差筛出时间带内的格子, 只对这些格子计算球面距离, 得到匹配矩阵 (B, max_len, max_len)
+    2. 按反对角线 (i+j=d) 推进 DP, 同一条反对角线上的格子互不依赖, 对整批轨迹对同时更新
+    :param decide: 判定模式, 只回答 LCS >= min_lifetime, 见 _batch_reach
+    :param time_prune: False 时不做与 min_lifetime 相关的时间预判, 返回完整的 LCS 长度 (用于对任意阈值回放)
+    :param stats: dict, 给出时累加 lcs_time_pruned (时间预判排除), lcs_bound_pruned (判定模式下 DP 前由上界排除),
+                  lcs_early_exit (判定模式下 DP 未完成即判定) 的轨迹对数
+    :return: numpy int array (B,), 与 LCS_to 的返回值相同; 判定模式下返回 numpy bool array (B,)
+    """
+    B = len(trjs_a)
+    if B == 0:
+        return np.zeros(0, dtype=bool if decide else int)
+    length = max(max(trj.size for trj in trjs_a), max(trj.size for trj in trjs_b))
+    lon_lat_a, time_a, m = pad_trajectories(trjs_a, length)
+    lon_lat_b, time_b, n = pad_trajectories(trjs_b, length)
+    rows = np.arange(B)
+    # 与 LCS_to 相同的时间预判: 起止时间错开的轨迹对直接记为 0
+    pruned = time_pruned(time_a[:, 0], time_a[rows, np.maximum(m - min_lifetime, 0)],
+                         time_b[:, 0], time_b[rows, np.maximum(n - min_lifetime, 0)])
+    if not time_prune:
+        pruned[:] = False
+    if stats is not None:
+        stats["lcs_time_pruned"] = stats.get("lcs_time_pruned", 0) + int(pruned.sum())
+
+    match = np.abs(time_a[:, :, None] - time_b[:, None, :]) <= time_error
+    match[pruned] = False
+    if decide:
+        return _batch_reach(lon_lat_a, lon_lat_b, match, m, pruned, min_lifetime, dist_error, stats)
+    b, i, j = np.nonzero(match)
+    match[b, i, j] = get_distance_hav_array(lon_lat_a[b, i, 0], lon_lat_a[b, i, 1],
+                                            lon_lat_b[b, j, 0], lon_lat_b[b, j, 1]) <= dist_error
+
+    record = np.zeros((B, length + 1, length + 1), dtype=np.int16)
+    for d in range(2, max(m + n) + 1):
+        i, j = _diagonal(d, length)
+        diag = record[:, i - 1, j - 1] + 1
+        rest = np.maximum(record[:, i, j - 1], record[:, i - 1, j])
+        record[:, i, j] = np.where(match[:, i - 1, j - 1], diag, rest)
+    lcs = record[rows, m, n].astype(int)
+    lcs[pruned] = 0
+    return lcs
+
+
+def _batch_reach(lon_lat_a, lon_lat_b, match, m, pruned, min_lifetime, dist_error, stats=None):
+    """
+    batch_LCS 的判定模式, 与 LCS_reach 相同的带状判定, 对整批轨迹对同时进行:
+    1. 时间带内有格子的行数是 LCS 的上界, 不足阈值的轨迹对不计算距离; 含匹配格子的行数不足阈值的也不进入 DP
+    2. 逐行推进 DP, 只保存当前一行: 第 i 行为 c[j] = match[i, j] ? last[j-1] + 1 : last[j] 的前缀最大值
+    3. 每行之后, 末列达到阈值, 或末列加上剩余含匹配格子的行数仍不足阈值的轨迹对即已判定, 移出本批
+    :param match: (B, length, length) 时间带内的格子, 时间预判排除的轨迹对已全部置为 False
+    :return: numpy bool array (B,)
+    """
+    B, length = len(match), match.shape[1]
+    reach = np.zeros(B, dtype=bool)
+    live = np.flatnonzero(match.any(axis=2).sum(axis=1) >= min_lifetime)
+    match = match[live]
+    b, i, j = np.nonzero(match)
+    match[b, i, j] = get_distance_hav_array(lon_lat_a[live[b], i, 0], lon_lat_a[live[b], i, 1],
+                                            lon_lat_b[live[b], j, 0], lon_lat_b[live[b], j, 1]) <= dist_error
+    # remain[k, i]: 第 i 行及之后含匹配格子的行数, 每行最多令 LCS 加 1
+    remain = np.zeros((len(live), length + 1), dtype=np.int16)
+    remain[:, :-1] = np.cumsum(match.any(axis=2)[:, ::-1], axis=1)[:, ::-1]
+    candidates = np.flatnonzero(remain[:, 0] >= min_lifetime)
+    if stats is not None:
+        stats["lcs_bound_pruned"] = stats.get("lcs_bound_pruned", 0) + int((~pruned).sum()) - len(candidates)
+    early_exit = 0
+    record = np.zeros((len(candidates), length + 1), dtype=np.int16)
+    for i in range(length):
+        if len(candidates) == 0:
+            break
+        last = record
+        record = np.empty_like(last)
+        record[:, 0] = 0
+        record[:, 1:] = np.maximum.accumulate(np.where(match[candidates, i], last[:, :-1] + 1, last[:, 1:]), axis=1)
+        # 填充列不含匹配格子, 末列即第 n 列
+        value = record[:, -1]
+        done = value >= min_lifetime
+        reach[live[candidates[done]]] = True
+        undecided = ~done & (value + remain[candidates, i + 1] >= min_lifetime)
+        early_exit += int(np.count_nonzero(~undecided & (m[live[candidates]] > i + 1)))
+        candidates, record = candidates[undecided], record[undecided]
+    if stats is not None:
+        stats["lcs_early_exit"] = stats.get("lcs_early_exit", 0) + early_exit
+    return reach
+
+
+def time_pruned(start_a, tail_a, start_b, tail_b):
+    """
+    LCS_to 的时间预判: 一条轨迹的起点晚于另一条轨迹倒数第 min_lifetime 个点 (tail) 时, 该轨迹对记为 0
+    """
+    return (start_b > tail_a) | (start_a > tail_b)
+
+
+def _diagonal(d, length):
+    """DP 表中满足 i+j=d 的格子坐标 (1 <= i, j <= length)"""
+    i = np.arange(max(1, d - length), min(length, d - 1) + 1)
+    return i, d - i